@@ -10,6 +10,56 @@ class Settings(BaseSettings):
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_db: int = 0
+    redis_cluster: bool = False
+    redis_channel_shards: int = 64
+
+    affinity_nodes: list[str] = []
+    affinity_self: str = ""
+    affinity_mode: str = "hint"
+    affinity_vnodes: int = 128
+
+    ws_heartbeat_interval: float = 25.0
+    ws_heartbeat_timeout: float = 60.0
+    ws_outbound_queue_max: int = 256
+    ws_max_subscriptions: int = 50
+    ws_stats_interval: float = 5.0
+    ws_drain_on_sigterm: bool = True
+    ws_drain_timeout: float = 10.0
+    ws_drain_batch_size: int = 200
+    ws_drain_batch_interval: float = 0.5
+    ws_reconnect_backoff_min: float = 1.0
+    ws_reconnect_backoff_max: float = 30.0
+
+    event_loop_lag_interval: float = 0.5
+    watchdog_enabled: bool = True
+    blocking_threshold: float = 0.1
+    blocking_max_sites: int = 200
+
+    shop_directory_max_age: int = 30
+    shop_directory_ttl: float = 300.0
+
+    session_cache_max_bytes: int = 64 * 1024 * 1024
+    session_cache_ttl: float = 300.0
+    session_cache_tail: int = 200
+    session_cache_redis: bool = False
+
+    schema_auto_upgrade: bool = False
+    search_text_config: str = "english"
+
+    export_batch_size: int = 5000
+    export_yield_per: int = 1000
+    import_batch_size: int = 50000
+    import_max_errors: int = 1000
+
+    analytics_flush_interval: float = 10.0
+
+    queue_rate_window: float = 900.0
+    queue_eta_min_samples: int = 3
+    queue_notify_interval: float = 1.0
+    queue_reconcile_interval: float = 300.0
+
+    message_dedup_ttl: float = 600.0
+    message_dedup_max_entries: int = 100000
 
     cors_origins: list[str] = [
         "http://localhost:5173",
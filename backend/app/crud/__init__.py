@@ -5,3 +5,4 @@ from app.crud.shop import *
 from app.crud.team import *
 from app.crud.customer import *
 from app.crud.chat import *
+from app.crud.analytics import *
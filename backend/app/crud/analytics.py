@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import DateTime, func
+from sqlalchemy.orm import Session
+
+from app import models
+from app.models.analytics import AGENT_METRICS, SHOP_METRICS
+
+AVERAGES = (
+    ("avg_queue_wait_seconds", "queue_wait_seconds", "sessions_assigned"),
+    ("avg_first_response_seconds", "first_response_seconds", "first_responses"),
+    ("avg_handle_seconds", "handle_seconds", "sessions_handled"),
+    ("abandonment_rate", "sessions_abandoned", "sessions_closed"),
+)
+
+
+def _bucket(db: Session, column, granularity: str):
+    """``column`` truncated to ``granularity``; day buckets are UTC days."""
+    if granularity != "day":
+        return column
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc("day", column, "UTC")
+    return func.datetime(column, "start of day", type_=DateTime(timezone=True))
+
+
+def _with_averages(totals: dict) -> dict:
+    for name, numerator, denominator in AVERAGES:
+        if denominator in totals:
+            count = totals[denominator]
+            totals[name] = totals.get(numerator, 0) / count if count else None
+    return totals
+
+
+def _series(db: Session, Stats, metrics, granularity: str, *criteria) -> List[dict]:
+    """One row per bucket, summed by the database."""
+    bucket = _bucket(db, Stats.bucket, granularity).label("bucket")
+    rows = (
+        db.query(bucket, *(func.sum(getattr(Stats, metric)).label(metric) for metric in metrics))
+        .filter(*criteria)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    results = []
+    for row in rows:
+        start = row.bucket if row.bucket.tzinfo else row.bucket.replace(tzinfo=timezone.utc)
+        results.append(_with_averages({"bucket": start, **{m: getattr(row, m) or 0 for m in metrics}}))
+    return results
+
+
+def get_shop_analytics(
+    db: Session,
+    shop_ids: Optional[List[int]],
+    date_from: datetime,
+    date_to: datetime,
+    granularity: str = "hour",
+) -> List[dict]:
+    """Rollup series for ``shop_ids`` (all shops if None), summed across shops."""
+    Stats = models.ShopHourlyStats
+    criteria = [Stats.bucket >= date_from, Stats.bucket < date_to]
+    if shop_ids is not None:
+        criteria.append(Stats.shop_id.in_(shop_ids))
+    return _series(db, Stats, SHOP_METRICS, granularity, *criteria)
+
+
+def get_agent_analytics(
+    db: Session,
+    employee_id: int,
+    date_from: datetime,
+    date_to: datetime,
+    granularity: str = "hour",
+) -> List[dict]:
+    Stats = models.AgentHourlyStats
+    return _series(
+        db, Stats, AGENT_METRICS, granularity,
+        Stats.employee_id == employee_id, Stats.bucket >= date_from, Stats.bucket < date_to,
+    )
+
+
+def get_agent_leaderboard(
+    db: Session, shop_ids: Optional[List[int]], date_from: datetime, date_to: datetime
+) -> List[dict]:
+    """Per-agent totals over the range, busiest first."""
+    Stats = models.AgentHourlyStats
+    query = (
+        db.query(
+            Stats.employee_id,
+            *(func.sum(getattr(Stats, metric)).label(metric) for metric in AGENT_METRICS),
+        )
+        .filter(Stats.bucket >= date_from, Stats.bucket < date_to)
+        .group_by(Stats.employee_id)
+    )
+    if shop_ids is not None:
+        query = query.filter(Stats.shop_id.in_(shop_ids))
+    results = [
+        _with_averages({"employee_id": row.employee_id, **{m: getattr(row, m) or 0 for m in AGENT_METRICS}})
+        for row in query
+    ]
+    return sorted(results, key=lambda r: (-r["sessions_handled"], -r["messages"], r["employee_id"]))
+
+
+def get_queue_snapshot(db: Session, shop_ids: Optional[List[int]]) -> dict:
+    Session_ = models.ChatSession
+    query = db.query(
+        func.count(Session_.id), func.min(Session_.created_at)
+    ).filter(Session_.status == "waiting")
+    if shop_ids is not None:
+        query = query.filter(Session_.shop_id.in_(shop_ids))
+    waiting, oldest = query.one()
+    now = datetime.now(timezone.utc)
+    if oldest is not None and oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    return {
+        "waiting": waiting,
+        "oldest_waiting_since": oldest,
+        "longest_wait_seconds": (now - oldest).total_seconds() if oldest else None,
+    }
@@ -1,8 +1,30 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from types import SimpleNamespace
+
+from sqlalchemy import and_, cast, func, literal, literal_column, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, REGCONFIG
+from sqlalchemy.orm import Query, Session, aliased
+from typing import Iterable, List, Optional, Tuple
 from datetime import datetime, timezone
 
 from app import models, schemas
+from app.config import settings
+from app.services.analytics import rollups
+from app.services.dedup import seen_messages
+from app.services.queue import waiting_queue
+from app.services.search import LIKE_ESCAPE, contains_pattern
+from app.services.session_cache import session_cache
+
+PREVIEW_LENGTH = 200
+SUMMARY_COLUMNS = (
+    models.ChatSession.last_message_at,
+    models.ChatSession.last_message_preview,
+    models.ChatSession.message_count,
+    models.ChatSession.customer_unread,
+    models.ChatSession.agent_unread,
+    models.ChatSession.first_response_at,
+)
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>,StopSel=</mark>,MaxWords=24,MinWords=8,MaxFragments=2"
 
 
 def create_chat_session(db: Session, customer_id: int, shop_id: int) -> models.ChatSession:
@@ -10,6 +32,8 @@ def create_chat_session(db: Session, customer_id: int, shop_id: int) -> models.C
     db.add(db_session)
     db.commit()
     db.refresh(db_session)
+    rollups.session_created(db_session)
+    waiting_queue.enqueue(shop_id, db_session.id)
     return db_session
 
 
@@ -32,16 +56,39 @@ def get_waiting_chat_sessions_by_shop(db: Session, shop_id: int) -> List[models.
     )
 
 
+def get_waiting_queue_entries(db: Session) -> List[Tuple[int, int]]:
+    """(shop_id, session_id) of every waiting session, for reconciling the
+    in-memory/Redis waiting queues."""
+    return (
+        db.query(models.ChatSession.shop_id, models.ChatSession.id)
+        .filter(models.ChatSession.status == "waiting")
+        .all()
+    )
+
+
 def assign_employee_to_session(
     db: Session, session_id: int, employee_id: int
 ) -> Optional[models.ChatSession]:
     db_session = get_chat_session(db, session_id)
     if not db_session:
         return None
+    was_waiting = db_session.status == "waiting"
+    # Sessions picked up before assigned_at existed have none; only a session
+    # leaving the queue gets one, so reassignments never count as a wait.
+    first_assignment = was_waiting and db_session.assigned_at is None
     db_session.employee_id = employee_id
     db_session.status = "active"
+    if first_assignment:
+        db_session.assigned_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(db_session)
+    session_cache.patch(
+        session_id, employee_id=employee_id, status="active", assigned_at=db_session.assigned_at
+    )
+    if first_assignment:
+        rollups.session_assigned(db_session)
+    if was_waiting:
+        waiting_queue.dequeue(db_session.shop_id, session_id, served=True)
     return db_session
 
 
@@ -53,13 +100,109 @@ def create_chat_message(
         employee_id=employee_id,
         message=message.message,
         is_from_customer=message.is_from_customer,
+        client_msg_id=message.client_msg_id,
     )
     db.add(db_message)
+
+    # Same transaction as the insert; the increments are evaluated under the
+    # row lock, so concurrent senders never lose a count. now() is the
+    # transaction timestamp, i.e. the message's own created_at.
+    ChatSession = models.ChatSession
+    values = {
+        ChatSession.last_message_at: func.now(),
+        ChatSession.last_message_preview: message.message[:PREVIEW_LENGTH],
+        ChatSession.message_count: ChatSession.message_count + 1,
+    }
+    first_response = False
+    if message.is_from_customer:
+        values[ChatSession.agent_unread] = ChatSession.agent_unread + 1
+    else:
+        values[ChatSession.customer_unread] = ChatSession.customer_unread + 1
+        # Separate statement so we learn whether this message was the first
+        # reply, which analytics counts exactly once.
+        first_response = db.execute(
+            update(ChatSession)
+            .where(ChatSession.id == message.session_id, ChatSession.first_response_at.is_(None))
+            .values(first_response_at=func.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+    summary = db.execute(
+        update(ChatSession)
+        .where(ChatSession.id == message.session_id)
+        .values(values)
+        .returning(ChatSession.shop_id, ChatSession.created_at, *SUMMARY_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).first()
     db.commit()
     db.refresh(db_message)
+    if summary:
+        fields = summary._asdict()
+        shop_id, created_at = fields.pop("shop_id"), fields.pop("created_at")
+        session_cache.append_message(db_message, **fields)
+        rollups.message_sent(
+            SimpleNamespace(shop_id=shop_id, created_at=created_at, **fields),
+            employee_id,
+            message.is_from_customer,
+            first_response,
+        )
+    else:
+        session_cache.append_message(db_message)
     return db_message
 
 
+def submit_chat_message(
+    db: Session, message: schemas.ChatMessageCreate, employee_id: Optional[int] = None
+) -> Tuple[int, Optional[models.ChatMessage]]:
+    """create_chat_message, idempotent on ``message.client_msg_id``.
+
+    Returns the stored message's id and the new message, or None in place of
+    the message if the id was already used in this session (a retry), in
+    which case nothing is written.
+    """
+    client_msg_id = message.client_msg_id
+    if not client_msg_id:
+        db_message = create_chat_message(db, message, employee_id)
+        return db_message.id, db_message
+
+    message_id = seen_messages.get(message.session_id, client_msg_id)
+    if message_id is not None:
+        return message_id, None
+    try:
+        db_message = create_chat_message(db, message, employee_id)
+    except IntegrityError:
+        # Lost a race with a concurrent retry, or the seen-set entry expired.
+        db.rollback()
+        message_id = (
+            db.query(models.ChatMessage.id)
+            .filter(
+                models.ChatMessage.session_id == message.session_id,
+                models.ChatMessage.client_msg_id == client_msg_id,
+            )
+            .scalar()
+        )
+        if message_id is None:
+            raise
+        seen_messages.add(message.session_id, client_msg_id, message_id)
+        return message_id, None
+    seen_messages.add(message.session_id, client_msg_id, db_message.id)
+    return db_message.id, db_message
+
+
+def mark_session_read(db: Session, session_id: int, by_customer: bool) -> bool:
+    """Reset the reader's unread counter; False if the session is unknown."""
+    column = models.ChatSession.customer_unread if by_customer else models.ChatSession.agent_unread
+    updated = (
+        db.query(models.ChatSession)
+        .filter(models.ChatSession.id == session_id, column != 0)
+        .update({column: 0}, synchronize_session=False)
+    )
+    db.commit()
+    if updated:
+        session_cache.patch(session_id, **{column.key: 0})
+        return True
+    return db.query(models.ChatSession.id).filter(models.ChatSession.id == session_id).first() is not None
+
+
 def get_session_messages(db: Session, session_id: int) -> List[models.ChatMessage]:
     return (
         db.query(models.ChatMessage)
@@ -73,8 +216,181 @@ def close_chat_session(db: Session, session_id: int) -> Optional[models.ChatSess
     db_session = get_chat_session(db, session_id)
     if not db_session:
         return None
+    was_waiting = db_session.status == "waiting"
+    was_open = db_session.status != "closed"
     db_session.status = "closed"
     db_session.closed_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(db_session)
+    session_cache.patch(session_id, status="closed", closed_at=db_session.closed_at)
+    if was_open:
+        rollups.session_closed(db_session)
+    if was_waiting:
+        waiting_queue.dequeue(db_session.shop_id, session_id, served=False)
     return db_session
+
+
+def export_chat_messages_query(
+    db: Session,
+    after_id: Optional[int],
+    limit: int,
+    shop_ids: Optional[Iterable[int]] = None,
+    session_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> Query:
+    """One batch of transcript rows in message id order, for app.services.export."""
+    Message, ChatSession = models.ChatMessage, models.ChatSession
+    query = (
+        db.query(
+            Message.id.label("message_id"),
+            Message.session_id,
+            ChatSession.shop_id,
+            ChatSession.customer_id,
+            models.Customer.email.label("customer_email"),
+            Message.employee_id,
+            Message.is_from_customer,
+            Message.created_at,
+            Message.message,
+        )
+        .join(ChatSession, ChatSession.id == Message.session_id)
+        .join(models.Customer, models.Customer.id == ChatSession.customer_id)
+    )
+    if shop_ids is not None:
+        query = query.filter(ChatSession.shop_id.in_(list(shop_ids)))
+    if session_id is not None:
+        query = query.filter(Message.session_id == session_id)
+    if date_from:
+        query = query.filter(Message.created_at >= date_from)
+    if date_to:
+        query = query.filter(Message.created_at < date_to)
+    if after_id is not None:
+        query = query.filter(Message.id > after_id)
+    return query.order_by(Message.id).limit(limit)
+
+
+def _plain_snippet(message: str, query: str, width: int = 60) -> str:
+    position = message.lower().find(query.lower())
+    if position < 0:
+        return message[: width * 2]
+    start = max(0, position - width)
+    end = position + len(query) + width
+    return (
+        ("..." if start else "")
+        + message[start:position]
+        + "<mark>" + message[position:position + len(query)] + "</mark>"
+        + message[position + len(query):end]
+        + ("..." if end < len(message) else "")
+    )
+
+
+def search_chat_messages(
+    db: Session,
+    query: str,
+    shop_ids: Optional[Iterable[int]] = None,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    sort: str = "relevance",
+    limit: int = 20,
+    after: Optional[dict] = None,
+) -> Tuple[List[dict], Optional[dict]]:
+    """Full-text search over chat messages.
+
+    Uses the ``search_vector`` GIN index on PostgreSQL (see
+    app.services.schema) with ``websearch_to_tsquery`` syntax; other
+    databases fall back to a case-insensitive substring match. Results are
+    ordered by rank or by recency and paginated by keyset: pass the returned
+    key as ``after`` to fetch the next page.
+    """
+    Message, ChatSession = models.ChatMessage, models.ChatSession
+    postgres = db.get_bind().dialect.name == "postgresql"
+
+    if postgres:
+        config = cast(settings.search_text_config, REGCONFIG)
+        tsquery = func.websearch_to_tsquery(config, query)
+        vector = literal_column("chat_messages.search_vector")
+        match = vector.op("@@")(tsquery)
+        # float8 so the rank round-trips exactly through the cursor.
+        rank = cast(func.ts_rank_cd(vector, tsquery), DOUBLE_PRECISION)
+    else:
+        match = Message.message.ilike(contains_pattern(query), escape=LIKE_ESCAPE)
+        rank = literal(0.0)
+
+    q = (
+        db.query(
+            Message.id,
+            Message.session_id,
+            Message.is_from_customer,
+            Message.created_at,
+            ChatSession.shop_id,
+            ChatSession.customer_id,
+            ChatSession.status,
+            rank.label("rank"),
+        )
+        .join(ChatSession, ChatSession.id == Message.session_id)
+        .filter(match)
+    )
+    if shop_ids is not None:
+        q = q.filter(ChatSession.shop_id.in_(list(shop_ids)))
+    if status:
+        q = q.filter(ChatSession.status == status)
+    if date_from:
+        q = q.filter(Message.created_at >= date_from)
+    if date_to:
+        q = q.filter(Message.created_at < date_to)
+
+    if sort == "recent":
+        if after:
+            # Read the anchor timestamp back from the row itself so the
+            # comparison never depends on how a driver round-trips datetimes.
+            anchor = aliased(Message)
+            after_at = db.query(anchor.created_at).filter(anchor.id == after["id"]).scalar_subquery()
+            q = q.filter(or_(
+                Message.created_at < after_at,
+                and_(Message.created_at == after_at, Message.id < after["id"]),
+            ))
+        q = q.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        if after:
+            q = q.filter(or_(rank < after["rank"], and_(rank == after["rank"], Message.id < after["id"])))
+        q = q.order_by(rank.desc(), Message.id.desc())
+
+    rows = q.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    ids = [row.id for row in rows]
+    snippets = {}
+    if ids:
+        if postgres:
+            headline = func.ts_headline(config, Message.message, tsquery, SEARCH_HEADLINE_OPTIONS)
+            snippets = dict(db.query(Message.id, headline).filter(Message.id.in_(ids)).all())
+        else:
+            snippets = {
+                message_id: _plain_snippet(message, query)
+                for message_id, message in db.query(Message.id, Message.message).filter(Message.id.in_(ids))
+            }
+
+    results = [
+        {
+            "message_id": row.id,
+            "session_id": row.session_id,
+            "shop_id": row.shop_id,
+            "customer_id": row.customer_id,
+            "status": row.status,
+            "is_from_customer": row.is_from_customer,
+            "created_at": row.created_at,
+            "rank": float(row.rank or 0.0),
+            "snippet": snippets.get(row.id, ""),
+        }
+        for row in rows
+    ]
+    next_key = None
+    if has_more and rows:
+        last = rows[-1]
+        if sort == "recent":
+            next_key = {"id": last.id}
+        else:
+            next_key = {"rank": float(last.rank or 0.0), "id": last.id}
+    return results, next_key
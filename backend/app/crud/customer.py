@@ -1,7 +1,17 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+import csv
+import io
+
+from sqlalchemy import func, insert, or_, text, update
+from sqlalchemy.orm import Query, Session
+from typing import List, Optional, Sequence, Tuple
 
 from app import models, schemas
+from app.services.search import LIKE_ESCAPE, contains_pattern, prefix_pattern
+from app.services.session_cache import session_cache
+
+# Below this length a trigram index cannot narrow a substring match, so
+# autocomplete sticks to prefixes.
+TRIGRAM_MIN_LENGTH = 3
 
 
 def create_customer(db: Session, customer: schemas.CustomerCreate) -> models.Customer:
@@ -20,8 +30,142 @@ def get_customer_by_email(db: Session, email: str) -> Optional[models.Customer]:
     return db.query(models.Customer).filter(models.Customer.email == email).first()
 
 
-def get_customers(db: Session, skip: int = 0, limit: int = 100) -> List[models.Customer]:
-    return db.query(models.Customer).offset(skip).limit(limit).all()
+def _matching(query, q: Optional[str]):
+    if not q:
+        return query
+    pattern = contains_pattern(q)
+    return query.filter(or_(
+        models.Customer.name.ilike(pattern, escape=LIKE_ESCAPE),
+        models.Customer.email.ilike(pattern, escape=LIKE_ESCAPE),
+    ))
+
+
+def get_customers(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    q: Optional[str] = None,
+    after_id: Optional[int] = None,
+) -> List[models.Customer]:
+    query = _matching(db.query(models.Customer), q).order_by(models.Customer.id)
+    if after_id is not None:
+        return query.filter(models.Customer.id > after_id).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+
+
+def export_customers_query(
+    db: Session, after_id: Optional[int], limit: int, q: Optional[str] = None
+) -> Query:
+    """One batch of customer rows in id order, for app.services.export."""
+    Customer = models.Customer
+    query = _matching(db.query(Customer.id, Customer.name, Customer.email, Customer.created_at), q)
+    if after_id is not None:
+        query = query.filter(Customer.id > after_id)
+    return query.order_by(Customer.id).limit(limit)
+
+
+def autocomplete_customers(db: Session, q: str, limit: int = 10) -> list:
+    """Customers whose name or email starts with ``q``, then (for longer
+    input) those containing it.
+
+    Selects only the summary columns and relies on the prefix and trigram
+    indexes from app.services.schema, so each branch is a short index scan.
+    """
+    Customer = models.Customer
+    columns = (Customer.id, Customer.name, Customer.email)
+    q = q.strip()
+    prefix = prefix_pattern(q.lower())
+    rows = (
+        db.query(*columns)
+        .filter(or_(
+            func.lower(Customer.name).like(prefix, escape=LIKE_ESCAPE),
+            func.lower(Customer.email).like(prefix, escape=LIKE_ESCAPE),
+        ))
+        .order_by(func.lower(Customer.name), Customer.id)
+        .limit(limit)
+        .all()
+    )
+    if len(rows) < limit and len(q) >= TRIGRAM_MIN_LENGTH:
+        rows += (
+            _matching(db.query(*columns), q)
+            .filter(Customer.id.notin_([row.id for row in rows]))
+            .order_by(Customer.id)
+            .limit(limit - len(rows))
+            .all()
+        )
+    return rows
+
+
+def merge_customers(
+    db: Session, rows: Sequence[Tuple[int, str, str]], update_existing: bool = True
+) -> Tuple[int, List[int]]:
+    """Insert (line, name, email) rows, matching existing customers by email.
+
+    Existing customers get the imported name when ``update_existing`` is set.
+    Within ``rows`` the last occurrence of an email wins. Commits; returns the
+    number inserted and the ids whose name changed.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return _merge_customers_copy(db, rows, update_existing)
+
+    latest = {email: name for _, name, email in rows}
+    existing = {}
+    emails = list(latest)
+    for start in range(0, len(emails), 500):
+        existing.update(
+            (email, (customer_id, name))
+            for customer_id, name, email in db.query(
+                models.Customer.id, models.Customer.name, models.Customer.email
+            ).filter(models.Customer.email.in_(emails[start:start + 500]))
+        )
+    new = [{"name": name, "email": email} for email, name in latest.items() if email not in existing]
+    changed = []
+    if update_existing:
+        changed = [
+            {"id": existing[email][0], "name": name}
+            for email, name in latest.items()
+            if email in existing and existing[email][1] != name
+        ]
+    if new:
+        db.execute(insert(models.Customer), new)
+    if changed:
+        db.execute(update(models.Customer), changed)
+    db.commit()
+    return len(new), [row["id"] for row in changed]
+
+
+def _merge_customers_copy(
+    db: Session, rows: Sequence[Tuple[int, str, str]], update_existing: bool
+) -> Tuple[int, List[int]]:
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS customer_import "
+        "(line integer, name varchar(100), email varchar(100)) ON COMMIT DELETE ROWS"
+    ))
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert("COPY customer_import (line, name, email) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+
+    if update_existing:
+        conflict = (
+            "DO UPDATE SET name = EXCLUDED.name "
+            "WHERE customers.name IS DISTINCT FROM EXCLUDED.name"
+        )
+    else:
+        conflict = "DO NOTHING"
+    # xmax is 0 only on freshly inserted row versions.
+    merged = db.execute(text(
+        "INSERT INTO customers (name, email) "
+        "SELECT DISTINCT ON (email) name, email FROM customer_import ORDER BY email, line DESC "
+        f"ON CONFLICT (email) {conflict} "
+        "RETURNING id, (xmax = 0) AS inserted"
+    )).all()
+    db.commit()
+    return sum(1 for row in merged if row.inserted), [row.id for row in merged if not row.inserted]
 
 
 def update_customer(
@@ -34,6 +178,7 @@ def update_customer(
         setattr(db_customer, field, value)
     db.commit()
     db.refresh(db_customer)
+    session_cache.invalidate_customer(customer_id)
     return db_customer
 
 
@@ -42,4 +187,5 @@ def delete_customer(db: Session, customer_id: int) -> Optional[models.Customer]:
     if db_customer:
         db.delete(db_customer)
         db.commit()
+        session_cache.invalidate_customer(customer_id)
     return db_customer
@@ -1,4 +1,5 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 
 from app import models, schemas
@@ -36,14 +37,58 @@ def get_employee_by_username(db: Session, username: str) -> Optional[models.Empl
 
 
 def get_employees(
-    db: Session, skip: int = 0, limit: int = 100, shop_id: Optional[int] = None
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    shop_id: Optional[int] = None,
+    after_id: Optional[int] = None,
 ) -> List[models.Employee]:
-    query = db.query(models.Employee)
+    # Employee responses embed role -> permissions; load both up front so a page
+    # costs three queries instead of one per row.
+    query = db.query(models.Employee).options(
+        selectinload(models.Employee.role).selectinload(models.Role.permissions)
+    )
+    if shop_id:
+        query = query.filter(models.Employee.shop_id == shop_id)
+    query = query.order_by(models.Employee.id)
+    if after_id is not None:
+        return query.filter(models.Employee.id > after_id).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+
+
+def get_employee_summaries(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    shop_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+):
+    query = db.query(
+        models.Employee.id,
+        models.Employee.username,
+        models.Employee.email,
+        models.Employee.first_name,
+        models.Employee.last_name,
+        models.Employee.is_active,
+        models.Employee.shop_id,
+        models.Employee.role_id,
+        models.Role.name.label("role_name"),
+    ).join(models.Role, models.Role.id == models.Employee.role_id)
     if shop_id:
         query = query.filter(models.Employee.shop_id == shop_id)
+    query = query.order_by(models.Employee.id)
+    if after_id is not None:
+        return query.filter(models.Employee.id > after_id).limit(limit).all()
     return query.offset(skip).limit(limit).all()
 
 
+def count_employees(db: Session, shop_id: Optional[int] = None) -> int:
+    query = db.query(func.count(models.Employee.id))
+    if shop_id:
+        query = query.filter(models.Employee.shop_id == shop_id)
+    return query.scalar()
+
+
 def update_employee(
     db: Session, employee_id: int, employee: schemas.EmployeeUpdate
 ) -> Optional[models.Employee]:
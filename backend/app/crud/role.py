@@ -1,4 +1,5 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 
 from app import models, schemas
@@ -26,8 +27,21 @@ def get_role(db: Session, role_id: int) -> Optional[models.Role]:
     return db.query(models.Role).filter(models.Role.id == role_id).first()
 
 
-def get_roles(db: Session, skip: int = 0, limit: int = 100) -> List[models.Role]:
-    return db.query(models.Role).offset(skip).limit(limit).all()
+def get_roles(
+    db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None
+) -> List[models.Role]:
+    query = (
+        db.query(models.Role)
+        .options(selectinload(models.Role.permissions))
+        .order_by(models.Role.id)
+    )
+    if after_id is not None:
+        return query.filter(models.Role.id > after_id).limit(limit).all()
+    return query.offset(skip).limit(limit).all()
+
+
+def count_roles(db: Session) -> int:
+    return db.query(func.count(models.Role.id)).scalar()
 
 
 def update_role(
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from app import models, schemas
+from app.services.shop_directory import shop_directory
 
 
 def create_shop(db: Session, shop: schemas.ShopCreate) -> models.Shop:
@@ -9,6 +10,7 @@ def create_shop(db: Session, shop: schemas.ShopCreate) -> models.Shop:
     db.add(db_shop)
     db.commit()
     db.refresh(db_shop)
+    shop_directory.invalidate()
     return db_shop
 
 
@@ -16,8 +18,9 @@ def get_shop(db: Session, shop_id: int) -> Optional[models.Shop]:
     return db.query(models.Shop).filter(models.Shop.id == shop_id).first()
 
 
-def get_shops(db: Session, skip: int = 0, limit: int = 100) -> List[models.Shop]:
-    return db.query(models.Shop).offset(skip).limit(limit).all()
+def get_shops(db: Session, skip: int = 0, limit: Optional[int] = 100) -> List[models.Shop]:
+    """``limit=None`` returns every shop."""
+    return db.query(models.Shop).order_by(models.Shop.id).offset(skip).limit(limit).all()
 
 
 def update_shop(
@@ -30,6 +33,7 @@ def update_shop(
         setattr(db_shop, field, value)
     db.commit()
     db.refresh(db_shop)
+    shop_directory.invalidate()
     return db_shop
 
 
@@ -39,4 +43,5 @@ def delete_shop(db: Session, shop_id: int) -> bool:
         return False
     db.delete(db_shop)
     db.commit()
+    shop_directory.invalidate()
     return True
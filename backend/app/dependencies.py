@@ -38,6 +38,22 @@ def require_permission(resource: str, action: str):
     return PermissionChecker(resource, action)
 
 
+class RoleChecker:
+    def __init__(self, *role_names: str):
+        self.role_names = role_names
+
+    def __call__(self, current_employee: models.Employee = Depends(get_current_active_employee)):
+        if not current_employee.role or current_employee.role.name not in self.role_names:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Administrator access required",
+            )
+        return current_employee
+
+
+admin_only = RoleChecker("admin")
+
+
 # Pre-built permission checkers
 shop_read = PermissionChecker("shop", "read")
 shop_create = PermissionChecker("shop", "create")
@@ -69,6 +85,8 @@ customer_create = PermissionChecker("customer", "create")
 customer_update = PermissionChecker("customer", "update")
 customer_delete = PermissionChecker("customer", "delete")
 
+analytics_read = PermissionChecker("analytics", "read")
+
 permission_read = PermissionChecker("permission", "read")
 permission_create = PermissionChecker("permission", "create")
 permission_update = PermissionChecker("permission", "update")
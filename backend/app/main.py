@@ -1,26 +1,101 @@
+import asyncio
 import logging
+import signal
+import time
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+from app import crud
 from app.config import settings
-from app.database import engine, get_db
+from app.database import SessionLocal, engine, get_db
 from app.models import Base
+from app.services import metrics as app_metrics
+from app.services.analytics import rollups
+from app.services.cache import invalidation_bus
+from app.services.schema import upgrade_schema
+from app.services.serialization import FastJSONResponse
 from app.services.permissions import create_default_permissions, create_default_roles
-from app.routers import auth, shops, employees, teams, roles, chat, customers, permissions
+from app.services.queue import waiting_queue
+from app.services.shop_directory import shop_directory
+from app.services.watchdog import watchdog
+from app.routers import auth, shops, employees, teams, roles, chat, customers, permissions, metrics, admin, analytics
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(name)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def install_drain_on_sigterm(loop: asyncio.AbstractEventLoop):
+    """Drain WebSockets before the server's own SIGTERM handling, which
+    would otherwise close every socket at once."""
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        return
+
+    def _handle(signum, frame):
+        async def _drain_then_exit():
+            try:
+                await chat.manager.start_drain()
+            except Exception as exc:
+                logger.exception("WebSocket drain failed: %s", exc)
+            previous(signum, frame)
+
+        signal.signal(signal.SIGTERM, previous)
+        loop.call_soon_threadsafe(lambda: asyncio.ensure_future(_drain_then_exit()))
+
+    try:
+        signal.signal(signal.SIGTERM, _handle)
+    except ValueError:
+        # Not on the main thread (e.g. under a test client).
+        pass
+
+
+def _waiting_sessions():
+    with SessionLocal() as db:
+        return crud.get_waiting_queue_entries(db)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     Base.metadata.create_all(bind=engine)
+    if settings.schema_auto_upgrade:
+        upgrade_schema(engine)
     db = next(get_db())
     create_default_permissions(db)
     create_default_roles(db)
+    shop_directory.refresh(db)
     db.close()
+    waiting_queue.reconcile(_waiting_sessions)
+    invalidation_bus.start()
+    app_metrics.observe_pool(engine)
+    lag_monitor = None
+    if settings.watchdog_enabled:
+        watchdog.start()
+    else:
+        lag_monitor = asyncio.create_task(app_metrics.monitor_event_loop_lag(settings.event_loop_lag_interval))
+    heartbeat = asyncio.create_task(
+        chat.manager.run_heartbeat(settings.ws_heartbeat_interval, settings.ws_heartbeat_timeout)
+    )
+    shop_stats = asyncio.create_task(chat.manager.run_stats(settings.ws_stats_interval))
+    analytics_flusher = asyncio.create_task(rollups.run_flusher(settings.analytics_flush_interval))
+    queue_notifier = asyncio.create_task(waiting_queue.run_notifier(chat.manager, settings.queue_notify_interval))
+    queue_reconciler = asyncio.create_task(
+        waiting_queue.run_reconciler(_waiting_sessions, settings.queue_reconcile_interval)
+    )
+    if settings.ws_drain_on_sigterm:
+        install_drain_on_sigterm(asyncio.get_running_loop())
     yield
+    heartbeat.cancel()
+    if lag_monitor:
+        lag_monitor.cancel()
+    shop_stats.cancel()
+    queue_notifier.cancel()
+    queue_reconciler.cancel()
+    analytics_flusher.cancel()
+    await asyncio.gather(analytics_flusher, return_exceptions=True)  # final flush
+    watchdog.stop()
 
 
 app = FastAPI(
@@ -28,6 +103,7 @@ app = FastAPI(
     description="Customer support management platform with real-time chat and RBAC",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 app.add_middleware(
@@ -38,6 +114,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = app_metrics.route_label(request.scope)
+        app_metrics.http_request_duration.observe(
+            time.perf_counter() - start, request.method, route
+        )
+        app_metrics.http_requests.inc(request.method, route, str(status_code))
+
 app.include_router(auth.router)
 app.include_router(shops.router)
 app.include_router(employees.router)
@@ -46,8 +138,14 @@ app.include_router(roles.router)
 app.include_router(chat.router)
 app.include_router(customers.router)
 app.include_router(permissions.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
+app.include_router(analytics.router)
 
 
 @app.get("/health")
 async def health_check():
+    if chat.manager.draining:
+        # Tells load balancers to stop routing here while sockets move off.
+        return JSONResponse(status_code=503, content={"status": "draining"})
     return {"status": "healthy"}
@@ -7,6 +7,7 @@ from app.models.shop import Shop
 from app.models.team import Team
 from app.models.customer import Customer
 from app.models.chat import ChatSession, ChatMessage
+from app.models.analytics import ShopHourlyStats, AgentHourlyStats
 
 __all__ = [
     "Base",
@@ -20,4 +21,6 @@ __all__ = [
     "Customer",
     "ChatSession",
     "ChatMessage",
+    "ShopHourlyStats",
+    "AgentHourlyStats",
 ]
@@ -0,0 +1,66 @@
+from sqlalchemy import Column, Integer, DateTime, Float, Index
+
+from app.database import Base
+
+# Additive per-hour counters, maintained by app.services.analytics. Seconds
+# columns are sums: divide by the matching count for an average. No foreign
+# keys, so history survives deleted shops and employees.
+SHOP_METRICS = (
+    "sessions_created",
+    "sessions_assigned",
+    "queue_wait_seconds",
+    "sessions_closed",
+    "sessions_abandoned",
+    "first_responses",
+    "first_response_seconds",
+    "sessions_handled",
+    "handle_seconds",
+    "customer_messages",
+    "agent_messages",
+)
+AGENT_METRICS = (
+    "sessions_assigned",
+    "queue_wait_seconds",
+    "first_responses",
+    "first_response_seconds",
+    "sessions_handled",
+    "handle_seconds",
+    "messages",
+)
+
+
+class ShopHourlyStats(Base):
+    __tablename__ = "analytics_shop_hourly"
+
+    shop_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    sessions_created = Column(Integer, nullable=False, default=0)
+    sessions_assigned = Column(Integer, nullable=False, default=0)
+    queue_wait_seconds = Column(Float, nullable=False, default=0)
+    sessions_closed = Column(Integer, nullable=False, default=0)
+    sessions_abandoned = Column(Integer, nullable=False, default=0)
+    first_responses = Column(Integer, nullable=False, default=0)
+    first_response_seconds = Column(Float, nullable=False, default=0)
+    sessions_handled = Column(Integer, nullable=False, default=0)
+    handle_seconds = Column(Float, nullable=False, default=0)
+    customer_messages = Column(Integer, nullable=False, default=0)
+    agent_messages = Column(Integer, nullable=False, default=0)
+
+
+class AgentHourlyStats(Base):
+    __tablename__ = "analytics_agent_hourly"
+    __table_args__ = (
+        # Per-shop agent breakdowns scan one shop's buckets.
+        Index("ix_analytics_agent_hourly_shop_id_bucket", "shop_id", "bucket"),
+    )
+
+    employee_id = Column(Integer, primary_key=True)
+    shop_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    sessions_assigned = Column(Integer, nullable=False, default=0)
+    queue_wait_seconds = Column(Float, nullable=False, default=0)
+    first_responses = Column(Integer, nullable=False, default=0)
+    first_response_seconds = Column(Float, nullable=False, default=0)
+    sessions_handled = Column(Integer, nullable=False, default=0)
+    handle_seconds = Column(Float, nullable=False, default=0)
+    messages = Column(Integer, nullable=False, default=0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -7,6 +7,9 @@ from app.database import Base
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        Index("ix_chat_sessions_shop_id_last_message_at", "shop_id", "last_message_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
@@ -15,6 +18,16 @@ class ChatSession(Base):
     status = Column(String(20), default="waiting")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     closed_at = Column(DateTime(timezone=True), nullable=True)
+    assigned_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Transcript summary, maintained by crud.create_chat_message in the same
+    # transaction as each insert so lists never need to scan chat_messages.
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    last_message_preview = Column(String(200), nullable=True)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    customer_unread = Column(Integer, nullable=False, default=0, server_default="0")
+    agent_unread = Column(Integer, nullable=False, default=0, server_default="0")
+    first_response_at = Column(DateTime(timezone=True), nullable=True)
 
     customer = relationship("Customer", back_populates="chat_sessions")
     shop = relationship("Shop")
@@ -24,6 +37,10 @@ class ChatSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index("ix_chat_messages_session_id_created_at", "session_id", "created_at"),
+        Index("uq_chat_messages_session_id_client_msg_id", "session_id", "client_msg_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
@@ -31,6 +48,8 @@ class ChatMessage(Base):
     message = Column(Text, nullable=False)
     is_from_customer = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Optional sender-chosen id; a resend with the same id is not stored twice.
+    client_msg_id = Column(String(64), nullable=True)
 
     session = relationship("ChatSession", back_populates="messages")
     employee = relationship("Employee", back_populates="sent_messages")
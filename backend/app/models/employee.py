@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -7,6 +7,10 @@ from app.database import Base
 
 class Employee(Base):
     __tablename__ = "employees"
+    __table_args__ = (
+        # Covers shop-filtered keyset pages and counts with an index-only scan.
+        Index("ix_employees_shop_id_id", "shop_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, nullable=False, index=True)
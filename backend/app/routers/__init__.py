@@ -1 +1 @@
-from app.routers import auth, shops, employees, teams, roles, chat, customers, permissions
+from app.routers import auth, shops, employees, teams, roles, chat, customers, permissions, metrics, admin
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.database import get_db
+from app.dependencies import admin_only
+from app.routers.chat import manager
+from app.services.affinity import HashRing, affinity
+from app.services.watchdog import watchdog
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/blocking-calls", response_model=schemas.BlockingReport)
+def get_blocking_calls(limit: int = 50, _=Depends(admin_only)):
+    return {
+        "threshold": watchdog.threshold,
+        "interval": watchdog.interval,
+        "stalls": watchdog.stalls,
+        "sites": watchdog.report(limit=limit),
+    }
+
+
+@router.delete("/blocking-calls")
+def reset_blocking_calls(_=Depends(admin_only)):
+    watchdog.reset()
+    return {"message": "Blocking call statistics reset"}
+
+
+@router.post("/drain", status_code=202)
+async def drain_connections(_=Depends(admin_only)):
+    """Put this node into drain mode ahead of a deploy: /health starts
+    failing, new sockets are refused and open ones are moved off gradually."""
+    task = manager.start_drain()
+    return {
+        "draining": True,
+        "connections": len(manager.connections),
+        "done": task.done(),
+    }
+
+
+def _affinity_state(moved_shops=()):
+    return {
+        "mode": affinity.mode,
+        "self_url": affinity.self_url or "",
+        "enabled": affinity.enabled,
+        "nodes": affinity.ring.nodes,
+        "moved_shops": sorted(moved_shops),
+    }
+
+
+@router.get("/affinity", response_model=schemas.AffinityState)
+def get_affinity(_=Depends(admin_only)):
+    return _affinity_state()
+
+
+@router.put("/affinity", response_model=schemas.AffinityState)
+def update_affinity(
+    payload: schemas.AffinityNodes,
+    db: Session = Depends(get_db),
+    _=Depends(admin_only),
+):
+    """Replace ring membership on every node. Connected clients of shops that
+    moved are hinted towards their new owner."""
+    shop_ids = [shop.id for shop in crud.get_shops(db, limit=None)]
+    moved = affinity.ring.moved(HashRing(payload.nodes, affinity.vnodes), shop_ids)
+    affinity.set_nodes(payload.nodes)
+    return _affinity_state(moved)
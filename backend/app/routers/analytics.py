@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.database import get_db
+from app.dependencies import analytics_read
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+# Longest range per granularity, so a request stays a bounded number of buckets.
+MAX_RANGE = {"hour": timedelta(days=31), "day": timedelta(days=366)}
+
+
+def _shop_scope(employee: models.Employee, shop_id: Optional[int]) -> Optional[List[int]]:
+    if employee.role and employee.role.name in ("admin", "manager"):
+        return [shop_id] if shop_id is not None else None
+    if shop_id is not None and shop_id != employee.shop_id:
+        raise HTTPException(status_code=403, detail="Not allowed to read this shop's analytics")
+    return [employee.shop_id]
+
+
+def _as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    # Query strings without an offset are taken as UTC, like the buckets.
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def _date_range(date_from: Optional[datetime], date_to: Optional[datetime], granularity: str):
+    date_from, date_to = _as_utc(date_from), _as_utc(date_to)
+    date_to = date_to or datetime.now(timezone.utc)
+    date_from = date_from or date_to - (timedelta(days=1) if granularity == "hour" else timedelta(days=30))
+    if date_from >= date_to:
+        raise HTTPException(status_code=400, detail="date_from must be before date_to")
+    if date_to - date_from > MAX_RANGE[granularity]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too long for {granularity} buckets (max {MAX_RANGE[granularity].days} days)",
+        )
+    return date_from, date_to
+
+
+@router.get("/shops", response_model=List[schemas.ShopAnalyticsBucket])
+def shop_analytics(
+    shop_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    granularity: Literal["hour", "day"] = "hour",
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(analytics_read),
+):
+    shop_ids = _shop_scope(current_employee, shop_id)
+    date_from, date_to = _date_range(date_from, date_to, granularity)
+    return crud.get_shop_analytics(db, shop_ids, date_from, date_to, granularity)
+
+
+@router.get("/agents", response_model=List[schemas.AgentAnalyticsSummary])
+def agent_leaderboard(
+    shop_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(analytics_read),
+):
+    shop_ids = _shop_scope(current_employee, shop_id)
+    date_from, date_to = _date_range(date_from, date_to, "day")
+    return crud.get_agent_leaderboard(db, shop_ids, date_from, date_to)
+
+
+@router.get("/agents/{employee_id}", response_model=List[schemas.AgentAnalyticsBucket])
+def agent_analytics(
+    employee_id: int,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    granularity: Literal["hour", "day"] = "hour",
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(analytics_read),
+):
+    employee = crud.get_employee(db, employee_id)
+    if not employee:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    _shop_scope(current_employee, employee.shop_id)
+    date_from, date_to = _date_range(date_from, date_to, granularity)
+    return crud.get_agent_analytics(db, employee_id, date_from, date_to, granularity)
+
+
+@router.get("/queue", response_model=schemas.QueueSnapshot)
+def queue_snapshot(
+    shop_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(analytics_read),
+):
+    return crud.get_queue_snapshot(db, _shop_scope(current_employee, shop_id))
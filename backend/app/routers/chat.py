@@ -1,14 +1,23 @@
-import json
 import logging
-from typing import List
+from datetime import datetime
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 
 from app import schemas, crud, models
+from app.config import settings
 from app.database import get_db
-from app.dependencies import chat_read, chat_update
-from app.services.chat import ConnectionManager
+from app.dependencies import chat_create, chat_read, chat_update
+from app.services.chat import ConnectionManager, EventFilter
+from app.services import protocol
+from app.services.affinity import affinity
+from app.services.export import export_response
+from app.services.pagination import decode_cursor, encode_cursor
+from app.services.queue import waiting_queue
+from app.services.serialization import dumps_str
+from app.services.session_cache import session_cache
+from app.services.shop_directory import etag_matches, shop_directory
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -17,8 +26,32 @@ manager = ConnectionManager()
 
 
 @router.get("/shops/", response_model=List[schemas.Shop])
-def get_available_shops(db: Session = Depends(get_db)):
-    return crud.get_shops(db)
+def get_available_shops(if_none_match: Optional[str] = Header(default=None)):
+    body, etag = shop_directory.get()
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.shop_directory_max_age}, must-revalidate",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/protocol")
+def get_protocol():
+    return {
+        "default": protocol.PROTOCOL_JSON,
+        "available": protocol.available_protocols(),
+        "field_codes": protocol.FIELD_CODES,
+    }
+
+
+@router.get("/affinity")
+def get_affinity(shop_id: int):
+    """WebSocket base URL of the node that owns ``shop_id``, so clients can
+    connect there directly. ``node`` is null when affinity is disabled."""
+    owner = affinity.owner(shop_id)
+    return {"node": owner, "local": owner is None or owner == affinity.self_url, "mode": affinity.mode}
 
 
 @router.post("/sessions/", response_model=schemas.ChatSession)
@@ -51,11 +84,10 @@ async def create_chat_session(
             ),
         )
 
-    if customer_email in manager.customer_connections:
-        manager.session_connections[session.id] = manager.customer_connections[customer_email]
+    manager.bind_customer_sessions(customer_email, session.id)
 
     await manager.broadcast_to_shop_employees(
-        json.dumps({
+        dumps_str({
             "type": "new_session",
             "session_id": session.id,
             "customer_email": customer_email,
@@ -63,6 +95,8 @@ async def create_chat_session(
             "shop_name": shop.name,
         }),
         shop_id,
+        event_type="new_session",
+        session_id=session.id,
     )
     return session
 
@@ -98,10 +132,95 @@ def get_active_sessions(
             models.ChatSession.employee_id == current_employee.id,
             models.ChatSession.status == "active",
         )
+        .order_by(models.ChatSession.last_message_at.desc().nulls_last(), models.ChatSession.id.desc())
         .all()
     )
 
 
+def _readable_shop_ids(employee: models.Employee, shop_id: Optional[int], db: Session) -> Optional[List[int]]:
+    """Shops whose transcripts ``employee`` may read, narrowed to ``shop_id``
+    if given; None means every shop."""
+    if _get_employee_role_name(employee, db) in ("admin", "manager"):
+        return [shop_id] if shop_id is not None else None
+    if not employee.shop_id or (shop_id is not None and shop_id != employee.shop_id):
+        raise HTTPException(status_code=403, detail="Not allowed to read this shop's chats")
+    return [employee.shop_id]
+
+
+def _search_cursor(cursor: str, sort: str) -> dict:
+    try:
+        after = decode_cursor(cursor)
+        if not isinstance(after.get("id"), int):
+            raise ValueError(cursor)
+        if sort == "relevance":
+            after["rank"] = float(after["rank"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+@router.get("/search", response_model=schemas.ChatSearchPage)
+def search_messages(
+    q: str = Query(..., min_length=2, max_length=200),
+    shop_id: Optional[int] = None,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    sort: Literal["relevance", "recent"] = "relevance",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(chat_read),
+):
+    shop_ids = _readable_shop_ids(current_employee, shop_id, db)
+    results, next_key = crud.search_chat_messages(
+        db,
+        q,
+        shop_ids=shop_ids,
+        status=status,
+        date_from=date_from,
+        date_to=date_to,
+        sort=sort,
+        limit=limit,
+        after=_search_cursor(cursor, sort) if cursor else None,
+    )
+    return {"results": results, "next_cursor": encode_cursor(next_key) if next_key else None}
+
+
+@router.get("/export")
+def export_transcripts(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    session_id: Optional[int] = None,
+    shop_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(chat_read),
+):
+    shop_ids = _readable_shop_ids(current_employee, shop_id, db)
+    if session_id is not None:
+        session = crud.get_chat_session(db, session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        if shop_ids is not None and session.shop_id not in shop_ids:
+            raise HTTPException(status_code=403, detail="Not allowed to read this shop's chats")
+
+    filename = f"session-{session_id}" if session_id is not None else f"transcripts-{shop_id or 'all'}"
+    return export_response(
+        format,
+        filename,
+        lambda export_db, after_id, limit: crud.export_chat_messages_query(
+            export_db,
+            after_id,
+            limit,
+            shop_ids=shop_ids,
+            session_id=session_id,
+            date_from=date_from,
+            date_to=date_to,
+        ),
+    )
+
+
 @router.put("/sessions/{session_id}/assign")
 async def assign_session(
     session_id: int,
@@ -116,7 +235,7 @@ async def assign_session(
     customer_email = session.customer.email if session.customer else None
 
     await manager.send_to_session(
-        json.dumps({
+        dumps_str({
             "type": "agent_assigned",
             "message": "A support agent has been assigned to help you.",
             "agent_name": agent_name,
@@ -140,7 +259,7 @@ async def close_session(
     customer_email = session.customer.email if session.customer else None
 
     await manager.send_to_session(
-        json.dumps({
+        dumps_str({
             "type": "session_closed",
             "session_id": session_id,
             "message": "The support session has been ended. Thank you for contacting us!",
@@ -148,43 +267,174 @@ async def close_session(
         session_id,
         customer_email=customer_email,
     )
-    manager.session_connections.pop(session_id, None)
+    manager.unbind_session(session_id)
 
     await manager.broadcast_to_shop_employees(
-        json.dumps({
+        dumps_str({
             "type": "session_closed",
             "session_id": session_id,
             "customer_email": customer_email or "Unknown",
         }),
         session.shop_id,
+        event_type="session_closed",
+        session_id=session_id,
     )
     return {"message": "Session closed successfully"}
 
 
-@router.get("/sessions/{session_id}", response_model=schemas.ChatSession)
-def get_session(
+@router.put("/sessions/{session_id}/read")
+def mark_session_read(
     session_id: int,
     db: Session = Depends(get_db),
+    current_employee=Depends(chat_read),
 ):
+    if not crud.mark_session_read(db, session_id, by_customer=False):
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return {"message": "Session marked as read"}
+
+
+def _load_session(db: Session, session_id: int):
+    token = session_cache.fill_token()
     session = crud.get_chat_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found")
-    return session
+    return session_cache.fill(session, crud.get_session_messages(db, session_id), token)
+
+
+@router.get("/sessions/{session_id}", response_model=schemas.ChatSession)
+def get_session(
+    session_id: int,
+    db: Session = Depends(get_db),
+):
+    cached = session_cache.get(session_id)
+    if cached and cached.complete:
+        return {**cached.session, "messages": cached.messages}
+    session, messages = _load_session(db, session_id)
+    return {**session, "messages": messages}
 
 
 @router.get("/sessions/{session_id}/messages", response_model=List[schemas.ChatMessage])
 def get_session_messages(
     session_id: int,
+    limit: Optional[int] = None,
     db: Session = Depends(get_db),
 ):
-    session = crud.get_chat_session(db, session_id)
+    cached = session_cache.get(session_id)
+    if cached and (cached.complete or (limit and limit <= len(cached.messages))):
+        messages = cached.messages
+    else:
+        _, messages = _load_session(db, session_id)
+    return messages[-limit:] if limit else messages
+
+
+@router.get("/sessions/{session_id}/queue", response_model=schemas.QueuePosition)
+def get_queue_position(
+    session_id: int,
+    db: Session = Depends(get_db),
+):
+    cached = session_cache.get(session_id)
+    if cached:
+        status, shop_id = cached.session.get("status"), cached.session.get("shop_id")
+    else:
+        session = crud.get_chat_session(db, session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        status, shop_id = session.status, session.shop_id
+    position = waiting_queue.position(shop_id, session_id) if status == "waiting" else None
+    return {"session_id": session_id, "status": status, **(position or {})}
+
+
+def _valid_client_msg_id(client_msg_id) -> bool:
+    return client_msg_id is None or (isinstance(client_msg_id, str) and 0 < len(client_msg_id) <= 64)
+
+
+def _check_agent_can_send(db: Session, employee: models.Employee, session: Optional[models.ChatSession]):
+    """Raise unless ``employee`` may post in ``session``: it exists, belongs
+    to one of their shops and is not closed."""
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found")
-    return crud.get_session_messages(db, session_id)
+    shop_ids = _readable_shop_ids(employee, None, db)
+    if shop_ids is not None and session.shop_id not in shop_ids:
+        raise HTTPException(status_code=403, detail="Not allowed to post in this shop's chats")
+    if session.status == "closed":
+        raise HTTPException(status_code=409, detail="Chat session is closed")
+
+
+async def _send_agent_message(
+    db: Session,
+    employee: models.Employee,
+    session: models.ChatSession,
+    text: str,
+    client_msg_id: Optional[str] = None,
+    timestamp: Optional[str] = None,
+) -> dict:
+    """Store an agent's message and deliver it, unless ``client_msg_id``
+    marks it as a resend of one already stored. Returns the ack."""
+    message_id, db_message = crud.submit_chat_message(
+        db,
+        schemas.ChatMessageCreate(
+            session_id=session.id, message=text, is_from_customer=False, client_msg_id=client_msg_id
+        ),
+        employee_id=employee.id,
+    )
+    if db_message is not None:
+        payload = dumps_str({
+            "type": "message",
+            "id": message_id,
+            "client_msg_id": client_msg_id,
+            "session_id": session.id,
+            "message": text,
+            "from": "support",
+            "timestamp": timestamp,
+            "agent_name": f"{employee.first_name} {employee.last_name}".strip() or employee.username,
+        })
+        customer_email = session.customer.email if session.customer else None
+        await manager.send_to_session(payload, session.id, customer_email=customer_email)
+        await manager.send_to_session_staff(
+            payload, session.id, exclude_employee_id=employee.id, shop_id=session.shop_id
+        )
+    return {
+        "message_id": message_id,
+        "session_id": session.id,
+        "client_msg_id": client_msg_id,
+        "duplicate": db_message is None,
+    }
+
+
+@router.post("/sessions/{session_id}/messages", response_model=schemas.ChatMessageAck, status_code=201)
+async def send_message(
+    session_id: int,
+    body: schemas.ChatMessageSend,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(chat_create),
+):
+    """Send as the current agent. Retrying with the same ``client_msg_id``
+    returns the original message's ack (200) without sending it again."""
+    session = crud.get_chat_session(db, session_id)
+    _check_agent_can_send(db, current_employee, session)
+    ack = await _send_agent_message(db, current_employee, session, body.message, body.client_msg_id)
+    if ack["duplicate"]:
+        response.status_code = 200
+    return ack
+
+
+def _session_shop_id(session_id: int) -> Optional[int]:
+    cached = session_cache.get(session_id)
+    if cached:
+        return cached.session.get("shop_id")
+    db = next(get_db())
+    try:
+        session = crud.get_chat_session(db, session_id)
+        return session.shop_id if session else None
+    finally:
+        db.close()
 
 
 @router.websocket("/ws/employee/{employee_id}")
 async def ws_employee(websocket: WebSocket, employee_id: int):
+    if await manager.reject_if_draining(websocket):
+        return
     db = next(get_db())
     employee = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
     if not employee:
@@ -193,48 +443,93 @@ async def ws_employee(websocket: WebSocket, employee_id: int):
         return
 
     is_admin = (employee.role and employee.role.name in ("admin", "manager")) if employee else False
-    await manager.connect_employee(websocket, employee_id, employee.shop_id, is_admin=is_admin)
+    try:
+        event_filter = EventFilter.from_params(websocket.query_params) if is_admin else None
+    except ValueError as exc:
+        await websocket.close(code=1008, reason=f"Invalid filter: {exc}")
+        db.close()
+        return
+    await manager.connect_employee(
+        websocket, employee_id, employee.shop_id, is_admin=is_admin, event_filter=event_filter
+    )
     db.close()
+    # Admins and managers watch many shops, so they stay wherever they land.
+    if not is_admin and not await manager.apply_affinity(websocket, employee.shop_id):
+        return
     try:
         while True:
-            data = await websocket.receive_text()
-            msg = json.loads(data)
+            msg = await manager.receive_json(websocket)
 
             if msg["type"] == "chat_message":
+                client_msg_id = msg.get("client_msg_id")
+                if not _valid_client_msg_id(client_msg_id):
+                    await manager.send_json(websocket, {"type": "error", "message": "Invalid client_msg_id."})
+                    continue
                 db = next(get_db())
-                crud.create_chat_message(
-                    db,
-                    schemas.ChatMessageCreate(
-                        session_id=msg["session_id"],
-                        message=msg["message"],
-                        is_from_customer=False,
-                    ),
-                    employee_id=employee_id,
+                session = crud.get_chat_session(db, msg["session_id"])
+                try:
+                    _check_agent_can_send(db, employee, session)
+                except HTTPException as exc:
+                    db.close()
+                    # Carries client_msg_id so the client stops resending it.
+                    await manager.send_json(websocket, {
+                        "type": "error",
+                        "session_id": msg["session_id"],
+                        "client_msg_id": client_msg_id,
+                        "message": exc.detail,
+                    })
+                    continue
+                ack = await _send_agent_message(
+                    db, employee, session, msg["message"], client_msg_id, msg.get("timestamp")
                 )
+                if client_msg_id is not None:
+                    await manager.send_json(websocket, {"type": "message_ack", **ack})
+                db.close()
 
-                session = crud.get_chat_session(db, msg["session_id"])
-                emp = db.query(models.Employee).filter(models.Employee.id == employee_id).first()
-
-                if session and emp:
-                    agent_name = f"{emp.first_name} {emp.last_name}".strip() or emp.username
-                    customer_email = session.customer.email if session.customer else None
-                    
-                    payload = json.dumps({
-                        "type": "message",
-                        "session_id": session.id,
-                        "message": msg["message"],
-                        "from": "support",
-                        "timestamp": msg.get("timestamp"),
-                        "agent_name": agent_name,
+            elif msg["type"] == "read":
+                sid = msg.get("session_id")
+                if sid:
+                    db = next(get_db())
+                    crud.mark_session_read(db, sid, by_customer=False)
+                    db.close()
+
+            elif msg["type"] == "filter":
+                try:
+                    event_filter = EventFilter.from_params(msg)
+                except (TypeError, ValueError) as exc:
+                    await manager.send_json(websocket, {"type": "error", "message": f"Invalid filter: {exc}"})
+                    continue
+                if not manager.set_filter(websocket, event_filter):
+                    await manager.send_json(websocket, {
+                        "type": "error",
+                        "message": "Filters are only available to admins and managers.",
                     })
 
-                    await manager.send_to_session(payload, session.id, customer_email=customer_email)
-                db.close()
+            elif msg["type"] in ("subscribe", "unsubscribe"):
+                sid = msg.get("session_id")
+                if not sid:
+                    continue
+                if msg["type"] == "unsubscribe":
+                    manager.unsubscribe(websocket, sid)
+                    continue
+                shop_id = _session_shop_id(sid)
+                if shop_id is None or not (is_admin or shop_id == employee.shop_id):
+                    await manager.send_json(websocket, {
+                        "type": "error",
+                        "session_id": sid,
+                        "message": "Cannot subscribe to this session.",
+                    })
+                elif not manager.subscribe(websocket, sid):
+                    await manager.send_json(websocket, {
+                        "type": "error",
+                        "session_id": sid,
+                        "message": "Too many subscribed sessions.",
+                    })
 
             elif msg["type"] in ("typing", "stop_typing"):
                 sid = msg.get("session_id")
                 if sid:
-                    payload = json.dumps({
+                    payload = dumps_str({
                         "type": msg["type"],
                         "session_id": sid,
                         "agent_name": f"{employee.first_name} {employee.last_name}".strip() or employee.username,
@@ -246,15 +541,22 @@ async def ws_employee(websocket: WebSocket, employee_id: int):
                     await manager.send_to_session(payload, sid, customer_email=customer_email)
 
     except WebSocketDisconnect:
-        manager.disconnect_employee(employee_id)
+        manager.disconnect_socket(websocket)
+    except Exception as exc:
+        logger.exception("Employee socket %s failed: %s", employee_id, exc)
+        manager.disconnect_socket(websocket, "error")
 
 
 @router.websocket("/ws/customer/{customer_email}")
 async def ws_customer(websocket: WebSocket, customer_email: str):
     import urllib.parse
     clean_email = urllib.parse.unquote(customer_email)
-    await manager.connect_customer(websocket, clean_email)
+    if await manager.reject_if_draining(websocket):
+        return
     current_session_id = None
+    waiting = False
+    shop_id = websocket.query_params.get("shop_id")
+    shop_id = int(shop_id) if shop_id and shop_id.isdigit() else None
 
     try:
         db = next(get_db())
@@ -271,23 +573,42 @@ async def ws_customer(websocket: WebSocket, customer_email: str):
             )
             if active:
                 current_session_id = active.id
-                manager.session_connections[active.id] = websocket
+                shop_id = active.shop_id
+                waiting = active.status == "waiting"
         db.close()
     except Exception as exc:
         logger.warning("Error auto-mapping session: %s", exc)
 
+    await manager.connect_customer(websocket, clean_email, session_id=current_session_id, shop_id=shop_id)
+    if not await manager.apply_affinity(websocket, shop_id):
+        return
+    if waiting:
+        # Later changes are pushed by the queue notifier.
+        position = waiting_queue.position(shop_id, current_session_id)
+        if position:
+            await manager.send_json(websocket, position)
+
     try:
         while True:
-            data = await websocket.receive_text()
-            msg = json.loads(data)
+            msg = await manager.receive_json(websocket)
 
             if msg["type"] == "session_connect":
                 sid = msg.get("session_id")
                 if sid:
                     current_session_id = sid
-                    manager.session_connections[sid] = websocket
+                    manager.bind_session(websocket, sid)
+
+            elif msg["type"] == "read":
+                if current_session_id:
+                    db = next(get_db())
+                    crud.mark_session_read(db, current_session_id, by_customer=True)
+                    db.close()
 
             elif msg["type"] == "chat_message":
+                client_msg_id = msg.get("client_msg_id")
+                if not _valid_client_msg_id(client_msg_id):
+                    await manager.send_json(websocket, {"type": "error", "message": "Invalid client_msg_id."})
+                    continue
                 db = next(get_db())
                 customer = crud.get_customer_by_email(db, clean_email)
                 if not customer:
@@ -304,7 +625,7 @@ async def ws_customer(websocket: WebSocket, customer_email: str):
                     active_session = crud.get_chat_session(db, sid)
                     if active_session and current_session_id != sid:
                         current_session_id = sid
-                        manager.session_connections[sid] = websocket
+                        manager.bind_session(websocket, sid)
                 else:
                     active_session = (
                         db.query(models.ChatSession)
@@ -317,29 +638,43 @@ async def ws_customer(websocket: WebSocket, customer_email: str):
                     )
                     if active_session:
                         current_session_id = active_session.id
-                        manager.session_connections[active_session.id] = websocket
+                        manager.bind_session(websocket, active_session.id)
 
                 if not active_session:
-                    await websocket.send_text(
-                        json.dumps({
-                            "type": "error",
-                            "message": "No active chat session found. Please start a new chat.",
-                        })
-                    )
+                    await manager.send_json(websocket, {
+                        "type": "error",
+                        "client_msg_id": client_msg_id,
+                        "message": "No active chat session found. Please start a new chat.",
+                    })
                     db.close()
                     continue
 
-                crud.create_chat_message(
+                message_id, db_message = crud.submit_chat_message(
                     db,
                     schemas.ChatMessageCreate(
                         session_id=active_session.id,
                         message=msg["message"],
                         is_from_customer=True,
+                        client_msg_id=client_msg_id,
                     ),
                 )
+                if client_msg_id is not None:
+                    await manager.send_json(websocket, {
+                        "type": "message_ack",
+                        "message_id": message_id,
+                        "session_id": active_session.id,
+                        "client_msg_id": client_msg_id,
+                        "duplicate": db_message is None,
+                    })
+                if db_message is None:
+                    # A resend of a stored message: acked, not broadcast again.
+                    db.close()
+                    continue
 
-                payload = json.dumps({
+                payload = dumps_str({
                     "type": "message",
+                    "id": message_id,
+                    "client_msg_id": client_msg_id,
                     "session_id": active_session.id,
                     "message": msg["message"],
                     "from": "customer",
@@ -350,19 +685,25 @@ async def ws_customer(websocket: WebSocket, customer_email: str):
                 })
 
                 if active_session.employee_id:
-                    await manager.send_to_employee(payload, active_session.employee_id)
-                    await manager.broadcast_to_shop_employees(
-                        payload, active_session.shop_id, exclude_employee_id=active_session.employee_id
+                    await manager.send_to_session_staff(
+                        payload,
+                        active_session.id,
+                        employee_id=active_session.employee_id,
+                        shop_id=active_session.shop_id,
+                        event_type="message",
                     )
                 else:
-                    await manager.broadcast_to_shop_employees(payload, active_session.shop_id)
+                    # Waiting sessions are queue-level: the whole shop sees them.
+                    await manager.broadcast_to_shop_employees(
+                        payload, active_session.shop_id, event_type="message", session_id=active_session.id
+                    )
 
                 db.close()
 
             elif msg["type"] in ("typing", "stop_typing"):
                 sid = msg.get("session_id")
                 if sid:
-                    payload = json.dumps({
+                    payload = dumps_str({
                         "type": msg["type"],
                         "session_id": sid,
                         "customer_email": clean_email,
@@ -370,11 +711,17 @@ async def ws_customer(websocket: WebSocket, customer_email: str):
                     db = next(get_db())
                     session = crud.get_chat_session(db, sid)
                     if session:
-                        if session.employee_id:
-                            await manager.send_to_employee(payload, session.employee_id)
-                        else:
-                            await manager.broadcast_to_shop_employees(payload, session.shop_id)
+                        await manager.send_to_session_staff(
+                            payload, sid, employee_id=session.employee_id, shop_id=session.shop_id
+                        )
+                        # Admins/managers only receive typing if their filter samples it.
+                        await manager.broadcast_to_shop_employees(
+                            payload, session.shop_id, event_type=msg["type"], session_id=sid, admins_only=True
+                        )
                     db.close()
 
     except WebSocketDisconnect:
-        manager.disconnect_customer(clean_email, current_session_id)
+        manager.disconnect_socket(websocket)
+    except Exception as exc:
+        logger.exception("Customer socket %s failed: %s", clean_email, exc)
+        manager.disconnect_socket(websocket, "error")
@@ -1,11 +1,13 @@
-from typing import List
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
 from sqlalchemy.orm import Session
 
-from app import schemas, crud
+from app import schemas, crud, models
 from app.database import get_db
 from app.dependencies import customer_read, customer_create, customer_update, customer_delete
+from app.services.customer_import import ImportFormatError, detect_format, import_customers
+from app.services.export import export_response
 
 router = APIRouter(
     prefix="/customers",
@@ -25,14 +27,56 @@ def create_customer(
 
 
 
+@router.post("/import", response_model=schemas.CustomerImportReport)
+def import_customer_file(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    update_existing: bool = True,
+    db: Session = Depends(get_db),
+    current_employee: models.Employee = Depends(customer_create),
+    # Rows matching an existing email are merged, so importing needs both.
+    _=Depends(customer_update),
+):
+    fmt = format or detect_format(file.filename, file.content_type)
+    try:
+        return import_customers(db, file.file, fmt, update_existing=update_existing)
+    except ImportFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
 @router.get("/", response_model=List[schemas.Customer])
 def list_customers(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
+    q: Optional[str] = Query(None, max_length=100),
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    _=Depends(customer_read),
+):
+    return crud.get_customers(db, skip=skip, limit=limit, q=q, after_id=after_id)
+
+
+@router.get("/autocomplete", response_model=List[schemas.CustomerSummary])
+def autocomplete_customers(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
     db: Session = Depends(get_db),
     _=Depends(customer_read),
 ):
-    return crud.get_customers(db, skip=skip, limit=limit)
+    return crud.autocomplete_customers(db, q, limit=limit)
+
+
+@router.get("/export")
+def export_customers(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    q: Optional[str] = Query(None, max_length=100),
+    _=Depends(customer_read),
+):
+    return export_response(
+        format,
+        "customers",
+        lambda db, after_id, limit: crud.export_customers_query(db, after_id, limit, q=q),
+    )
 
 
 @router.get("/{customer_id}", response_model=schemas.Customer)
@@ -1,6 +1,6 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
 from app import schemas, crud
@@ -24,13 +24,36 @@ def create_employee(
 
 @router.get("/", response_model=List[schemas.Employee])
 def list_employees(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     shop_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    include_total: bool = False,
     db: Session = Depends(get_db),
     _=Depends(employee_read),
 ):
-    return crud.get_employees(db, skip=skip, limit=limit, shop_id=shop_id)
+    if include_total:
+        response.headers["X-Total-Count"] = str(crud.count_employees(db, shop_id=shop_id))
+    return crud.get_employees(db, skip=skip, limit=limit, shop_id=shop_id, after_id=after_id)
+
+
+@router.get("/summary", response_model=List[schemas.EmployeeSummary])
+def list_employee_summaries(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    shop_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_db),
+    _=Depends(employee_read),
+):
+    if include_total:
+        response.headers["X-Total-Count"] = str(crud.count_employees(db, shop_id=shop_id))
+    return crud.get_employee_summaries(
+        db, skip=skip, limit=limit, shop_id=shop_id, after_id=after_id
+    )
 
 
 @router.get("/me", response_model=schemas.Employee)
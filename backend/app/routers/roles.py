@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
 from app import schemas, crud
@@ -17,9 +17,17 @@ def create_role(role: schemas.RoleCreate, db: Session = Depends(get_db), _=Depen
 
 @router.get("/", response_model=List[schemas.Role])
 def list_roles(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_db), _=Depends(role_read)
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_db),
+    _=Depends(role_read),
 ):
-    return crud.get_roles(db, skip=skip, limit=limit)
+    if include_total:
+        response.headers["X-Total-Count"] = str(crud.count_roles(db))
+    return crud.get_roles(db, skip=skip, limit=limit, after_id=after_id)
 
 
 @router.get("/{role_id}", response_model=schemas.Role)
@@ -1,27 +1,51 @@
 from app.schemas.auth import Token, TokenData, LoginRequest
 from app.schemas.permission import PermissionCreate, PermissionUpdate, Permission
 from app.schemas.role import RoleCreate, RoleUpdate, Role
-from app.schemas.employee import EmployeeCreate, EmployeeUpdate, Employee
+from app.schemas.employee import EmployeeCreate, EmployeeUpdate, Employee, EmployeeSummary
 from app.schemas.shop import ShopCreate, ShopUpdate, Shop
 from app.schemas.team import TeamCreate, TeamUpdate, Team
-from app.schemas.customer import CustomerCreate, CustomerUpdate, Customer
+from app.schemas.customer import (
+    CustomerCreate,
+    CustomerUpdate,
+    Customer,
+    CustomerSummary,
+    CustomerImportError,
+    CustomerImportReport,
+)
+from app.schemas.admin import BlockingSite, BlockingReport, AffinityNodes, AffinityState
+from app.schemas.analytics import (
+    ShopAnalyticsBucket,
+    AgentAnalyticsBucket,
+    AgentAnalyticsSummary,
+    QueueSnapshot,
+)
 from app.schemas.chat import (
     ChatSessionCreate,
     ChatSessionUpdate,
+    ChatSessionInfo,
     ChatSession,
     ChatMessageCreate,
     ChatMessageUpdate,
     ChatMessage,
+    ChatSearchResult,
+    ChatSearchPage,
+    ChatMessageSend,
+    ChatMessageAck,
+    QueuePosition,
 )
 
 __all__ = [
     "Token", "TokenData", "LoginRequest",
     "PermissionCreate", "PermissionUpdate", "Permission",
     "RoleCreate", "RoleUpdate", "Role",
-    "EmployeeCreate", "EmployeeUpdate", "Employee",
+    "EmployeeCreate", "EmployeeUpdate", "Employee", "EmployeeSummary",
     "ShopCreate", "ShopUpdate", "Shop",
     "TeamCreate", "TeamUpdate", "Team",
-    "CustomerCreate", "CustomerUpdate", "Customer",
-    "ChatSessionCreate", "ChatSessionUpdate", "ChatSession",
-    "ChatMessageCreate", "ChatMessageUpdate", "ChatMessage",
+    "CustomerCreate", "CustomerUpdate", "Customer", "CustomerSummary",
+    "CustomerImportError", "CustomerImportReport",
+    "ChatSessionCreate", "ChatSessionUpdate", "ChatSessionInfo", "ChatSession",
+    "ChatMessageCreate", "ChatMessageUpdate", "ChatMessage", "ChatSearchResult", "ChatSearchPage",
+    "ChatMessageSend", "ChatMessageAck", "QueuePosition",
+    "BlockingSite", "BlockingReport", "AffinityNodes", "AffinityState",
+    "ShopAnalyticsBucket", "AgentAnalyticsBucket", "AgentAnalyticsSummary", "QueueSnapshot",
 ]
@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from typing import List
+
+
+class BlockingSite(BaseModel):
+    filename: str
+    lineno: int
+    function: str
+    count: int
+    total_blocked: float
+    max_blocked: float
+    last_seen: float
+    stack: List[str] = []
+
+
+class BlockingReport(BaseModel):
+    threshold: float
+    interval: float
+    stalls: int
+    sites: List[BlockingSite] = []
+
+
+class AffinityNodes(BaseModel):
+    nodes: List[str]
+
+
+class AffinityState(BaseModel):
+    mode: str
+    self_url: str
+    enabled: bool
+    nodes: List[str] = []
+    moved_shops: List[int] = []
@@ -0,0 +1,49 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+
+class _Averages(BaseModel):
+    avg_queue_wait_seconds: Optional[float] = None
+    avg_first_response_seconds: Optional[float] = None
+    avg_handle_seconds: Optional[float] = None
+
+
+class ShopAnalyticsBucket(_Averages):
+    bucket: datetime
+    sessions_created: int = 0
+    sessions_assigned: int = 0
+    queue_wait_seconds: float = 0
+    sessions_closed: int = 0
+    sessions_abandoned: int = 0
+    first_responses: int = 0
+    first_response_seconds: float = 0
+    sessions_handled: int = 0
+    handle_seconds: float = 0
+    customer_messages: int = 0
+    agent_messages: int = 0
+    abandonment_rate: Optional[float] = None
+
+
+class AgentAnalyticsTotals(_Averages):
+    sessions_assigned: int = 0
+    queue_wait_seconds: float = 0
+    first_responses: int = 0
+    first_response_seconds: float = 0
+    sessions_handled: int = 0
+    handle_seconds: float = 0
+    messages: int = 0
+
+
+class AgentAnalyticsBucket(AgentAnalyticsTotals):
+    bucket: datetime
+
+
+class AgentAnalyticsSummary(AgentAnalyticsTotals):
+    employee_id: int
+
+
+class QueueSnapshot(BaseModel):
+    waiting: int
+    oldest_waiting_since: Optional[datetime] = None
+    longest_wait_seconds: Optional[float] = None
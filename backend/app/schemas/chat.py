@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -10,6 +10,7 @@ class ChatMessageBase(BaseModel):
 class ChatMessageCreate(ChatMessageBase):
     session_id: int
     is_from_customer: bool = False
+    client_msg_id: Optional[str] = Field(default=None, min_length=1, max_length=64)
 
 
 class ChatMessageUpdate(BaseModel):
@@ -31,6 +32,7 @@ class ChatMessage(ChatMessageBase):
     employee_id: Optional[int] = None
     is_from_customer: bool
     created_at: datetime
+    client_msg_id: Optional[str] = None
     employee: Optional[EmployeeInfo] = None
 
     model_config = {"from_attributes": True}
@@ -66,7 +68,7 @@ class ChatSessionUpdate(BaseModel):
     status: Optional[str] = None
 
 
-class ChatSession(ChatSessionBase):
+class ChatSessionInfo(ChatSessionBase):
     id: int
     customer_id: int
     shop_id: int
@@ -74,8 +76,55 @@ class ChatSession(ChatSessionBase):
     status: str
     created_at: datetime
     closed_at: Optional[datetime] = None
-    messages: List[ChatMessage] = []
+    assigned_at: Optional[datetime] = None
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+    message_count: int = 0
+    customer_unread: int = 0
+    agent_unread: int = 0
+    first_response_at: Optional[datetime] = None
     shop: Optional[ShopInfo] = None
     customer: Optional[CustomerInfo] = None
 
     model_config = {"from_attributes": True}
+
+
+class ChatSession(ChatSessionInfo):
+    messages: List[ChatMessage] = []
+
+
+class ChatSearchResult(BaseModel):
+    message_id: int
+    session_id: int
+    shop_id: int
+    customer_id: int
+    status: str
+    is_from_customer: bool
+    created_at: datetime
+    rank: float
+    snippet: str
+
+
+class ChatSearchPage(BaseModel):
+    results: List[ChatSearchResult] = []
+    next_cursor: Optional[str] = None
+
+
+class ChatMessageSend(BaseModel):
+    message: str = Field(min_length=1)
+    client_msg_id: Optional[str] = Field(default=None, min_length=1, max_length=64)
+
+
+class ChatMessageAck(BaseModel):
+    message_id: int
+    session_id: int
+    client_msg_id: Optional[str] = None
+    duplicate: bool = False
+
+
+class QueuePosition(BaseModel):
+    session_id: int
+    status: str
+    position: Optional[int] = None
+    waiting: Optional[int] = None
+    eta_seconds: Optional[float] = None
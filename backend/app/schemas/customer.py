@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -22,3 +22,25 @@ class Customer(CustomerBase):
     created_at: datetime
 
     model_config = {"from_attributes": True}
+
+
+class CustomerSummary(BaseModel):
+    id: int
+    name: str
+    email: str
+
+    model_config = {"from_attributes": True}
+
+
+class CustomerImportError(BaseModel):
+    line: int
+    error: str
+
+
+class CustomerImportReport(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    error_count: int
+    errors: List[CustomerImportError] = []
+    errors_truncated: bool = False
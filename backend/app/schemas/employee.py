@@ -40,3 +40,17 @@ class Employee(EmployeeBase):
     role: Role
 
     model_config = {"from_attributes": True}
+
+
+class EmployeeSummary(BaseModel):
+    id: int
+    username: str
+    email: str
+    first_name: str
+    last_name: str
+    is_active: bool
+    shop_id: int
+    role_id: int
+    role_name: str
+
+    model_config = {"from_attributes": True}
@@ -0,0 +1,107 @@
+"""Shop-to-node affinity for WebSocket connections.
+
+A consistent-hash ring maps each shop_id to one backend node, so a shop's
+agents and customers end up on the same process and most events never leave
+it. Each node appears on the ring as ``vnodes`` virtual points; adding or
+removing a node only moves the shops on the arcs it gains or loses (about
+1/N of them).
+
+Disabled unless ``affinity_nodes`` lists the public WebSocket base URLs of
+the nodes and ``affinity_self`` names this one. In "hint" mode clients are
+told their owning node and move on their next reconnect; in "redirect" mode
+they are sent there immediately.
+"""
+import bisect
+import hashlib
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from app.config import settings
+from app.services.cache import invalidation_bus
+
+MODES = ("off", "hint", "redirect")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Sequence[str] = (), vnodes: int = 128):
+        self.vnodes = vnodes
+        self.nodes: List[str] = sorted(set(nodes))
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._owners[index]
+
+    def moved(self, other: "HashRing", keys) -> Dict[object, str]:
+        """Keys whose owner differs in ``other``, mapped to the new owner."""
+        return {key: other.owner(key) for key in keys if self.owner(key) != other.owner(key)}
+
+
+class NodeAffinity:
+    cache_name = "affinity_nodes"
+
+    def __init__(self, nodes: Sequence[str], self_url: Optional[str], mode: str, vnodes: int):
+        if mode not in MODES:
+            raise ValueError(f"affinity_mode must be one of {', '.join(MODES)}")
+        self.self_url = self_url
+        self.mode = mode
+        self.vnodes = vnodes
+        self.ring = HashRing(nodes, vnodes)
+        self._lock = threading.Lock()
+        self._listeners = []
+        # Membership is pushed, not cached; a flush would empty the ring.
+        invalidation_bus.register(self.cache_name, self._on_nodes_changed, flush_on_reconnect=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off" and bool(self.self_url) and bool(self.ring.nodes)
+
+    def owner(self, shop_id: Optional[int]) -> Optional[str]:
+        if shop_id is None or not self.enabled:
+            return None
+        return self.ring.owner(shop_id)
+
+    def owns(self, shop_id: Optional[int]) -> bool:
+        """True if every non-admin socket of ``shop_id`` is on this node.
+        Only redirect mode guarantees that; hinted clients may linger."""
+        owner = self.owner(shop_id)
+        return self.mode == "redirect" and owner is not None and owner == self.self_url
+
+    def remote_owner(self, shop_id: Optional[int]) -> Optional[str]:
+        """The node that should hold ``shop_id``'s sockets, if not this one."""
+        owner = self.owner(shop_id)
+        return owner if owner and owner != self.self_url else None
+
+    def on_change(self, listener):
+        """Call ``listener(old_ring, new_ring)`` after membership changes."""
+        self._listeners.append(listener)
+
+    def set_nodes(self, nodes: Sequence[str]):
+        """Change membership on every node."""
+        self._apply(nodes)
+        invalidation_bus.publish(self.cache_name, ",".join(nodes), local=False)
+
+    def _on_nodes_changed(self, key: Optional[str]):
+        self._apply([node for node in (key or "").split(",") if node])
+
+    def _apply(self, nodes: Sequence[str]):
+        ring = HashRing(nodes, self.vnodes)
+        with self._lock:
+            old, self.ring = self.ring, ring
+        for listener in self._listeners:
+            listener(old, ring)
+
+
+affinity = NodeAffinity(
+    settings.affinity_nodes, settings.affinity_self, settings.affinity_mode, settings.affinity_vnodes
+)
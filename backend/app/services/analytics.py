@@ -0,0 +1,371 @@
+"""Hourly support analytics rollups.
+
+crud records session and message events here after they commit. Events are
+folded into per-(shop, hour) and per-(agent, shop, hour) counters in memory
+and flushed every ``analytics_flush_interval`` seconds as additive upserts,
+so a busy shop costs one row write per flush rather than one per message.
+Reads (crud.analytics) then touch one row per bucket.
+
+A crash loses at most one flush interval of counts; the backfill recomputes
+any range from chat_sessions/chat_messages:
+
+    python -m app.services.analytics --since 2024-01-01 [--until 2024-02-01]
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import Float, Integer, and_, cast, func, null
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+from app.models.analytics import AGENT_METRICS, SHOP_METRICS
+
+logger = logging.getLogger(__name__)
+
+ShopKey = Tuple[int, datetime]
+AgentKey = Tuple[int, int, datetime]
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def seconds_between(start: Optional[datetime], end: Optional[datetime]) -> float:
+    if start is None or end is None:
+        return 0.0
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    return max(0.0, (end - start).total_seconds())
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Rollups:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shops: Dict[ShopKey, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._agents: Dict[AgentKey, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def _add(self, shop_id: int, employee_id: Optional[int], moment: Optional[datetime], **deltas):
+        bucket = hour_bucket(moment or _now())
+        with self._lock:
+            shop = self._shops[(shop_id, bucket)]
+            for metric, value in deltas.items():
+                if metric in SHOP_METRICS:
+                    shop[metric] += value
+            if employee_id is not None:
+                agent = self._agents[(employee_id, shop_id, bucket)]
+                for metric, value in deltas.items():
+                    if metric in AGENT_METRICS:
+                        agent[metric] += value
+
+    # Events, called by crud after commit
+    def session_created(self, session):
+        self._add(session.shop_id, None, session.created_at, sessions_created=1)
+
+    def session_assigned(self, session):
+        self._add(
+            session.shop_id,
+            session.employee_id,
+            session.assigned_at,
+            sessions_assigned=1,
+            queue_wait_seconds=seconds_between(session.created_at, session.assigned_at),
+        )
+
+    def message_sent(self, session, employee_id: Optional[int], from_customer: bool, first_response: bool):
+        if from_customer:
+            self._add(session.shop_id, None, None, customer_messages=1)
+            return
+        deltas = {"agent_messages": 1, "messages": 1}
+        if first_response:
+            deltas["first_responses"] = 1
+            deltas["first_response_seconds"] = seconds_between(session.created_at, session.first_response_at)
+        self._add(session.shop_id, employee_id, session.first_response_at if first_response else None, **deltas)
+
+    def session_closed(self, session):
+        if session.employee_id is None:
+            self._add(session.shop_id, None, session.closed_at, sessions_closed=1, sessions_abandoned=1)
+            return
+        self._add(
+            session.shop_id,
+            session.employee_id,
+            session.closed_at,
+            sessions_closed=1,
+            sessions_handled=1,
+            handle_seconds=seconds_between(
+                session.assigned_at or session.first_response_at or session.created_at, session.closed_at
+            ),
+        )
+
+    # Persistence
+    def flush(self):
+        with self._lock:
+            shops, self._shops = self._shops, defaultdict(lambda: defaultdict(float))
+            agents, self._agents = self._agents, defaultdict(lambda: defaultdict(float))
+        if not shops and not agents:
+            return
+        db = SessionLocal()
+        try:
+            apply_deltas(db, models.ShopHourlyStats, ("shop_id", "bucket"), SHOP_METRICS, shops.items())
+            apply_deltas(
+                db, models.AgentHourlyStats, ("employee_id", "shop_id", "bucket"), AGENT_METRICS, agents.items()
+            )
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.warning("Analytics flush failed, counts kept for the next one: %s", exc)
+            self._restore(shops, agents)
+        finally:
+            db.close()
+
+    def _restore(self, shops, agents):
+        with self._lock:
+            for pending, current in ((shops, self._shops), (agents, self._agents)):
+                for key, deltas in pending.items():
+                    for metric, value in deltas.items():
+                        current[key][metric] += value
+
+    async def run_flusher(self, interval: float):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await asyncio.to_thread(self.flush)
+        finally:
+            await asyncio.to_thread(self.flush)
+
+
+def apply_deltas(db: Session, model, key_columns: Tuple[str, ...], metrics: Tuple[str, ...], rows: Iterable):
+    """Add ``rows`` of (key tuple, {metric: delta}) to ``model``'s counters."""
+    values = []
+    for key, deltas in rows:
+        row = dict(zip(key_columns, key))
+        for metric in metrics:
+            value = deltas.get(metric, 0)
+            row[metric] = value if metric.endswith("_seconds") else int(value)
+        values.append(row)
+    if not values:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        table = model.__table__
+        for start in range(0, len(values), 1000):
+            statement = insert(table).values(values[start:start + 1000])
+            db.execute(statement.on_conflict_do_update(
+                index_elements=list(key_columns),
+                set_={metric: table.c[metric] + statement.excluded[metric] for metric in metrics},
+            ))
+        return
+
+    for row in values:
+        existing = db.get(model, tuple(row[column] for column in key_columns))
+        if existing is None:
+            db.add(model(**row))
+        else:
+            for metric in metrics:
+                setattr(existing, metric, getattr(existing, metric) + row[metric])
+
+
+rollups = Rollups()
+
+
+# Backfill
+def _epoch(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.extract("epoch", column), Float)  # numeric since PG 14
+    return cast(func.strftime("%s", column), Integer)
+
+
+def _hour(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.floor(_epoch(db, column) / 3600)
+    return _epoch(db, column) / 3600  # integer division
+
+
+def _bucket(hour) -> datetime:
+    return datetime.fromtimestamp(int(hour) * 3600, timezone.utc)
+
+
+def _stream(db: Session, query, batch_size: int = 5000):
+    rows = []
+    for row in query.yield_per(batch_size):
+        rows.append(row)
+        if len(rows) >= batch_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def backfill(db: Session, since: datetime, until: datetime):
+    """Recompute the rollups for buckets in [since, until) from the source
+    tables, replacing what is there. Run it for closed hours only: counts the
+    live flusher adds to the same buckets meanwhile would be overwritten.
+
+    Sessions assigned before chat_sessions.assigned_at was added carry no
+    assignment time, so hours before the upgrade report no assignments and a
+    null average queue wait; every other metric is rebuilt in full.
+    """
+    since, until = hour_bucket(since), hour_bucket(until)
+    Session_, Message = models.ChatSession, models.ChatMessage
+
+    for model in (models.ShopHourlyStats, models.AgentHourlyStats):
+        db.query(model).filter(model.bucket >= since, model.bucket < until).delete(synchronize_session=False)
+
+    def within(column):
+        return and_(column >= since, column < until)
+
+    def seconds(start, end):
+        return _epoch(db, end) - _epoch(db, start)
+
+    # Credit the first response to whoever sent it, as the live path does,
+    # not to the agent the session ended up assigned to.
+    responder = (
+        db.query(Message.employee_id)
+        .filter(Message.session_id == Session_.id, Message.is_from_customer.is_(False))
+        .order_by(Message.created_at, Message.id)
+        .limit(1)
+        .correlate(Session_)
+        .scalar_subquery()
+    )
+    no_agent = None
+    sources = [
+        # (time column, agent column or None, {metric: aggregate}, extra filter)
+        (Session_.created_at, no_agent, {"sessions_created": func.count()}, None),
+        (
+            Session_.assigned_at,
+            Session_.employee_id,
+            {
+                "sessions_assigned": func.count(),
+                "queue_wait_seconds": func.sum(seconds(Session_.created_at, Session_.assigned_at)),
+            },
+            # Sessions assigned before assigned_at existed have no assignment
+            # time; they are left out rather than counted with a zero wait.
+            and_(Session_.employee_id.isnot(None), Session_.assigned_at.isnot(None)),
+        ),
+        (Session_.closed_at, no_agent, {"sessions_closed": func.count(), "sessions_abandoned": func.count()},
+         Session_.employee_id.is_(None)),
+        (
+            Session_.closed_at,
+            Session_.employee_id,
+            {
+                "sessions_closed": func.count(),
+                "sessions_handled": func.count(),
+                "handle_seconds": func.sum(seconds(
+                    func.coalesce(Session_.assigned_at, Session_.first_response_at, Session_.created_at),
+                    Session_.closed_at,
+                )),
+            },
+            Session_.employee_id.isnot(None),
+        ),
+    ]
+
+    for time_column, agent_column, aggregates, condition in sources:
+        query = _grouped(db, time_column, agent_column, aggregates).filter(within(time_column))
+        if condition is not None:
+            query = query.filter(condition)
+        _apply_grouped(db, query, tuple(aggregates))
+
+    replies = (
+        db.query(
+            Session_.shop_id.label("shop_id"),
+            responder.label("employee_id"),
+            _hour(db, Session_.first_response_at).label("hour"),
+            seconds(Session_.created_at, Session_.first_response_at).label("seconds"),
+        )
+        .filter(within(Session_.first_response_at))
+        .subquery()
+    )
+    query = db.query(
+        replies.c.shop_id,
+        replies.c.employee_id,
+        replies.c.hour,
+        func.count().label("first_responses"),
+        func.sum(replies.c.seconds).label("first_response_seconds"),
+    ).group_by(replies.c.shop_id, replies.c.employee_id, replies.c.hour)
+    _apply_grouped(db, query, ("first_responses", "first_response_seconds"))
+
+    # Messages: the only O(messages) pass, grouped down to buckets in SQL.
+    for from_customer, metrics in ((True, ("customer_messages",)), (False, ("agent_messages", "messages"))):
+        agent = no_agent if from_customer else Message.employee_id
+        query = (
+            _grouped(db, Message.created_at, agent, {"count": func.count()})
+            .join(Session_, Session_.id == Message.session_id)
+            .filter(within(Message.created_at), Message.is_from_customer.is_(from_customer))
+        )
+        for rows in _stream(db, query):
+            _apply_rows(db, [(row.shop_id, row.employee_id, row.hour, {m: row.count for m in metrics}) for row in rows])
+    db.commit()
+
+
+def _grouped(db: Session, time_column, agent_column, aggregates: dict):
+    hour = _hour(db, time_column).label("hour")
+    agent = agent_column.label("employee_id") if agent_column is not None else null().label("employee_id")
+    query = db.query(
+        models.ChatSession.shop_id, agent, hour,
+        *(aggregate.label(metric) for metric, aggregate in aggregates.items()),
+    )
+    group = [models.ChatSession.shop_id, hour] + ([agent_column] if agent_column is not None else [])
+    return query.group_by(*group)
+
+
+def _apply_grouped(db: Session, query, metrics: Tuple[str, ...]):
+    for rows in _stream(db, query):
+        _apply_rows(db, [
+            (row.shop_id, row.employee_id, row.hour, {metric: getattr(row, metric) or 0 for metric in metrics})
+            for row in rows
+        ])
+
+
+def _apply_rows(db: Session, rows):
+    shops: Dict[ShopKey, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    agents: Dict[AgentKey, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for shop_id, employee_id, hour, deltas in rows:
+        bucket = _bucket(hour)
+        for metric, value in deltas.items():
+            if metric in SHOP_METRICS:
+                shops[(shop_id, bucket)][metric] += value
+            if employee_id is not None and metric in AGENT_METRICS:
+                agents[(employee_id, shop_id, bucket)][metric] += value
+    apply_deltas(db, models.ShopHourlyStats, ("shop_id", "bucket"), SHOP_METRICS, shops.items())
+    apply_deltas(db, models.AgentHourlyStats, ("employee_id", "shop_id", "bucket"), AGENT_METRICS, agents.items())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Recompute hourly analytics rollups")
+    parser.add_argument("--since", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None,
+                        help="exclusive; defaults to the start of the current hour")
+    parser.add_argument("--days-per-batch", type=int, default=7)
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    until = args.until or hour_bucket(_now())
+    start = hour_bucket(args.since)
+    db = SessionLocal()
+    try:
+        while start < until:
+            end = min(start + timedelta(days=args.days_per_batch), until)
+            backfill(db, start, end)
+            logger.info("Backfilled analytics for %s .. %s", start.isoformat(), end.isoformat())
+            start = end
+    finally:
+        db.close()
@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+import uuid
+from typing import Callable, Dict, Optional, Set
+
+from app.config import settings
+from app.services.pubsub import ChannelBus, create_client
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache_invalidation"
+
+
+class InvalidationBus:
+    """Fans cache invalidations out to every node over Redis pub/sub.
+
+    Caches register a handler by name and call ``publish`` after a write. The
+    local handler runs immediately; other nodes receive the event on their
+    listener thread. Without Redis this degrades to local-only invalidation,
+    mirroring ConnectionManager's fallback.
+
+    The channel goes through the same ChannelBus as chat traffic, so against
+    a Redis Cluster it is sharded (SPUBLISH/SSUBSCRIBE). Pub/sub is
+    fire-and-forget, so events published while the listener was disconnected
+    are lost; after resubscribing it flushes every cache that registered with
+    ``flush_on_reconnect``.
+    """
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self._handlers: Dict[str, Callable[[Optional[str]], None]] = {}
+        self._flush_on_reconnect: Set[str] = set()
+        self._bus: Optional[ChannelBus] = None
+        self._redis_checked = False
+        self._started = False
+        self._lock = threading.Lock()
+
+    def register(self, cache: str, handler: Callable[[Optional[str]], None], flush_on_reconnect: bool = True):
+        """``handler(None)`` must drop the whole cache unless
+        ``flush_on_reconnect`` is False."""
+        self._handlers[cache] = handler
+        if flush_on_reconnect:
+            self._flush_on_reconnect.add(cache)
+
+    def _channel_bus(self) -> Optional[ChannelBus]:
+        with self._lock:
+            if not self._redis_checked:
+                self._redis_checked = True
+                try:
+                    client = create_client()
+                    client.ping()
+                    self._bus = ChannelBus(client, sharded=settings.redis_cluster)
+                except Exception as exc:
+                    logger.warning("Cache invalidation is local-only, Redis unavailable: %s", exc)
+            return self._bus
+
+    def publish(self, cache: str, key: Optional[str] = None, local: bool = True):
+        """Invalidate ``cache`` everywhere. Pass ``local=False`` when this node
+        has already applied the write to its own copy."""
+        if local:
+            self._dispatch(cache, key)
+        bus = self._channel_bus()
+        if bus is None:
+            return
+        try:
+            bus.publish(
+                INVALIDATION_CHANNEL,
+                json.dumps({"cache": cache, "key": key, "origin": self.node_id}),
+            )
+        except Exception as exc:
+            logger.warning("Failed to publish %s invalidation: %s", cache, exc)
+
+    def start(self):
+        bus = self._channel_bus()
+        if bus is None or self._started:
+            return
+        self._started = True
+        bus.retain([INVALIDATION_CHANNEL])
+        bus.start(self._on_message, on_reconnect=self._on_reconnect, name="cache-invalidation")
+
+    def _on_message(self, message: dict):
+        data = json.loads(message["data"])
+        if data.get("origin") != self.node_id:
+            self._dispatch(data.get("cache"), data.get("key"))
+
+    def _on_reconnect(self):
+        logger.info("Cache invalidation listener resubscribed, flushing caches")
+        for cache in list(self._flush_on_reconnect):
+            self._dispatch(cache, None)
+
+    def _dispatch(self, cache: str, key: Optional[str]):
+        handler = self._handlers.get(cache)
+        if handler is None:
+            return
+        try:
+            handler(key)
+        except Exception as exc:
+            logger.exception("Cache invalidation handler for %s failed: %s", cache, exc)
+
+
+invalidation_bus = InvalidationBus()
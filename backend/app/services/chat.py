@@ -1,46 +1,203 @@
-import json
 import logging
 import asyncio
-import threading
-from typing import Dict
+import itertools
+import random
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, FrozenSet, Iterable, Iterator, Mapping, Optional, Set, Union
 
-import redis
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
 
 from app.config import settings
+from app.services import metrics, protocol
+from app.services.affinity import affinity
+from app.services.pubsub import (
+    EMPLOYEES_CHANNEL,
+    STATS_CHANNEL,
+    ChannelBus,
+    all_shards,
+    create_client,
+    shard_channel,
+)
+from app.services.serialization import dumps_str, pack_envelope, unpack_envelope
 
 logger = logging.getLogger(__name__)
 
+PING_FRAME = dumps_str({"type": "ping"})
+PONG_FRAME = dumps_str({"type": "pong"})
+
+TYPING_EVENTS = frozenset({"typing", "stop_typing"})
+# Chat targets whose non-admin sockets all sit on the shop's owning node.
+SHOP_SCOPED_TARGETS = frozenset({"employee", "session_watchers"})
+# A node's admin presence lapses after this many missed stats intervals.
+ADMIN_PRESENCE_INTERVALS = 3
+SHOP_EVENTS = frozenset({"new_session", "session_closed", "message", "typing", "stop_typing"})
+
+
+def _split(value) -> Iterable[str]:
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return [str(part) for part in value]
+
+
+class EventFilter:
+    """What an admin/manager socket wants from cross-shop broadcasts.
+
+    ``shops`` and ``events`` of None mean "all". Typing is opt-in through
+    ``typing_sample`` (listing "typing" in ``events`` implies a rate of 1);
+    sampling is per session, so a sampled session's typing stream arrives
+    complete. ``stats`` enables the periodic ``shop_stats`` frame.
+    """
+
+    __slots__ = ("shops", "events", "typing_sample", "stats")
+
+    def __init__(
+        self,
+        shops: Optional[FrozenSet[int]] = None,
+        events: Optional[FrozenSet[str]] = None,
+        typing_sample: float = 0.0,
+        stats: bool = False,
+    ):
+        self.shops = shops
+        self.events = events
+        self.typing_sample = typing_sample
+        self.stats = stats
+
+    @classmethod
+    def from_params(cls, params: Mapping) -> Optional["EventFilter"]:
+        """Build a filter from query parameters or a ``filter`` frame. Returns
+        None when no filter keys are present. Raises ValueError on bad input."""
+        if not any(key in params for key in cls.__slots__):
+            return None
+        shops = events = None
+        if params.get("shops") not in (None, ""):
+            shops = frozenset(int(shop) for shop in _split(params["shops"]))
+        if params.get("events") is not None:
+            events = frozenset(_split(params["events"])) - {"none"}
+            unknown = events - SHOP_EVENTS
+            if unknown:
+                raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+        typing_sample = params.get("typing_sample")
+        if typing_sample is None:
+            typing_sample = 1.0 if events and "typing" in events else 0.0
+        typing_sample = float(typing_sample)
+        if not 0.0 <= typing_sample <= 1.0:
+            raise ValueError("typing_sample must be between 0 and 1")
+        stats = str(params.get("stats", "")).lower() in ("1", "true", "yes")
+        return cls(shops, events, typing_sample, stats)
+
+    def accepts(self, shop_id: int, event_type: Optional[str], session_id: Optional[int]) -> bool:
+        if self.shops is not None and shop_id not in self.shops:
+            return False
+        if event_type in TYPING_EVENTS:
+            # Knuth multiplicative hash: a stable pseudo-random draw per session.
+            draw = ((session_id or 0) * 2654435761 & 0xFFFFFFFF) / 2 ** 32
+            return draw < self.typing_sample
+        return self.events is None or event_type is None or event_type in self.events
+
+
+class Connection:
+    """Everything the manager tracks about one open socket.
+
+    Indexes hold references to the same record, so unregistering touches
+    exactly the index keys stored on it. ``sessions`` holds the sessions a
+    customer socket is bound to, or the sessions an employee socket is
+    subscribed to. It and ``outbound`` are allocated on first use.
+    """
+
+    __slots__ = (
+        "id", "ws", "kind", "principal", "shop_id", "is_admin",
+        "protocol", "last_seen", "sessions", "outbound", "filter",
+    )
+
+    def __init__(
+        self,
+        connection_id: int,
+        ws: WebSocket,
+        kind: str,
+        principal: Union[int, str],
+        shop_id: Optional[int] = None,
+        is_admin: bool = False,
+        wire_protocol: str = protocol.PROTOCOL_JSON,
+    ):
+        self.id = connection_id
+        self.ws = ws
+        self.kind = kind
+        self.principal = principal
+        self.shop_id = shop_id
+        self.is_admin = is_admin
+        self.protocol = wire_protocol
+        self.last_seen = time.monotonic()
+        self.sessions: Optional[Set[int]] = None
+        self.outbound: Optional[Deque[tuple]] = None
+        self.filter: Optional[EventFilter] = None
+
+
+class ConnectionSet:
+    """Connections sharing an index key (one principal, shop or session),
+    keyed by connection id. Lets an agent or customer keep several tabs or
+    devices open: add/remove are O(1) and iteration is in connection order.
+    """
+
+    __slots__ = ("_conns",)
+
+    def __init__(self):
+        self._conns: Dict[int, Connection] = {}
+
+    def add(self, conn: Connection):
+        self._conns[conn.id] = conn
+
+    def discard(self, conn: Connection):
+        self._conns.pop(conn.id, None)
+
+    def __contains__(self, conn: Connection) -> bool:
+        return conn.id in self._conns
+
+    def __iter__(self) -> Iterator[Connection]:
+        return iter(list(self._conns.values()))
+
+    def __len__(self) -> int:
+        return len(self._conns)
+
 
 class ConnectionManager:
     def __init__(self):
-        self.employee_connections: Dict[int, WebSocket] = {}
-        self.employee_shop_mapping: Dict[int, int] = {}
-        self.admin_connections: set = set()
-        self.customer_connections: Dict[str, WebSocket] = {}
-        self.session_connections: Dict[int, WebSocket] = {}
+        self.connections: Dict[int, Connection] = {}
+        self.employee_connections: Dict[int, ConnectionSet] = {}
+        self.shop_connections: Dict[int, ConnectionSet] = {}
+        self.admin_connections = ConnectionSet()
+        self.customer_connections: Dict[str, ConnectionSet] = {}
+        self.session_connections: Dict[int, ConnectionSet] = {}
+        self.session_watchers: Dict[int, ConnectionSet] = {}
+        self._connection_ids = itertools.count(1)
+        self.draining = False
+        self._drain_task: Optional[asyncio.Task] = None
+        self._shop_activity: Dict[str, Dict[str, int]] = {}
         self.main_loop = None
+        self._binary_memo = (None, None, None)
+        metrics.websocket_connections.set_function(self._connection_counts)
 
+        self.node_id = uuid.uuid4().hex
+        self._remote_activity: Dict[str, Dict[str, int]] = {}
+        # node_id -> monotonic expiry, for other nodes holding admin sockets.
+        self._admin_nodes: Dict[str, float] = {}
+        self.bus: Optional[ChannelBus] = None
         self.use_redis = False
         try:
-            self.redis_client = redis.Redis(
-                host=settings.redis_host,
-                port=settings.redis_port,
-                db=settings.redis_db,
-                decode_responses=True,
-            )
-            self.redis_client.ping()
-            self.pubsub = self.redis_client.pubsub()
-            self.pubsub.subscribe(
-                ["chat_messages", "session_notifications", "employee_notifications"]
-            )
+            client = create_client()
+            client.ping()
+            self.bus = ChannelBus(client, sharded=settings.redis_cluster)
             self.use_redis = True
             logger.info("Redis connected at %s:%s", settings.redis_host, settings.redis_port)
         except Exception as exc:
             logger.error("Redis connection failed. Falling back to local in-memory delivery. Error: %s", exc)
 
         if self.use_redis:
-            self._start_listener()
+            self.bus.retain([EMPLOYEES_CHANNEL, STATS_CHANNEL])
+            self.bus.start(self._on_bus_message)
+            self._announce_admins(request=True)
+        affinity.on_change(self._on_affinity_change)
 
     def _ensure_main_loop(self):
         try:
@@ -48,186 +205,766 @@ class ConnectionManager:
         except RuntimeError:
             pass
 
-    def _start_listener(self):
-        def _listen():
-            try:
-                for message in self.pubsub.listen():
-                    if message["type"] == "message":
-                        loop = self.main_loop
-                        if not loop or not loop.is_running():
-                            try:
-                                loop = asyncio.get_event_loop()
-                            except Exception:
-                                pass
-                        if loop and loop.is_running():
-                            asyncio.run_coroutine_threadsafe(
-                                self._handle_message(message), loop
-                            )
-                        else:
-                            # Fallback if no loop threadsafe, attempt local execution
-                            logger.warning("Main loop unavailable for Redis message dispatch")
-            except Exception as exc:
-                logger.error("Redis listener error: %s", exc)
-
-        thread = threading.Thread(target=_listen, daemon=True)
-        thread.start()
+    def _on_bus_message(self, message: dict):
+        # Runs on the listener thread; delivery happens on the event loop.
+        loop = self.main_loop
+        if loop and loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._handle_message(message), loop)
+        else:
+            logger.warning("Main loop unavailable for Redis message dispatch")
 
     async def _handle_message(self, message):
         try:
-            channel = message["channel"]
-            data = json.loads(message["data"])
-
-            if channel == "chat_messages":
-                await self._deliver_chat(data)
-            elif channel == "session_notifications":
-                if data.get("notification_type") == "broadcast_to_shop":
-                    await self._broadcast_shop_local(
-                        data["message"],
-                        data["shop_id"],
-                        exclude_employee_id=data.get("exclude_employee_id"),
-                    )
-            elif channel == "employee_notifications":
-                await self._broadcast_employees_local(data.get("message", ""))
+            # The frame is forwarded to sockets as-is; only the header is parsed.
+            data, frame = unpack_envelope(message["data"])
+            notification_type = data.get("notification_type")
+
+            if "target_type" in data:
+                await self._deliver_chat(data, frame)
+            elif notification_type == "broadcast_to_shop":
+                await self._broadcast_shop_local(
+                    frame,
+                    data["shop_id"],
+                    exclude_employee_id=data.get("exclude_employee_id"),
+                    published_at=data.get("published_at"),
+                    event_type=data.get("event_type"),
+                    session_id=data.get("session_id"),
+                    admins_only=data.get("admins_only", False),
+                )
+            elif notification_type == "broadcast_to_employees":
+                await self._broadcast_employees_local(frame, published_at=data.get("published_at"))
+            elif notification_type == "shop_stats" and data.get("origin") != self.node_id:
+                self._merge_activity(self._remote_activity, data.get("activity") or {})
+            elif notification_type == "admin_presence" and data.get("origin") != self.node_id:
+                self._on_admin_presence(data)
         except Exception as exc:
             logger.exception("Error handling Redis message: %s", exc)
 
-    async def _deliver_chat(self, data):
+    def _encode(self, wire_protocol: str, content: str):
+        # Fan-out loops send the same frame to many sockets back to back, so a
+        # single-slot memo avoids re-encoding it for every binary client.
+        memo_protocol, memo_content, memo_encoded = self._binary_memo
+        if memo_protocol == wire_protocol and memo_content is content:
+            return memo_encoded
+        encoded = protocol.encode(wire_protocol, content)
+        self._binary_memo = (wire_protocol, content, encoded)
+        return encoded
+
+    async def _write(self, conn: Connection, content: str, channel: str, published_at: float = None) -> bool:
+        try:
+            if conn.protocol == protocol.PROTOCOL_JSON:
+                await conn.ws.send_text(content)
+            else:
+                await conn.ws.send_bytes(self._encode(conn.protocol, content))
+        except Exception:
+            metrics.messages_dropped.inc(channel)
+            return False
+        metrics.messages_delivered.inc(channel)
+        if published_at is not None:
+            metrics.delivery_lag.observe(time.time() - published_at, channel)
+        return True
+
+    async def _send(self, conn: Connection, content: str, channel: str, published_at: float = None) -> bool:
+        """Write ``content`` to ``conn`` in order with other sends. While a
+        write is in flight, later frames wait in the connection's outbound
+        queue and are flushed by that same writer; once the queue is full the
+        socket is treated as too slow and dropped."""
+        if conn.outbound is not None:
+            if len(conn.outbound) >= settings.ws_outbound_queue_max:
+                metrics.messages_dropped.inc(channel)
+                return False
+            conn.outbound.append((content, channel, published_at))
+            return True
+        conn.outbound = deque()
+        try:
+            ok = await self._write(conn, content, channel, published_at)
+            while ok and conn.outbound:
+                ok = await self._write(conn, *conn.outbound.popleft())
+            for _, queued_channel, _ in conn.outbound:
+                metrics.messages_dropped.inc(queued_channel)
+        finally:
+            conn.outbound = None
+        return ok
+
+    async def _fanout(self, conns: Iterable[Connection], content: str, channel: str, published_at: float = None) -> int:
+        """Send to every connection in ``conns``; connections that fail are
+        dropped. Returns the number of successful deliveries."""
+        delivered = 0
+        for conn in conns or ():
+            if await self._send(conn, content, channel, published_at):
+                delivered += 1
+            else:
+                self.disconnect_socket(conn.ws, "send_failed")
+        return delivered
+
+    async def _deliver_chat(self, data, content: str):
         target_type = data.get("target_type")
         target_id = data.get("target_id")
-        content = data.get("message")
+        published_at = data.get("published_at")
 
         if target_type == "employee":
-            emp_id = int(target_id)
-            if emp_id in self.employee_connections:
-                try:
-                    await self.employee_connections[emp_id].send_text(content)
-                except Exception:
-                    self.disconnect_employee(emp_id)
+            conns = self._scoped(self.employee_connections.get(int(target_id)), data)
+            skip_session = data.get("skip_session")
+            if conns and skip_session is not None:
+                # Sockets watching the session already got it as subscribers.
+                conns = [conn for conn in conns if not (conn.sessions and skip_session in conn.sessions)]
+            await self._fanout(conns, content, "chat_messages", published_at)
 
         elif target_type == "customer":
-            email = str(target_id)
-            if email in self.customer_connections:
-                try:
-                    await self.customer_connections[email].send_text(content)
-                except Exception:
-                    self.disconnect_customer(email)
+            await self._fanout(
+                self.customer_connections.get(str(target_id)), content, "chat_messages", published_at
+            )
 
         elif target_type == "session":
-            sid = int(target_id)
-            delivered = False
+            delivered = await self._fanout(
+                self.session_connections.get(int(target_id)), content, "chat_messages", published_at
+            )
 
-            if sid in self.session_connections:
-                try:
-                    await self.session_connections[sid].send_text(content)
-                    delivered = True
-                except Exception:
-                    self.session_connections.pop(sid, None)
-
-            # Fallback to customer connection if available
-            if not delivered and "customer_email" in data:
-                email = data["customer_email"]
-                if email in self.customer_connections:
-                    try:
-                        await self.customer_connections[email].send_text(content)
-                    except Exception:
-                        self.disconnect_customer(email)
-
-    async def _broadcast_employees_local(self, message: str):
-        for emp_id, ws in list(self.employee_connections.items()):
-            try:
-                await ws.send_text(message)
-            except Exception:
-                self.disconnect_employee(emp_id)
+            # Fallback to customer connections if available
+            email = data.get("customer_email")
+            if not delivered and email:
+                await self._fanout(self.customer_connections.get(email), content, "chat_messages", published_at)
 
-    async def _broadcast_shop_local(self, message: str, shop_id: int, exclude_employee_id: int = None):
-        for emp_id, ws in list(self.employee_connections.items()):
-            if exclude_employee_id is not None and emp_id == exclude_employee_id:
-                continue
-            if self.employee_shop_mapping.get(emp_id) == shop_id or emp_id in self.admin_connections:
-                try:
-                    await ws.send_text(message)
-                except Exception:
-                    self.disconnect_employee(emp_id)
+        elif target_type == "session_watchers":
+            conns = self._scoped(self.session_watchers.get(int(target_id)), data)
+            exclude_employee_id = data.get("exclude_employee_id")
+            if conns and exclude_employee_id is not None:
+                conns = [conn for conn in conns if conn.principal != exclude_employee_id]
+            await self._fanout(conns, content, "chat_messages", published_at)
+
+    @staticmethod
+    def _scoped(conns, data):
+        # Owned-shop events reach staff in-process and admins over Redis.
+        if conns and data.get("staff_only"):
+            return [conn for conn in conns if not conn.is_admin]
+        if conns and data.get("admins_only"):
+            return [conn for conn in conns if conn.is_admin]
+        return conns
+
+    async def _broadcast_employees_local(self, message: str, published_at: float = None):
+        for conns in list(self.employee_connections.values()):
+            await self._fanout(conns, message, "employee_notifications", published_at)
+
+    @staticmethod
+    def _admin_accepts(conn: Connection, shop_id: int, event_type: str = None, session_id: int = None) -> bool:
+        if conn.filter is None:
+            return event_type not in TYPING_EVENTS
+        return conn.filter.accepts(shop_id, event_type, session_id)
+
+    async def _broadcast_shop_local(
+        self,
+        message: str,
+        shop_id: int,
+        exclude_employee_id: int = None,
+        published_at: float = None,
+        event_type: str = None,
+        session_id: int = None,
+        admins_only: bool = False,
+        staff_only: bool = False,
+    ):
+        recipients = ConnectionSet()
+        if not admins_only:
+            for conn in self.shop_connections.get(shop_id, ()):
+                if not conn.is_admin:
+                    recipients.add(conn)
+        if not staff_only:
+            for conn in self.admin_connections:
+                if self._admin_accepts(conn, shop_id, event_type, session_id):
+                    recipients.add(conn)
+        if exclude_employee_id is not None:
+            for conn in self.employee_connections.get(exclude_employee_id, ()):
+                recipients.discard(conn)
+        await self._fanout(recipients, message, "session_notifications", published_at)
+
+    def _record_activity(self, shop_id: Optional[int], event_type: Optional[str]):
+        # Counted where events originate; run_stats shares the totals.
+        if shop_id is None or event_type is None:
+            return
+        counts = self._shop_activity.get(str(shop_id))
+        if counts is None:
+            counts = self._shop_activity[str(shop_id)] = {}
+        counts[event_type] = counts.get(event_type, 0) + 1
+
+    @staticmethod
+    def _merge_activity(into: Dict[str, Dict[str, int]], activity: Mapping):
+        for shop_id, counts in activity.items():
+            merged = into.setdefault(str(shop_id), {})
+            for event_type, count in counts.items():
+                merged[event_type] = merged.get(event_type, 0) + count
+
+    def _publish(self, channel: str, header: dict, frame: str):
+        self.bus.publish(channel, pack_envelope(header, frame))
+
+    # Admin presence: admin and manager sockets can be on any node, so an
+    # owned shop's events only go through Redis while some node holds one.
+    def _announce_admins(self, request: bool = False):
+        try:
+            self._publish(
+                STATS_CHANNEL,
+                {
+                    "notification_type": "admin_presence",
+                    "origin": self.node_id,
+                    "admins": bool(self.admin_connections),
+                    "request": request,
+                },
+                "",
+            )
+        except Exception as exc:
+            logger.warning("Failed to announce admin presence: %s", exc)
+
+    def _on_admin_presence(self, data: dict):
+        if data.get("admins"):
+            ttl = ADMIN_PRESENCE_INTERVALS * settings.ws_stats_interval
+            self._admin_nodes[data["origin"]] = time.monotonic() + ttl
+        else:
+            self._admin_nodes.pop(data["origin"], None)
+        if data.get("request") and self.admin_connections:
+            # A node just started and has not heard from us yet.
+            self._announce_admins()
+
+    def _admins_anywhere(self) -> bool:
+        if self.admin_connections:
+            return True
+        now = time.monotonic()
+        for node_id, expires_at in list(self._admin_nodes.items()):
+            if expires_at > now:
+                return True
+            del self._admin_nodes[node_id]
+        return False
+
+    # Channel subscriptions
+    def _admin_channels(self, conn: Connection):
+        if not conn.is_admin:
+            return []
+        shops = conn.filter.shops if conn.filter is not None else None
+        if shops is None:
+            return all_shards("shop")
+        return [shard_channel("shop", shop_id) for shop_id in shops]
+
+    def _channels(self, conn: Connection):
+        """Redis channels this connection needs the node to listen on."""
+        if conn.kind == "employee":
+            channels = [shard_channel("employee", conn.principal)]
+            if conn.shop_id is not None:
+                channels.append(shard_channel("shop", conn.shop_id))
+            channels.extend(self._admin_channels(conn))
+        else:
+            channels = [shard_channel("customer", conn.principal)]
+        channels.extend(shard_channel("session", sid) for sid in conn.sessions or ())
+        return channels
+
+    def _retain(self, channels):
+        if self.bus is not None:
+            self.bus.retain(channels)
+
+    def _release(self, channels):
+        if self.bus is not None:
+            self.bus.release(channels)
+
+    def _chat_channel(self, header: dict) -> str:
+        target_type = header["target_type"]
+        target_id = header["target_id"]
+        if target_type == "employee":
+            return shard_channel("employee", int(target_id))
+        if target_type == "customer":
+            return shard_channel("customer", str(target_id))
+        if target_type == "session" and header.get("customer_email"):
+            # The customer's node holds the session binding and the fallback.
+            return shard_channel("customer", header["customer_email"])
+        return shard_channel("session", int(target_id))
+
+    def _connection_counts(self):
+        return {
+            ("employee",): sum(len(c) for c in self.employee_connections.values()),
+            ("admin",): len(self.admin_connections),
+            ("customer",): sum(len(c) for c in self.customer_connections.values()),
+            ("session",): len(self.session_connections),
+            ("watched_session",): len(self.session_watchers),
+        }
 
     # Connection lifecycle
-    async def connect_employee(self, ws: WebSocket, employee_id: int, shop_id: int, is_admin: bool = False):
+    async def _accept(self, ws: WebSocket) -> str:
+        wire_protocol, subprotocol = protocol.negotiate(ws)
+        await ws.accept(subprotocol=subprotocol)
+        return wire_protocol
+
+    @staticmethod
+    def _connection(ws: WebSocket) -> Optional[Connection]:
+        return getattr(ws.state, "connection", None)
+
+    async def receive_json(self, ws: WebSocket) -> dict:
+        """Next application frame from ``ws``. Heartbeat frames only refresh
+        the socket's liveness and are not returned."""
+        conn = self._connection(ws)
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if conn is not None:
+                conn.last_seen = time.monotonic()
+            msg = protocol.decode(message)
+            msg_type = msg.get("type") if isinstance(msg, dict) else None
+            if msg_type == "pong":
+                continue
+            if msg_type == "ping":
+                if conn is not None:
+                    await self._send(conn, PONG_FRAME, "heartbeat")
+                continue
+            return msg
+
+    async def send_json(self, ws: WebSocket, payload: dict):
+        conn = self._connection(ws)
+        encoded = protocol.encode_payload(conn.protocol if conn else protocol.PROTOCOL_JSON, payload)
+        if isinstance(encoded, bytes):
+            await ws.send_bytes(encoded)
+        else:
+            await ws.send_text(encoded)
+
+    @staticmethod
+    def _index_add(index: dict, key, conn: Connection):
+        conns = index.get(key)
+        if conns is None:
+            conns = index[key] = ConnectionSet()
+        conns.add(conn)
+
+    @staticmethod
+    def _index_discard(index: dict, key, conn: Connection):
+        conns = index.get(key)
+        if conns is None:
+            return
+        conns.discard(conn)
+        if not conns:
+            del index[key]
+
+    def register(self, conn: Connection):
+        """Add an accepted connection to every index that applies to it."""
+        self.connections[conn.id] = conn
+        conn.ws.state.connection = conn
+        if conn.kind == "employee":
+            self._index_add(self.employee_connections, conn.principal, conn)
+            if conn.shop_id is not None:
+                self._index_add(self.shop_connections, conn.shop_id, conn)
+            if conn.is_admin:
+                self.admin_connections.add(conn)
+                if self.use_redis and len(self.admin_connections) == 1:
+                    self._announce_admins()
+        else:
+            self._index_add(self.customer_connections, conn.principal, conn)
+        self._retain(self._channels(conn))
+
+    def unregister(self, conn: Connection) -> bool:
+        """Remove ``conn`` from every index. False if it was already gone."""
+        if self.connections.pop(conn.id, None) is None:
+            return False
+        self._release(self._channels(conn))
+        if conn.kind == "employee":
+            self._index_discard(self.employee_connections, conn.principal, conn)
+            if conn.shop_id is not None:
+                self._index_discard(self.shop_connections, conn.shop_id, conn)
+            if conn.is_admin:
+                self.admin_connections.discard(conn)
+                if self.use_redis and not self.admin_connections:
+                    self._announce_admins()
+        else:
+            self._index_discard(self.customer_connections, conn.principal, conn)
+        index = self.session_watchers if conn.kind == "employee" else self.session_connections
+        for sid in conn.sessions or ():
+            self._index_discard(index, sid, conn)
+        conn.sessions = None
+        return True
+
+    async def connect_employee(
+        self,
+        ws: WebSocket,
+        employee_id: int,
+        shop_id: int,
+        is_admin: bool = False,
+        event_filter: Optional[EventFilter] = None,
+    ):
         self._ensure_main_loop()
-        await ws.accept()
-        self.employee_connections[employee_id] = ws
-        self.employee_shop_mapping[employee_id] = shop_id
+        wire_protocol = await self._accept(ws)
+        metrics.websocket_connects.inc("employee")
+        conn = Connection(
+            next(self._connection_ids), ws, "employee", employee_id,
+            shop_id=shop_id, is_admin=is_admin, wire_protocol=wire_protocol,
+        )
         if is_admin:
-            self.admin_connections.add(employee_id)
+            conn.filter = event_filter
+        self.register(conn)
 
-    async def connect_customer(self, ws: WebSocket, email: str, session_id: int = None):
+    async def connect_customer(self, ws: WebSocket, email: str, session_id: int = None, shop_id: int = None):
         self._ensure_main_loop()
-        await ws.accept()
-        self.customer_connections[email] = ws
+        wire_protocol = await self._accept(ws)
+        metrics.websocket_connects.inc("customer")
+        conn = Connection(
+            next(self._connection_ids), ws, "customer", email, shop_id=shop_id, wire_protocol=wire_protocol
+        )
+        self.register(conn)
         if session_id:
-            self.session_connections[session_id] = ws
+            self._bind(conn, session_id)
+
+    async def apply_affinity(self, ws: WebSocket, shop_id: Optional[int]) -> bool:
+        """Point a freshly connected socket at the node owning ``shop_id``.
+        Returns False if the socket was redirected and closed."""
+        owner = affinity.remote_owner(shop_id)
+        if owner is None:
+            return True
+        if affinity.mode == "redirect":
+            await self.send_json(ws, {"type": "redirect", "node": owner, "shop_id": shop_id})
+            self.disconnect_socket(ws, "redirected")
+            await ws.close(code=4307, reason="Reconnect to owning node")
+            return False
+        await self.send_json(ws, {"type": "affinity", "node": owner, "shop_id": shop_id})
+        return True
+
+    def _on_affinity_change(self, old_ring, new_ring):
+        # May run on the invalidation listener thread.
+        loop = self.main_loop
+        if loop and loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.rehome(), loop)
+
+    async def rehome(self):
+        """After a membership change, move sockets whose shop now belongs to
+        another node. In hint mode clients move on their next reconnect
+        rather than all at once; in redirect mode the new owner delivers the
+        shop's events in-process, so its sockets are redirected right away.
+        Admins and managers stay put, as on connect."""
+        for conn in list(self.connections.values()):
+            if conn.is_admin:
+                continue
+            owner = affinity.remote_owner(conn.shop_id)
+            if owner is None:
+                continue
+            if affinity.mode == "redirect":
+                frame = dumps_str({"type": "redirect", "node": owner, "shop_id": conn.shop_id})
+                await self._send(conn, frame, "affinity")
+                self.disconnect_socket(conn.ws, "redirected")
+                try:
+                    await asyncio.wait_for(conn.ws.close(code=4307, reason="Reconnect to owning node"), timeout=5)
+                except Exception:
+                    pass
+                continue
+            frame = dumps_str({"type": "affinity", "node": owner, "shop_id": conn.shop_id})
+            if not await self._send(conn, frame, "affinity"):
+                self.disconnect_socket(conn.ws, "send_failed")
+
+    def _bind(self, conn: Connection, session_id: int):
+        if conn.sessions is None:
+            conn.sessions = set()
+        if session_id not in conn.sessions:
+            conn.sessions.add(session_id)
+            self._index_add(self.session_connections, session_id, conn)
+            self._retain([shard_channel("session", session_id)])
+
+    def bind_session(self, ws: WebSocket, session_id: int):
+        """Route messages for ``session_id`` to this customer socket."""
+        conn = self._connection(ws)
+        if conn is not None and conn.id in self.connections:
+            self._bind(conn, session_id)
+
+    def bind_customer_sessions(self, email: str, session_id: int):
+        """Route ``session_id`` to every open socket of customer ``email``."""
+        for conn in self.customer_connections.get(email, ()):
+            self._bind(conn, session_id)
+
+    def unbind_session(self, session_id: int):
+        """Forget every customer binding and employee subscription for a
+        session, e.g. once it is closed."""
+        channel = shard_channel("session", session_id)
+        for index in (self.session_connections, self.session_watchers):
+            for conn in index.pop(session_id, ()):
+                conn.sessions.discard(session_id)
+                self._release([channel])
+
+    def subscribe(self, ws: WebSocket, session_id: int) -> bool:
+        """Deliver messages and typing for ``session_id`` to this employee
+        socket. False if the socket already watches the maximum number of
+        sessions."""
+        conn = self._connection(ws)
+        if conn is None or conn.kind != "employee" or conn.id not in self.connections:
+            return False
+        if conn.sessions is None:
+            conn.sessions = set()
+        if session_id in conn.sessions:
+            return True
+        if len(conn.sessions) >= settings.ws_max_subscriptions:
+            return False
+        conn.sessions.add(session_id)
+        self._index_add(self.session_watchers, session_id, conn)
+        self._retain([shard_channel("session", session_id)])
+        return True
+
+    def unsubscribe(self, ws: WebSocket, session_id: int):
+        conn = self._connection(ws)
+        if conn is None or conn.kind != "employee" or not conn.sessions:
+            return
+        if session_id in conn.sessions:
+            conn.sessions.discard(session_id)
+            self._index_discard(self.session_watchers, session_id, conn)
+            self._release([shard_channel("session", session_id)])
+
+    def set_filter(self, ws: WebSocket, event_filter: Optional[EventFilter]) -> bool:
+        """Apply ``event_filter`` to an admin/manager socket; other employees
+        are already scoped to their shop."""
+        conn = self._connection(ws)
+        if conn is None or not conn.is_admin:
+            return False
+        registered = conn.id in self.connections
+        if registered:
+            self._release(self._admin_channels(conn))
+        conn.filter = event_filter
+        if registered:
+            self._retain(self._admin_channels(conn))
+        return True
 
     def disconnect_employee(self, employee_id: int):
-        self.employee_connections.pop(employee_id, None)
-        self.employee_shop_mapping.pop(employee_id, None)
-        self.admin_connections.discard(employee_id)
+        for conn in self.employee_connections.get(employee_id, ()):
+            self.disconnect_socket(conn.ws)
 
     def disconnect_customer(self, email: str, session_id: int = None):
-        self.customer_connections.pop(email, None)
+        for conn in self.customer_connections.get(email, ()):
+            self.disconnect_socket(conn.ws)
         if session_id:
-            self.session_connections.pop(session_id, None)
+            self.unbind_session(session_id)
+
+    def disconnect_socket(self, ws: WebSocket, reason: str = "closed"):
+        """Remove ``ws`` from every index it appears in. Other sockets of the
+        same principal stay connected."""
+        conn = self._connection(ws)
+        if conn is not None and self.unregister(conn):
+            metrics.websocket_disconnects.inc(conn.kind, reason)
+
+    async def _heartbeat_socket(self, conn: Connection, now: float, timeout: float):
+        if now - conn.last_seen > timeout:
+            self.disconnect_socket(conn.ws, "reaped")
+            try:
+                await asyncio.wait_for(conn.ws.close(code=4408, reason="Heartbeat timeout"), timeout=5)
+            except Exception:
+                pass
+        elif not await self._send(conn, PING_FRAME, "heartbeat"):
+            self.disconnect_socket(conn.ws, "send_failed")
+
+    async def run_heartbeat(self, interval: float, timeout: float):
+        """Ping every socket each ``interval`` seconds and reap those that
+        have not sent anything (including pongs) for ``timeout`` seconds."""
+        self._ensure_main_loop()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            conns = list(self.connections.values())
+            if conns:
+                await asyncio.gather(
+                    *(self._heartbeat_socket(conn, now, timeout) for conn in conns),
+                    return_exceptions=True,
+                )
+
+    async def run_stats(self, interval: float):
+        """Every ``interval`` seconds, push per-shop event counts for the
+        elapsed window to admin sockets whose filter asks for stats."""
+        self._ensure_main_loop()
+        while True:
+            await asyncio.sleep(interval)
+            local, self._shop_activity = self._shop_activity, {}
+            if self.use_redis and self.admin_connections:
+                self._announce_admins()
+            if self.use_redis and local:
+                # Other nodes only see events they deliver, so share ours.
+                self._publish(
+                    STATS_CHANNEL,
+                    {"notification_type": "shop_stats", "origin": self.node_id, "activity": local},
+                    "",
+                )
+            activity, self._remote_activity = self._remote_activity, {}
+            self._merge_activity(activity, local)
+            for conn in list(self.admin_connections):
+                if conn.filter is None or not conn.filter.stats:
+                    continue
+                shops = conn.filter.shops
+                frame = dumps_str({
+                    "type": "shop_stats",
+                    "interval": interval,
+                    "shops": {
+                        shop_id: counts for shop_id, counts in activity.items()
+                        if shops is None or int(shop_id) in shops
+                    },
+                })
+                if not await self._send(conn, frame, "shop_stats"):
+                    self.disconnect_socket(conn.ws, "send_failed")
+
+    # Graceful drain
+    async def reject_if_draining(self, ws: WebSocket) -> bool:
+        """Refuse new sockets once draining; True if ``ws`` was refused."""
+        if not self.draining:
+            return False
+        metrics.websocket_disconnects.inc("pending", "draining")
+        await ws.close(code=1013, reason="Server draining, try again later")
+        return True
+
+    def start_drain(self) -> asyncio.Task:
+        """Begin draining with the configured settings; idempotent."""
+        self._ensure_main_loop()
+        if self._drain_task is None:
+            self._drain_task = asyncio.ensure_future(self.drain(
+                timeout=settings.ws_drain_timeout,
+                batch_size=settings.ws_drain_batch_size,
+                batch_interval=settings.ws_drain_batch_interval,
+                backoff_min=settings.ws_reconnect_backoff_min,
+                backoff_max=settings.ws_reconnect_backoff_max,
+            ))
+        return self._drain_task
+
+    async def drain(
+        self,
+        timeout: float,
+        batch_size: int,
+        batch_interval: float,
+        backoff_min: float,
+        backoff_max: float,
+    ) -> int:
+        """Close every socket without a reconnect stampede.
+
+        New sockets are refused, each client is told to reconnect after a
+        random delay in [backoff_min, backoff_max], queued frames get up to
+        ``timeout`` seconds to flush, and sockets are then closed
+        ``batch_size`` at a time. Returns the number of sockets drained.
+        """
+        self.draining = True
+        conns = list(self.connections.values())
+        logger.info("Draining %d WebSocket connections", len(conns))
+        for conn in conns:
+            retry_after_ms = int(random.uniform(backoff_min, backoff_max) * 1000)
+            await self._send(conn, dumps_str({"type": "reconnect", "retry_after_ms": retry_after_ms}), "drain")
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(
+            conn.outbound is not None for conn in self.connections.values()
+        ):
+            await asyncio.sleep(0.05)
+
+        for start in range(0, len(conns), batch_size):
+            batch = conns[start:start + batch_size]
+            for conn in batch:
+                self.disconnect_socket(conn.ws, "drained")
+            await asyncio.gather(
+                *(conn.ws.close(code=1012, reason="Server restarting") for conn in batch),
+                return_exceptions=True,
+            )
+            if start + batch_size < len(conns):
+                await asyncio.sleep(batch_interval)
+        return len(conns)
 
     # Publishing via Redis with fallback
     async def send_to_employee(self, message: str, employee_id: int):
-        if self.use_redis:
-            self.redis_client.publish(
-                "chat_messages",
-                json.dumps({"target_type": "employee", "target_id": employee_id, "message": message}),
-            )
-        else:
-            await self._deliver_chat({"target_type": "employee", "target_id": employee_id, "message": message})
+        await self._dispatch_chat({"target_type": "employee", "target_id": employee_id}, message)
 
     async def send_to_customer(self, message: str, email: str):
-        if self.use_redis:
-            self.redis_client.publish(
-                "chat_messages",
-                json.dumps({"target_type": "customer", "target_id": email, "message": message}),
-            )
-        else:
-            await self._deliver_chat({"target_type": "customer", "target_id": email, "message": message})
+        await self._dispatch_chat({"target_type": "customer", "target_id": email}, message)
 
     async def send_to_session(self, message: str, session_id: int, customer_email: str = None):
-        if self.use_redis:
-            payload = {"target_type": "session", "target_id": session_id, "message": message}
-            if customer_email:
-                payload["customer_email"] = customer_email
-            self.redis_client.publish("chat_messages", json.dumps(payload))
-        else:
-            await self._deliver_chat({
-                "target_type": "session",
-                "target_id": session_id,
-                "customer_email": customer_email,
-                "message": message,
-            })
+        header = {"target_type": "session", "target_id": session_id}
+        if customer_email:
+            header["customer_email"] = customer_email
+        await self._dispatch_chat(header, message)
+
+    async def send_to_session_staff(
+        self,
+        message: str,
+        session_id: int,
+        employee_id: int = None,
+        exclude_employee_id: int = None,
+        shop_id: int = None,
+        event_type: str = None,
+    ):
+        """Send to the session's assigned agent and its subscribers only,
+        instead of every employee in the shop. ``shop_id`` lets the shop's
+        owning node deliver in-process; with ``event_type`` it also counts
+        the event towards that shop's stats."""
+        self._record_activity(shop_id, event_type)
+        header = {"target_type": "session_watchers", "target_id": session_id}
+        if exclude_employee_id is not None:
+            header["exclude_employee_id"] = exclude_employee_id
+        await self._dispatch_chat(header, message, shop_id)
+        if employee_id is not None and employee_id != exclude_employee_id:
+            await self._dispatch_chat(
+                {"target_type": "employee", "target_id": employee_id, "skip_session": session_id}, message, shop_id
+            )
+
+    async def _dispatch_chat(self, header: dict, message: str, shop_id: int = None):
+        header["published_at"] = time.time()
+        metrics.messages_published.inc("chat_messages")
+        if not self.use_redis:
+            await self._deliver_chat(header, message)
+            return
+        if header["target_type"] in SHOP_SCOPED_TARGETS and affinity.owns(shop_id):
+            # Every non-admin recipient is on this node; admins may not be.
+            await self._deliver_chat({**header, "staff_only": True}, message)
+            if not self._admins_anywhere():
+                return
+            header["admins_only"] = True
+        self._publish(self._chat_channel(header), header, message)
 
     async def broadcast_to_employees(self, message: str):
+        published_at = time.time()
+        metrics.messages_published.inc("employee_notifications")
         if self.use_redis:
-            self.redis_client.publish(
-                "employee_notifications", json.dumps({"message": message})
+            self._publish(
+                EMPLOYEES_CHANNEL,
+                {"notification_type": "broadcast_to_employees", "published_at": published_at},
+                message,
             )
         else:
-            await self._broadcast_employees_local(message)
+            await self._broadcast_employees_local(message, published_at=published_at)
 
-    async def broadcast_to_shop_employees(self, message: str, shop_id: int, exclude_employee_id: int = None):
+    async def broadcast_to_shop_employees(
+        self,
+        message: str,
+        shop_id: int,
+        exclude_employee_id: int = None,
+        event_type: str = None,
+        session_id: int = None,
+        admins_only: bool = False,
+    ):
+        """Send to the shop's employees and to admins/managers whose filters
+        accept ``event_type``. ``admins_only`` skips the shop's own staff."""
+        self._record_activity(shop_id, event_type)
+        published_at = time.time()
+        metrics.messages_published.inc("session_notifications")
+        if self.use_redis and affinity.owns(shop_id):
+            # The shop's staff is all on this node; only admins need Redis.
+            if not admins_only:
+                await self._broadcast_shop_local(
+                    message,
+                    shop_id,
+                    exclude_employee_id,
+                    published_at=published_at,
+                    event_type=event_type,
+                    session_id=session_id,
+                    staff_only=True,
+                )
+            if not self._admins_anywhere():
+                return
+            admins_only = True
         if self.use_redis:
-            self.redis_client.publish(
-                "session_notifications",
-                json.dumps(
-                    {
-                        "notification_type": "broadcast_to_shop",
-                        "shop_id": shop_id,
-                        "message": message,
-                        "exclude_employee_id": exclude_employee_id,
-                    }
-                ),
+            self._publish(
+                shard_channel("shop", shop_id),
+                {
+                    "notification_type": "broadcast_to_shop",
+                    "shop_id": shop_id,
+                    "exclude_employee_id": exclude_employee_id,
+                    "event_type": event_type,
+                    "session_id": session_id,
+                    "admins_only": admins_only,
+                    "published_at": published_at,
+                },
+                message,
             )
         else:
-            await self._broadcast_shop_local(message, shop_id, exclude_employee_id)
+            await self._broadcast_shop_local(
+                message,
+                shop_id,
+                exclude_employee_id,
+                published_at=published_at,
+                event_type=event_type,
+                session_id=session_id,
+                admins_only=admins_only,
+            )
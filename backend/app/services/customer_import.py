@@ -0,0 +1,166 @@
+"""Bulk customer import from CSV or NDJSON uploads.
+
+The upload is parsed row by row from the spooled request file and valid rows
+are merged in batches of ``import_batch_size`` (crud.merge_customers: COPY
+into a staging table, then INSERT ... ON CONFLICT (email) on PostgreSQL), one
+transaction per batch. Invalid rows are skipped and reported by line number.
+"""
+import csv
+import io
+import json
+import re
+from typing import BinaryIO, Iterator, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.config import settings
+from app.services.session_cache import session_cache
+
+NAME_MAX_LENGTH = 100
+EMAIL_MAX_LENGTH = 100
+# Deliberately loose: full RFC/DNS validation costs more than the rest of the
+# import per row. Domains are lower-cased, as EmailStr does on the
+# single-row endpoint.
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+# Above this many renamed customers, drop the whole session cache instead of
+# invalidating customer by customer.
+INVALIDATE_EACH_MAX = 100
+
+ImportRow = Tuple[int, str, str]
+
+
+class ImportFormatError(ValueError):
+    """The upload as a whole cannot be read (as opposed to a bad row)."""
+
+
+class ImportReport:
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "errors_truncated": self.error_count > len(self.errors),
+        }
+
+
+def detect_format(filename: str, content_type: str) -> str:
+    name, content_type = (filename or "").lower(), (content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+def _validate(line: int, name, email, report: ImportReport):
+    if not isinstance(name, str) or not name.strip():
+        report.error(line, "name is required")
+        return None
+    if not isinstance(email, str) or not email.strip():
+        report.error(line, "email is required")
+        return None
+    name, email = name.strip(), email.strip()
+    if len(name) > NAME_MAX_LENGTH:
+        report.error(line, f"name is longer than {NAME_MAX_LENGTH} characters")
+        return None
+    if len(email) > EMAIL_MAX_LENGTH or not EMAIL_PATTERN.fullmatch(email):
+        report.error(line, "email is not a valid address")
+        return None
+    local, _, domain = email.rpartition("@")
+    return line, name, f"{local}@{domain.lower()}"
+
+
+def _csv_rows(text: io.TextIOBase, report: ImportReport) -> Iterator[ImportRow]:
+    reader = csv.reader(text)
+    try:
+        header = [column.strip().lower() for column in next(reader)]
+    except StopIteration:
+        return
+    except csv.Error as exc:
+        raise ImportFormatError(f"Unreadable CSV header: {exc}") from exc
+    if "name" not in header or "email" not in header:
+        raise ImportFormatError("CSV header must include name and email columns")
+    name_index, email_index = header.index("name"), header.index("email")
+    width = max(name_index, email_index) + 1
+
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            report.error(reader.line_num, f"malformed CSV: {exc}")
+            continue
+        if not record:
+            continue
+        if len(record) < width:
+            report.error(reader.line_num, "missing columns")
+            continue
+        row = _validate(reader.line_num, record[name_index], record[email_index], report)
+        if row:
+            yield row
+
+
+def _ndjson_rows(text: io.TextIOBase, report: ImportReport) -> Iterator[ImportRow]:
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            report.error(line, "invalid JSON")
+            continue
+        if not isinstance(record, dict):
+            report.error(line, "expected a JSON object")
+            continue
+        row = _validate(line, record.get("name"), record.get("email"), report)
+        if row:
+            yield row
+
+
+def import_customers(db: Session, upload: BinaryIO, fmt: str, update_existing: bool = True) -> dict:
+    """Import customers from ``upload``; raises ImportFormatError if the file
+    cannot be read at all."""
+    report = ImportReport(settings.import_max_errors)
+    text = io.TextIOWrapper(upload, encoding="utf-8-sig", errors="replace", newline="" if fmt == "csv" else None)
+    rows = _csv_rows(text, report) if fmt == "csv" else _ndjson_rows(text, report)
+
+    renamed: List[int] = []
+    batch: List[ImportRow] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= settings.import_batch_size:
+            _merge(db, batch, update_existing, report, renamed)
+            batch = []
+    if batch:
+        _merge(db, batch, update_existing, report, renamed)
+
+    if len(renamed) > INVALIDATE_EACH_MAX:
+        session_cache.invalidate_all()
+    else:
+        for customer_id in renamed:
+            session_cache.invalidate_customer(customer_id)
+    return report.as_dict()
+
+
+def _merge(db: Session, batch: List[ImportRow], update_existing: bool, report: ImportReport, renamed: List[int]):
+    inserted, updated_ids = crud.merge_customers(db, batch, update_existing)
+    report.inserted += inserted
+    report.updated += len(updated_ids)
+    report.unchanged += len(batch) - inserted - len(updated_ids)
+    if len(renamed) <= INVALIDATE_EACH_MAX:
+        renamed.extend(updated_ids)
@@ -0,0 +1,82 @@
+"""Recently seen client message ids, the fast path for idempotent sends.
+
+Clients tag chat messages with a ``client_msg_id`` and resend them after a
+reconnect until they are acked. The unique (session_id, client_msg_id) index
+on chat_messages is what guarantees one row per id; this short-lived map
+from id to the stored message id lets most retries be acked without
+touching the database. Entries live in Redis when it is reachable, so a
+retry that lands on another node is still recognised, and in a bounded
+in-memory map otherwise.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.config import settings
+from app.services.pubsub import CHANNEL_PREFIX, create_client
+
+logger = logging.getLogger(__name__)
+
+
+def _key(session_id: int, client_msg_id: str) -> str:
+    return f"{CHANNEL_PREFIX}:seen:{session_id}:{client_msg_id}"
+
+
+class SeenMessages:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, int]]" = OrderedDict()
+        self._redis = None
+        self._redis_checked = False
+
+    def _client(self):
+        with self._lock:
+            if not self._redis_checked:
+                self._redis_checked = True
+                try:
+                    client = create_client()
+                    client.ping()
+                    self._redis = client
+                except Exception as exc:
+                    logger.warning("Message dedup is local-only, Redis unavailable: %s", exc)
+            return self._redis
+
+    def get(self, session_id: int, client_msg_id: str) -> Optional[int]:
+        """Id of the message already stored for ``client_msg_id``, if seen
+        recently. A miss is not proof of novelty; the unique index decides."""
+        client = self._client()
+        if client is not None:
+            try:
+                value = client.get(_key(session_id, client_msg_id))
+                return int(value) if value is not None else None
+            except Exception as exc:
+                logger.warning("Message dedup lookup failed: %s", exc)
+                return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((session_id, client_msg_id))
+            if entry is None or entry[0] <= now:
+                return None
+            return entry[1]
+
+    def add(self, session_id: int, client_msg_id: str, message_id: int):
+        client = self._client()
+        if client is not None:
+            try:
+                client.set(_key(session_id, client_msg_id), message_id, ex=int(self.ttl))
+            except Exception as exc:
+                logger.warning("Message dedup store failed: %s", exc)
+            return
+        key = (session_id, client_msg_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, message_id)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+seen_messages = SeenMessages(ttl=settings.message_dedup_ttl, max_entries=settings.message_dedup_max_entries)
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Exposition lines for this metric, header included."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        # Plain dict updates: counters are bumped from the event loop, so the
+        # GIL is enough and we avoid a lock on every message.
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], object]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function = function
+
+    def set(self, value: float, *labelvalues):
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) - amount
+
+    def set_function(self, function: Callable[[], object]):
+        """Compute the gauge at scrape time. ``function`` returns a number, or a
+        dict of label-value tuples to numbers for labelled gauges."""
+        self._function = function
+
+    def value(self, *labelvalues) -> float:
+        return self._collect().get(labelvalues, 0)
+
+    def _collect(self) -> Dict[LabelValues, float]:
+        if self._function is None:
+            return dict(self._values)
+        try:
+            result = self._function()
+        except Exception as exc:
+            logger.warning("Gauge %s collection failed: %s", self.name, exc)
+            return {}
+        if isinstance(result, dict):
+            return result
+        return {(): result}
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in self._collect().items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labelvalues) -> int:
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+
+# WebSocket / pub-sub
+websocket_connections = registry.gauge(
+    "websocket_connections", "Open WebSocket connections on this node", ("kind",)
+)
+websocket_connects = registry.counter(
+    "websocket_connects_total", "Accepted WebSocket connections", ("kind",)
+)
+websocket_disconnects = registry.counter(
+    "websocket_disconnects_total", "WebSocket connections removed by reason", ("kind", "reason")
+)
+messages_published = registry.counter(
+    "chat_messages_published_total", "Envelopes published per channel", ("channel",)
+)
+messages_delivered = registry.counter(
+    "chat_messages_delivered_total", "Frames written to local sockets per channel", ("channel",)
+)
+messages_dropped = registry.counter(
+    "chat_messages_dropped_total", "Frames that failed to send per channel", ("channel",)
+)
+delivery_lag = registry.histogram(
+    "chat_delivery_lag_seconds",
+    "Time from publish to send_text completing",
+    ("channel",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Database
+db_pool_connections = registry.gauge(
+    "db_pool_connections", "SQLAlchemy pool connections by state", ("state",)
+)
+
+# Event loop
+event_loop_lag = registry.gauge("event_loop_lag_seconds", "Most recent event loop scheduling lag")
+event_loop_lag_histogram = registry.histogram(
+    "event_loop_lag_distribution_seconds",
+    "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Sample loop lag when the watchdog, whose heartbeat normally feeds
+    these metrics, is disabled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        event_loop_lag.set(lag)
+        event_loop_lag_histogram.observe(lag)
+
+
+def observe_pool(engine):
+    def _collect():
+        pool = engine.pool
+        stats = {}
+        for state, attr in (("checked_out", "checkedout"), ("overflow", "overflow"), ("size", "size")):
+            fn = getattr(pool, attr, None)
+            if fn is not None:
+                stats[(state,)] = fn()
+        # QueuePool reports overflow as negative until the base pool is full.
+        if ("overflow",) in stats:
+            stats[("overflow",)] = max(0, stats[("overflow",)])
+        return stats
+
+    db_pool_connections.set_function(_collect)
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
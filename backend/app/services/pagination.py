@@ -0,0 +1,25 @@
+"""Opaque keyset-pagination cursors.
+
+A cursor is the sort key of the last row on a page, serialized and
+base64url-encoded so clients treat it as a token rather than building it.
+"""
+import base64
+import binascii
+
+from app.services.serialization import dumps, loads
+
+
+def encode_cursor(values: dict) -> str:
+    return base64.urlsafe_b64encode(dumps(values)).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Raises ValueError for anything that is not a cursor we issued."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, dict):
+        raise ValueError("Invalid cursor")
+    return values
@@ -6,23 +6,31 @@ from app import models
 logger = logging.getLogger(__name__)
 
 
+# Read-only resources, and the built-in roles that get a permission when it is
+# first added to an existing installation.
+READ_ONLY_RESOURCES = ["analytics"]
+GRANTS_ON_CREATE = {"read_analytics": ("admin", "manager")}
+
+
 def create_default_permissions(db: Session):
     resources = ["shop", "employee", "team", "role", "chat", "permission", "customer"]
     actions = ["create", "read", "update", "delete"]
+    pairs = [(resource, action) for resource in resources for action in actions]
+    pairs += [(resource, "read") for resource in READ_ONLY_RESOURCES]
 
-    for resource in resources:
-        for action in actions:
-            name = f"{action}_{resource}"
-            exists = db.query(models.Permission).filter(models.Permission.name == name).first()
-            if not exists:
-                db.add(
-                    models.Permission(
-                        name=name,
-                        description=f"Permission to {action} {resource}",
-                        resource=resource,
-                        action=action,
-                    )
-                )
+    for resource, action in pairs:
+        name = f"{action}_{resource}"
+        exists = db.query(models.Permission).filter(models.Permission.name == name).first()
+        if not exists:
+            permission = models.Permission(
+                name=name,
+                description=f"Permission to {action} {resource}",
+                resource=resource,
+                action=action,
+            )
+            db.add(permission)
+            for role in db.query(models.Role).filter(models.Role.name.in_(GRANTS_ON_CREATE.get(name, ()))):
+                role.permissions.append(permission)
     db.commit()
     logger.info("Default permissions ensured")
 
@@ -52,7 +60,7 @@ def create_default_roles(db: Session):
                         "create_employee", "read_employee", "update_employee",
                         "create_team", "read_team", "update_team", "delete_team",
                         "create_chat", "read_chat", "update_chat",
-                        "read_customer",
+                        "read_customer", "read_analytics",
                     ]
                 )
             )
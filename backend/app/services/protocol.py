@@ -0,0 +1,89 @@
+"""WebSocket wire protocols.
+
+JSON text frames remain the default. Clients may offer the
+``resolvify.msgpack.v2`` subprotocol (or pass ``?protocol=msgpack``) to receive
+MessagePack binary frames whose keys are replaced by the short codes in
+FIELD_CODES. Transport compression (permessage-deflate) is negotiated by the
+server independently of the protocol chosen here.
+"""
+from typing import Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+from app.services.serialization import dumps_str, loads
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the environment
+    msgpack = None
+
+PROTOCOL_JSON = "resolvify.json.v1"
+PROTOCOL_MSGPACK = "resolvify.msgpack.v2"
+
+FIELD_CODES = {
+    "type": "t",
+    "id": "i",
+    "session_id": "s",
+    "message": "m",
+    "from": "f",
+    "timestamp": "ts",
+    "customer_email": "ce",
+    "customer_name": "cn",
+    "agent_name": "an",
+    "shop_id": "sh",
+    "shop_name": "sn",
+}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+
+
+def available_protocols():
+    return [PROTOCOL_JSON] + ([PROTOCOL_MSGPACK] if msgpack is not None else [])
+
+
+def negotiate(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """Pick the wire protocol for a connecting socket. Returns the protocol and
+    the subprotocol to echo in the handshake, if the client offered one."""
+    offered = list(websocket.scope.get("subprotocols") or [])
+    wants_msgpack = PROTOCOL_MSGPACK in offered or websocket.query_params.get("protocol") == "msgpack"
+    if wants_msgpack and msgpack is not None:
+        return PROTOCOL_MSGPACK, PROTOCOL_MSGPACK if PROTOCOL_MSGPACK in offered else None
+    return PROTOCOL_JSON, PROTOCOL_JSON if PROTOCOL_JSON in offered else None
+
+
+def _shorten(value):
+    if isinstance(value, dict):
+        return {FIELD_CODES.get(k, k): _shorten(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shorten(v) for v in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        return {FIELD_NAMES.get(k, k): _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+def encode(protocol: str, frame: str) -> Union[str, bytes]:
+    """Convert a serialized JSON frame to the socket's wire format."""
+    if protocol == PROTOCOL_MSGPACK:
+        return msgpack.packb(_shorten(loads(frame)), use_bin_type=True)
+    return frame
+
+
+def encode_payload(protocol: str, payload: dict) -> Union[str, bytes]:
+    if protocol == PROTOCOL_MSGPACK:
+        return msgpack.packb(_shorten(payload), use_bin_type=True)
+    return dumps_str(payload)
+
+
+def decode(message: dict) -> dict:
+    """Decode an ASGI ``websocket.receive`` message from either protocol."""
+    data = message.get("bytes")
+    if data is not None:
+        if msgpack is None:
+            raise ValueError("Binary frames require msgpack")
+        return _expand(msgpack.unpackb(data, raw=False))
+    return loads(message.get("text") or "")
@@ -0,0 +1,159 @@
+"""Sharded Redis pub/sub for cross-node WebSocket delivery.
+
+Traffic is published on per-shard channels (``resolvify:<kind>:<shard>``)
+keyed by shop, session, employee or customer, and each node subscribes only
+to the shards its local sockets need. Against a Redis Cluster the sharded
+pub/sub commands (SPUBLISH/SSUBSCRIBE) are used, so channels spread over the
+cluster's primaries instead of every message being broadcast cluster-wide.
+"""
+import logging
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Optional, Set
+
+import redis
+from redis.cluster import RedisCluster
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "resolvify"
+EMPLOYEES_CHANNEL = f"{CHANNEL_PREFIX}:employees"
+STATS_CHANNEL = f"{CHANNEL_PREFIX}:stats"
+
+
+def shard_channel(kind: str, key) -> str:
+    """Channel carrying traffic for ``key`` (a shop/session/employee id or a
+    customer email)."""
+    shards = settings.redis_channel_shards
+    if isinstance(key, int):
+        shard = key % shards
+    else:
+        shard = zlib.crc32(str(key).encode("utf-8")) % shards
+    return f"{CHANNEL_PREFIX}:{kind}:{shard}"
+
+
+def all_shards(kind: str):
+    return [f"{CHANNEL_PREFIX}:{kind}:{shard}" for shard in range(settings.redis_channel_shards)]
+
+
+def create_client():
+    if settings.redis_cluster:
+        return RedisCluster(host=settings.redis_host, port=settings.redis_port, decode_responses=True)
+    return redis.Redis(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=settings.redis_db,
+        decode_responses=True,
+    )
+
+
+class ChannelBus:
+    """Reference-counted channel subscriptions on one listener thread.
+
+    ``retain``/``release`` are called from the event loop as sockets come and
+    go; the listener thread applies the resulting (un)subscribes between
+    polls, since redis-py pub/sub connections are not thread-safe.
+    """
+
+    def __init__(self, client, sharded: bool = False, poll_interval: float = 0.1):
+        self.client = client
+        self.sharded = sharded
+        self.poll_interval = poll_interval
+        self._refs: Dict[str, int] = {}
+        self._pending: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def publish(self, channel: str, data: str):
+        if self.sharded:
+            self.client.spublish(channel, data)
+        else:
+            self.client.publish(channel, data)
+
+    def retain(self, channels: Iterable[str]):
+        with self._lock:
+            for channel in channels:
+                count = self._refs.get(channel, 0)
+                self._refs[channel] = count + 1
+                if count == 0:
+                    self._pending[channel] = True
+
+    def release(self, channels: Iterable[str]):
+        with self._lock:
+            for channel in channels:
+                count = self._refs.get(channel, 0)
+                if count > 1:
+                    self._refs[channel] = count - 1
+                elif count == 1:
+                    del self._refs[channel]
+                    self._pending[channel] = False
+
+    def channels(self) -> Set[str]:
+        with self._lock:
+            return set(self._refs)
+
+    def _take_pending(self) -> Dict[str, bool]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def start(
+        self,
+        on_message: Callable[[dict], None],
+        on_reconnect: Optional[Callable[[], None]] = None,
+        name: str = "redis-pubsub",
+    ):
+        """``on_reconnect`` runs on the listener thread once the channels are
+        resubscribed after a connection error; messages published while
+        disconnected were lost."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, args=(on_message, on_reconnect), name=name, daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, on_message: Callable[[dict], None], on_reconnect: Optional[Callable[[], None]]):
+        pubsub = self.client.pubsub()
+        active: Set[str] = set()
+        reconnected = False
+        while True:
+            try:
+                pending = self._take_pending()
+                subscribe = [ch for ch, on in pending.items() if on and ch not in active]
+                unsubscribe = [ch for ch, on in pending.items() if not on and ch in active]
+                if subscribe:
+                    (pubsub.ssubscribe if self.sharded else pubsub.subscribe)(*subscribe)
+                    active.update(subscribe)
+                    if reconnected:
+                        reconnected = False
+                        if on_reconnect is not None:
+                            on_reconnect()
+                if unsubscribe:
+                    (pubsub.sunsubscribe if self.sharded else pubsub.unsubscribe)(*unsubscribe)
+                    active.difference_update(unsubscribe)
+                if not active:
+                    time.sleep(self.poll_interval)
+                    continue
+                if self.sharded:
+                    message = pubsub.get_sharded_message(timeout=self.poll_interval)
+                else:
+                    message = pubsub.get_message(timeout=self.poll_interval)
+                if message and message["type"] in ("message", "smessage"):
+                    on_message(message)
+            except Exception as exc:
+                logger.error("Redis listener error, resubscribing: %s", exc)
+                time.sleep(1)
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+                pubsub = self.client.pubsub()
+                active = set()
+                reconnected = True
+                with self._lock:
+                    for channel in self._refs:
+                        self._pending.setdefault(channel, True)
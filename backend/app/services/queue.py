@@ -0,0 +1,315 @@
+"""Per-shop queue of waiting chat sessions, for position and ETA feedback.
+
+Each shop's waiting sessions live in a Redis sorted set
+(``resolvify:queue:<shop_id>``) scored by session id, so creation order is
+queue order and a position is one ZRANK. Without Redis a sorted list per shop
+gives the same O(log n) lookups on a single node. crud.chat maintains it on
+create, assign and close; the database stays the source of truth.
+``reconcile`` diffs the queues against its waiting sessions at startup and
+every ``queue_reconcile_interval`` seconds, adding sessions a failed or lost
+write left out and dropping sessions that are no longer waiting. The Redis
+queues are shared with live nodes, so one node per interval does the pass
+(whoever sets the expiring ``queue-reconciled`` marker), and a lookup that
+misses patches a waiting session back in between passes.
+
+The ETA divides a customer's position by the shop's service rate: sessions
+assigned during the last ``queue_rate_window`` seconds. Removing a session
+only moves the sessions behind it, so changes are recorded as "dirty from
+rank r" per shop and ``run_notifier`` pushes a ``queue_position`` frame to
+just those customers, coalescing bursts of assignments.
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.services.pubsub import CHANNEL_PREFIX, create_client
+from app.services.serialization import dumps_str
+
+logger = logging.getLogger(__name__)
+
+
+def _queue_key(shop_id: int) -> str:
+    return f"{CHANNEL_PREFIX}:queue:{shop_id}"
+
+
+def _served_key(shop_id: int) -> str:
+    return f"{CHANNEL_PREFIX}:queue:{shop_id}:served"
+
+
+# Held for one reconcile interval by the node reconciling the Redis queues.
+RECONCILED_KEY = f"{CHANNEL_PREFIX}:queue-reconciled"
+
+
+class WaitingQueue:
+    def __init__(self, rate_window: float, eta_min_samples: int, reconcile_interval: float):
+        self.rate_window = rate_window
+        self.eta_min_samples = eta_min_samples
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_checked = False
+        self._shops: Dict[int, List[int]] = defaultdict(list)
+        self._served: Dict[int, Deque[float]] = defaultdict(deque)
+        self._dirty: Dict[int, int] = {}
+        # A Redis write failed here; reconcile on the next pass even if
+        # another node holds the marker.
+        self._diverged = False
+
+    def _client(self):
+        with self._lock:
+            if not self._redis_checked:
+                self._redis_checked = True
+                try:
+                    client = create_client()
+                    client.ping()
+                    self._redis = client
+                except Exception as exc:
+                    logger.warning("Waiting queue is local-only, Redis unavailable: %s", exc)
+            return self._redis
+
+    def _mark_dirty(self, shop_id: int, rank: Optional[int]):
+        if rank is None:
+            return
+        with self._lock:
+            current = self._dirty.get(shop_id)
+            self._dirty[shop_id] = rank if current is None else min(current, rank)
+
+    # Maintenance, called by crud after commit
+    def enqueue(self, shop_id: int, session_id: int):
+        client = self._client()
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.zadd(_queue_key(shop_id), {session_id: session_id})
+                pipe.zrank(_queue_key(shop_id), session_id)
+                _, rank = pipe.execute()
+            except Exception as exc:
+                logger.warning("Waiting queue add failed for session %s: %s", session_id, exc)
+                self._diverged = True
+                return
+        else:
+            with self._lock:
+                members = self._shops[shop_id]
+                rank = bisect.bisect_left(members, session_id)
+                if rank == len(members) or members[rank] != session_id:
+                    members.insert(rank, session_id)
+        self._mark_dirty(shop_id, rank)
+
+    def dequeue(self, shop_id: int, session_id: int, served: bool):
+        """Drop ``session_id`` from its shop's queue; ``served`` counts it
+        towards the service rate (an assignment rather than an abandon)."""
+        now = time.time()
+        client = self._client()
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.zrank(_queue_key(shop_id), session_id)
+                pipe.zrem(_queue_key(shop_id), session_id)
+                rank, _ = pipe.execute()
+                # Not queued (already removed, or never added): nothing was served from it.
+                if served and rank is not None:
+                    pipe = client.pipeline()
+                    pipe.zadd(_served_key(shop_id), {session_id: now})
+                    pipe.zremrangebyscore(_served_key(shop_id), "-inf", now - self.rate_window)
+                    pipe.expire(_served_key(shop_id), int(self.rate_window) + 60)
+                    pipe.execute()
+            except Exception as exc:
+                logger.warning("Waiting queue remove failed for session %s: %s", session_id, exc)
+                self._diverged = True
+                return
+        else:
+            with self._lock:
+                members = self._shops.get(shop_id) or []
+                rank = bisect.bisect_left(members, session_id)
+                if rank < len(members) and members[rank] == session_id:
+                    del members[rank]
+                else:
+                    rank = None
+                if served and rank is not None:
+                    self._served[shop_id].append(now)
+        self._mark_dirty(shop_id, rank)
+
+    def reconcile(self, load: Callable[[], Iterable[Tuple[int, int]]]):
+        """Bring the queues in line with ``load()``, the (shop_id, session_id)
+        pairs of waiting sessions read from the database.
+
+        The queues are snapshotted before ``load()`` runs and only the
+        difference is applied, so a session enqueued meanwhile is left alone
+        rather than dropped. Redis queues are live state shared with the
+        other nodes: only the node that sets the marker does the pass.
+        """
+        client = self._client()
+        if client is not None:
+            try:
+                if not client.set(
+                    RECONCILED_KEY, int(time.time()), nx=True, ex=max(1, int(self.reconcile_interval))
+                ) and not self._diverged:
+                    return
+                self._diverged = False
+                shop_ids = [
+                    int(key.rsplit(":", 1)[1])
+                    for key in client.scan_iter(match=_queue_key("*"))
+                    if not key.endswith(":served")
+                ]
+                pipe = client.pipeline(transaction=False)
+                for shop_id in shop_ids:
+                    pipe.zrange(_queue_key(shop_id), 0, -1)
+                queued = {
+                    shop_id: {int(member) for member in members}
+                    for shop_id, members in zip(shop_ids, pipe.execute())
+                }
+                changes = self._diff(queued, load())
+                pipe = client.pipeline(transaction=False)
+                for shop_id, (stale, missing) in changes.items():
+                    if stale:
+                        pipe.zrem(_queue_key(shop_id), *stale)
+                    if missing:
+                        pipe.zadd(_queue_key(shop_id), {sid: sid for sid in missing})
+                pipe.execute()
+            except Exception as exc:
+                # Lookups put missing sessions back, one position() at a time.
+                logger.warning("Waiting queue reconcile failed: %s", exc)
+                self._diverged = True
+                return
+        else:
+            with self._lock:
+                queued = {shop_id: set(members) for shop_id, members in self._shops.items()}
+            changes = self._diff(queued, load())
+            with self._lock:
+                for shop_id, (stale, missing) in changes.items():
+                    members = set(self._shops[shop_id]).difference(stale).union(missing)
+                    self._shops[shop_id] = sorted(members)
+        for shop_id in changes:
+            self._mark_dirty(shop_id, 0)
+        if changes:
+            logger.info("Reconciled waiting queues for %d shop(s)", len(changes))
+
+    def _diff(
+        self, queued: Dict[int, set], waiting: Iterable[Tuple[int, int]]
+    ) -> Dict[int, Tuple[set, set]]:
+        """Per shop, the (stale, missing) session ids of ``queued`` against ``waiting``."""
+        by_shop = self._by_shop(waiting)
+        changes = {}
+        for shop_id in set(queued) | set(by_shop):
+            members, expected = queued.get(shop_id, set()), set(by_shop.get(shop_id, ()))
+            stale, missing = members - expected, expected - members
+            if stale or missing:
+                changes[shop_id] = (stale, missing)
+        return changes
+
+    async def run_reconciler(self, load: Callable[[], Iterable[Tuple[int, int]]], interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.reconcile, load)
+
+    @staticmethod
+    def _by_shop(waiting: Iterable[Tuple[int, int]]) -> Dict[int, List[int]]:
+        by_shop: Dict[int, List[int]] = defaultdict(list)
+        for shop_id, session_id in waiting:
+            by_shop[shop_id].append(session_id)
+        return by_shop
+
+    # Lookups
+    def _served_count(self, shop_id: int, now: float) -> int:
+        client = self._client()
+        if client is not None:
+            return client.zcount(_served_key(shop_id), now - self.rate_window, "+inf")
+        with self._lock:
+            served = self._served.get(shop_id)
+            if not served:
+                return 0
+            while served and served[0] < now - self.rate_window:
+                served.popleft()
+            return len(served)
+
+    def eta_seconds(self, shop_id: int, position: int, served: Optional[int] = None) -> Optional[float]:
+        """Expected wait at ``position`` (1-based), or None until the shop has
+        served enough sessions recently to estimate a rate."""
+        if served is None:
+            served = self._served_count(shop_id, time.time())
+        if served < self.eta_min_samples:
+            return None
+        return round(position * self.rate_window / served, 1)
+
+    def _lookup(self, shop_id: int, session_id: int) -> Tuple[Optional[int], int]:
+        client = self._client()
+        if client is not None:
+            pipe = client.pipeline()
+            pipe.zrank(_queue_key(shop_id), session_id)
+            pipe.zcard(_queue_key(shop_id))
+            rank, waiting = pipe.execute()
+            return rank, waiting
+        with self._lock:
+            members = self._shops.get(shop_id) or []
+            rank = bisect.bisect_left(members, session_id)
+            if rank == len(members) or members[rank] != session_id:
+                rank = None
+            return rank, len(members)
+
+    def position(self, shop_id: int, session_id: int) -> Optional[dict]:
+        """``queue_position`` frame for a waiting session. The caller has
+        checked the session is waiting, so a miss (e.g. after a Redis restart)
+        puts it back in the queue."""
+        try:
+            rank, waiting = self._lookup(shop_id, session_id)
+            if rank is None:
+                self.enqueue(shop_id, session_id)
+                rank, waiting = self._lookup(shop_id, session_id)
+            if rank is None:
+                return None
+            return self._frame(shop_id, session_id, rank + 1, waiting)
+        except Exception as exc:
+            logger.warning("Waiting queue lookup failed for session %s: %s", session_id, exc)
+            return None
+
+    def _frame(self, shop_id: int, session_id: int, position: int, waiting: int, served: int = None) -> dict:
+        return {
+            "type": "queue_position",
+            "session_id": session_id,
+            "position": position,
+            "waiting": waiting,
+            "eta_seconds": self.eta_seconds(shop_id, position, served),
+        }
+
+    def _members_from(self, shop_id: int, rank: int) -> Tuple[List[int], int]:
+        client = self._client()
+        if client is not None:
+            pipe = client.pipeline()
+            pipe.zrange(_queue_key(shop_id), rank, -1)
+            pipe.zcard(_queue_key(shop_id))
+            members, waiting = pipe.execute()
+            return [int(member) for member in members], waiting
+        with self._lock:
+            members = self._shops.get(shop_id) or []
+            return members[rank:], len(members)
+
+    # Notifications
+    async def run_notifier(self, manager, interval: float):
+        """Every ``interval`` seconds, push new positions to the customers
+        whose place in a queue changed since the last run."""
+        while True:
+            await asyncio.sleep(interval)
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            for shop_id, rank in dirty.items():
+                try:
+                    members, waiting = await asyncio.to_thread(self._members_from, shop_id, rank)
+                    served = await asyncio.to_thread(self._served_count, shop_id, time.time())
+                except Exception as exc:
+                    logger.warning("Waiting queue notify failed for shop %s: %s", shop_id, exc)
+                    continue
+                for offset, session_id in enumerate(members):
+                    frame = self._frame(shop_id, session_id, rank + offset + 1, waiting, served)
+                    await manager.send_to_session(dumps_str(frame), session_id)
+
+
+waiting_queue = WaitingQueue(
+    rate_window=settings.queue_rate_window,
+    eta_min_samples=settings.queue_eta_min_samples,
+    reconcile_interval=settings.queue_reconcile_interval,
+)
@@ -0,0 +1,135 @@
+"""PostgreSQL-only schema additions.
+
+``Base.metadata.create_all`` creates missing tables but never alters existing
+ones, and cannot express generated tsvector columns, extensions or GIN
+indexes portably. Everything here is idempotent. Adding a stored generated
+column rewrites the table, so it is applied once per release out of band:
+
+    python -m scripts.upgrade_schema
+    python -m scripts.upgrade_schema --backfill-sessions   # once, after upgrading
+
+``schema_auto_upgrade`` runs it on app startup instead, for single-node
+development setups only.
+"""
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _text_config() -> str:
+    config = settings.search_text_config
+    if not re.fullmatch(r"[a-z_]+", config):
+        raise ValueError(f"Invalid search_text_config: {config!r}")
+    return config
+
+
+def statements():
+    config = _text_config()
+    return [
+        # Keyset pagination of the employee list, optionally per shop (see
+        # models.Employee); create_all never adds it to an existing table.
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employees_shop_id_id ON employees (shop_id, id)",
+        # Full-text search over chat transcripts, maintained by Postgres on
+        # every insert/update of chat_messages.message.
+        f"ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{config}'::regconfig, coalesce(message, ''))) STORED",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_search_vector "
+        "ON chat_messages USING gin (search_vector)",
+        # Customer lookup: trigram indexes serve ILIKE '%term%' substring
+        # search, pattern_ops indexes serve the prefix-only autocomplete.
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customers_name_trgm "
+        "ON customers USING gin (name gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customers_email_trgm "
+        "ON customers USING gin (email gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customers_name_prefix "
+        "ON customers (lower(name) text_pattern_ops, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customers_email_prefix "
+        "ON customers (lower(email) text_pattern_ops, id)",
+        # Session summary columns (see models.ChatSession); existing rows
+        # start empty until `python -m scripts.upgrade_schema --backfill-sessions`.
+        "ALTER TABLE chat_sessions "
+        "ADD COLUMN IF NOT EXISTS last_message_at timestamptz, "
+        "ADD COLUMN IF NOT EXISTS last_message_preview varchar(200), "
+        "ADD COLUMN IF NOT EXISTS message_count integer NOT NULL DEFAULT 0, "
+        "ADD COLUMN IF NOT EXISTS customer_unread integer NOT NULL DEFAULT 0, "
+        "ADD COLUMN IF NOT EXISTS agent_unread integer NOT NULL DEFAULT 0, "
+        "ADD COLUMN IF NOT EXISTS first_response_at timestamptz",
+        "ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS assigned_at timestamptz",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_sessions_shop_id_last_message_at "
+        "ON chat_sessions (shop_id, last_message_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_session_id_created_at "
+        "ON chat_messages (session_id, created_at)",
+        # Idempotent sends: one row per (session, client message id). NULLs
+        # are distinct, so messages without an id are unaffected.
+        "ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS client_msg_id varchar(64)",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_chat_messages_session_id_client_msg_id "
+        "ON chat_messages (session_id, client_msg_id)",
+    ]
+
+
+CONCURRENT_INDEX = re.compile(r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+)")
+INDEX_IS_INVALID = text(
+    "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+    "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+)
+
+
+def _drop_if_invalid(conn, name: str):
+    """A failed or interrupted concurrent build leaves an INVALID index that
+    IF NOT EXISTS would skip forever; drop it so it is built again."""
+    if conn.execute(INDEX_IS_INVALID, {"name": name}).scalar():
+        logger.warning("Index %s is invalid (interrupted build); rebuilding it", name)
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def upgrade_schema(engine):
+    if engine.dialect.name != "postgresql":
+        return
+    # CONCURRENTLY cannot run inside a transaction block.
+    failed = 0
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for statement in statements():
+            try:
+                index = CONCURRENT_INDEX.match(statement)
+                if index:
+                    _drop_if_invalid(conn, index.group(1))
+                conn.execute(text(statement))
+            except DBAPIError as exc:
+                # e.g. no privilege to create pg_trgm: keep serving, the
+                # affected queries just run without their index.
+                failed += 1
+                logger.warning("Schema statement failed: %s (%s)", statement.split(" ON ")[0], exc.orig)
+    if failed:
+        logger.warning("PostgreSQL schema additions incomplete: %d statement(s) failed", failed)
+    else:
+        logger.info("PostgreSQL schema additions are up to date")
+
+
+def backfill_session_summaries(engine, batch_size: int = 10000):
+    """Recompute the chat_sessions summary columns from chat_messages, one
+    committed id range at a time. Unread counters are reset to zero."""
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM chat_sessions")).scalar()
+    messages = "FROM chat_messages m WHERE m.session_id = chat_sessions.id"
+    statement = text(
+        "UPDATE chat_sessions SET "
+        f"message_count = (SELECT COUNT(*) {messages}), "
+        f"last_message_at = (SELECT MAX(m.created_at) {messages}), "
+        f"last_message_preview = (SELECT SUBSTR(m.message, 1, 200) {messages} "
+        "ORDER BY m.created_at DESC, m.id DESC LIMIT 1), "
+        f"first_response_at = (SELECT MIN(m.created_at) {messages} AND m.is_from_customer = false), "
+        "customer_unread = 0, agent_unread = 0 "
+        "WHERE id >= :low AND id < :high"
+    )
+    for low in range(1, max_id + 1, batch_size):
+        with engine.begin() as conn:
+            conn.execute(statement, {"low": low, "high": low + batch_size})
+        logger.info("Backfilled session summaries up to id %d of %d", min(low + batch_size - 1, max_id), max_id)
+
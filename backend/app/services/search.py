@@ -0,0 +1,19 @@
+"""Helpers for LIKE-based matching.
+
+Patterns are built with ``\\`` as the escape character so user input
+containing ``%`` or ``_`` matches literally; pass ``escape=LIKE_ESCAPE`` to
+``like``/``ilike``.
+"""
+LIKE_ESCAPE = "\\"
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def contains_pattern(value: str) -> str:
+    return f"%{escape_like(value)}%"
+
+
+def prefix_pattern(value: str) -> str:
+    return f"{escape_like(value)}%"
@@ -0,0 +1,59 @@
+"""JSON encoding used on the hot paths: HTTP responses, WebSocket frames and
+the Redis envelope. Uses orjson when installed and falls back to the stdlib."""
+import json
+from typing import Any, Tuple
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps_str(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(data) -> Any:
+        return orjson.loads(data)
+
+else:
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+    def dumps_str(obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+    def loads(data) -> Any:
+        return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Redis envelopes are "<header json>\n<frame>": routing metadata is encoded once
+# and the frame, already serialized for the socket, is appended verbatim. The
+# header is compact JSON, which never contains a raw newline.
+ENVELOPE_SEPARATOR = "\n"
+
+
+def pack_envelope(header: dict, frame: str) -> str:
+    return dumps_str(header) + ENVELOPE_SEPARATOR + frame
+
+
+def unpack_envelope(data: str) -> Tuple[dict, str]:
+    header, sep, frame = data.partition(ENVELOPE_SEPARATOR)
+    if not sep:
+        # Legacy single-JSON envelope with the frame nested under "message".
+        legacy = loads(data)
+        return legacy, legacy.get("message", "")
+    return loads(header), frame
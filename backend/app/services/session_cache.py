@@ -0,0 +1,348 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.config import settings
+from app.services import metrics
+from app.services.cache import invalidation_bus
+from app.services.pubsub import create_client
+from app.services.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+cache_requests = metrics.registry.counter(
+    "session_cache_requests_total", "Session cache lookups by result", ("result",)
+)
+cache_evictions = metrics.registry.counter(
+    "session_cache_evictions_total", "Session cache evictions by reason", ("reason",)
+)
+cache_usage = metrics.registry.gauge(
+    "session_cache_usage", "Session cache entries and approximate bytes", ("unit",)
+)
+
+# How long a session's last write is remembered; a fill that takes longer
+# than this is not cached.
+FILL_WINDOW = 30.0
+
+
+class CachedSession:
+    __slots__ = ("session", "messages", "complete", "expires_at", "size")
+
+    def __init__(self, session: dict, messages: List[dict], complete: bool, expires_at: float):
+        self.session = session
+        self.messages = messages
+        self.complete = complete
+        self.expires_at = expires_at
+        self.size = 0
+
+    def copy(self) -> "CachedSession":
+        """Snapshot that is safe to read without the cache lock. Message dicts
+        are shared: the cache appends and drops them but never edits one."""
+        entry = CachedSession(dict(self.session), list(self.messages), self.complete, self.expires_at)
+        entry.size = self.size
+        return entry
+
+    def to_json(self) -> bytes:
+        return dumps({"session": self.session, "messages": self.messages, "complete": self.complete})
+
+    def set_field(self, field: str, value) -> int:
+        """Set a session field; returns the change in serialized size."""
+        value = value.isoformat() if hasattr(value, "isoformat") else value
+        if field in self.session:
+            delta = len(dumps(value)) - len(dumps(self.session[field]))
+        else:
+            # "field":value plus a comma when not the first key.
+            delta = len(dumps(field)) + 1 + len(dumps(value)) + (1 if self.session else 0)
+        self.session[field] = value
+        return delta
+
+
+class SessionCache:
+    """Read-through LRU of session metadata plus the tail of its transcript.
+
+    Entries expire after ``ttl`` seconds and the cache evicts least recently
+    used sessions to stay under ``max_bytes`` (measured as serialized JSON,
+    kept up to date incrementally as entries are patched).
+    Writes in crud.chat patch entries in place instead of dropping them, and
+    other nodes are told to drop their copy through the invalidation bus. With
+    ``use_redis`` the serialized entries are also written through to Redis, so
+    a node that lost its copy can refill without touching Postgres.
+
+    A fill races with writes: the transcript it read may be older than an
+    append that found no entry to patch. Every write is numbered, so
+    ``fill`` (and a Redis refill) stores its snapshot only when no write to
+    that session happened after its ``fill_token`` was taken.
+    """
+
+    cache_name = "chat_sessions"
+
+    def __init__(self, max_bytes: int, ttl: float, tail: int, use_redis: bool = False):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.tail = tail
+        self._entries: "OrderedDict[int, CachedSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Writes are numbered; sessions written in the last FILL_WINDOW
+        # seconds map to their latest number and time.
+        self._writes = 0
+        self._written: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+        self._flushed = 0
+        self._redis = None
+
+        if use_redis:
+            try:
+                client = create_client()
+                client.ping()
+                self._redis = client
+            except Exception as exc:
+                logger.warning("Session cache Redis tier disabled: %s", exc)
+
+        invalidation_bus.register(self.cache_name, self._on_invalidate)
+        cache_usage.set_function(lambda: {("entries",): len(self._entries), ("bytes",): self._bytes})
+
+    # Lookups
+    def get(self, session_id: int) -> Optional[CachedSession]:
+        """A copy of the cached entry; writers patch the original in place."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(session_id)
+                    cache_requests.inc("hit")
+                    return entry.copy()
+                self._remove(session_id)
+                cache_evictions.inc("expired")
+
+        token = self.fill_token()
+        entry = self._get_remote(session_id)
+        if entry is not None:
+            cache_requests.inc("remote_hit")
+            with self._lock:
+                if self._is_current(session_id, token):
+                    self._store(session_id, entry)
+                return entry.copy()
+
+        cache_requests.inc("miss")
+        return None
+
+    def fill_token(self) -> Tuple[int, float]:
+        """Take before reading a session from the database, pass to ``fill``."""
+        with self._lock:
+            return self._writes, time.monotonic()
+
+    def fill(self, db_session, db_messages, token: Tuple[int, float]) -> Tuple[dict, List[dict]]:
+        """Cache a session loaded from the database after ``token`` was
+        taken; returns its serialized metadata and the full serialized
+        transcript. Nothing is cached if the session was written meanwhile."""
+        from app import schemas
+
+        session = schemas.ChatSessionInfo.model_validate(db_session).model_dump(mode="json")
+        messages = [schemas.ChatMessage.model_validate(m).model_dump(mode="json") for m in db_messages]
+        entry = CachedSession(
+            session,
+            messages[-self.tail:] if self.tail else [],
+            complete=len(messages) <= self.tail,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            current = self._is_current(db_session.id, token)
+            if current:
+                self._store(db_session.id, entry)
+                snapshot = entry.copy()
+        if current:
+            self._put_remote(db_session.id, snapshot)
+        return session, messages
+
+    # Incremental updates from crud.chat
+    def append_message(self, db_message, **session_fields):
+        """Append to a cached transcript; ``session_fields`` are the session
+        summary columns as updated by the same write."""
+        from app import schemas
+
+        session_id = db_message.session_id
+        message = None
+        if session_id in self._entries:
+            message = schemas.ChatMessage.model_validate(db_message).model_dump(mode="json")
+        with self._lock:
+            self._written_to(session_id)
+            entry = self._entries.get(session_id)
+            if entry is not None and message is None:
+                # Filled since the check above, maybe without this message.
+                self._remove(session_id)
+                entry = None
+            if entry is not None:
+                delta = sum(entry.set_field(field, value) for field, value in session_fields.items())
+                delta += len(dumps(message)) + (1 if entry.messages else 0)
+                entry.messages.append(message)
+                if len(entry.messages) > self.tail:
+                    evicted = len(entry.messages) - self.tail
+                    delta -= sum(len(dumps(m)) + 1 for m in entry.messages[:evicted])
+                    del entry.messages[:evicted]
+                    if entry.complete:
+                        entry.complete = False
+                        delta += len(dumps(False)) - len(dumps(True))
+                self._resize(entry, delta)
+                entry = entry.copy()
+        self._sync_remote(session_id, entry)
+        self._notify(session_id)
+
+    def patch(self, session_id: int, **fields):
+        with self._lock:
+            self._written_to(session_id)
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._resize(entry, sum(entry.set_field(field, value) for field, value in fields.items()))
+                entry = entry.copy()
+        self._sync_remote(session_id, entry)
+        self._notify(session_id)
+
+    def invalidate_customer(self, customer_id: int):
+        self._drop_customer(customer_id)
+        self._delete_remote_customer(customer_id)
+        invalidation_bus.publish(self.cache_name, f"customer:{customer_id}", local=False)
+
+    def invalidate_all(self):
+        """Drop every entry on every node, e.g. after a bulk customer import."""
+        self.clear()
+        self._delete_remote_all()
+        invalidation_bus.publish(self.cache_name, local=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._writes += 1
+            self._flushed = self._writes
+
+    # Internals; callers hold self._lock
+    def _store(self, session_id: int, entry: CachedSession):
+        if session_id in self._entries:
+            self._remove(session_id)
+        entry.size = len(entry.to_json())
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            cache_evictions.inc("memory")
+
+    def _written_to(self, session_id: int):
+        self._writes += 1
+        now = time.monotonic()
+        self._written[session_id] = (self._writes, now)
+        self._written.move_to_end(session_id)
+        while self._written:
+            oldest = next(iter(self._written.values()))
+            if oldest[1] > now - FILL_WINDOW:
+                break
+            self._written.popitem(last=False)
+
+    def _is_current(self, session_id: int, token: Tuple[int, float]) -> bool:
+        writes, taken_at = token
+        if time.monotonic() - taken_at >= FILL_WINDOW:
+            # Writes this old are no longer tracked; assume the worst.
+            return False
+        written = self._written.get(session_id)
+        return writes >= self._flushed and (written is None or written[0] <= writes)
+
+    def _resize(self, entry: CachedSession, delta: int):
+        entry.size += delta
+        self._bytes += delta
+
+    def _remove(self, session_id: int):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _drop_customer(self, customer_id: int):
+        with self._lock:
+            self._writes += 1
+            self._flushed = self._writes
+            for sid in [sid for sid, e in self._entries.items() if e.session.get("customer_id") == customer_id]:
+                self._remove(sid)
+
+    def _notify(self, session_id: int):
+        invalidation_bus.publish(self.cache_name, str(session_id), local=False)
+
+    def _on_invalidate(self, key: Optional[str]):
+        if key is None:
+            self.clear()
+        elif key.startswith("customer:"):
+            self._drop_customer(int(key.split(":", 1)[1]))
+        else:
+            with self._lock:
+                self._written_to(int(key))
+                self._remove(int(key))
+
+    # Optional Redis tier
+    def _remote_key(self, session_id: int) -> str:
+        return f"{self.cache_name}:{session_id}"
+
+    def _get_remote(self, session_id: int) -> Optional[CachedSession]:
+        if self._redis is None:
+            return None
+        try:
+            raw = self._redis.get(self._remote_key(session_id))
+        except Exception as exc:
+            logger.warning("Session cache Redis read failed: %s", exc)
+            return None
+        if not raw:
+            return None
+        data = loads(raw)
+        return CachedSession(
+            data["session"], data["messages"], data["complete"], time.monotonic() + self.ttl
+        )
+
+    def _put_remote(self, session_id: int, entry: CachedSession):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(self._remote_key(session_id), entry.to_json(), ex=int(self.ttl))
+        except Exception as exc:
+            logger.warning("Session cache Redis write failed: %s", exc)
+
+    def _sync_remote(self, session_id: int, entry: Optional[CachedSession]):
+        if self._redis is None:
+            return
+        if entry is not None:
+            self._put_remote(session_id, entry)
+            return
+        # No local copy to patch: drop the shared one rather than leave it stale.
+        try:
+            self._redis.delete(self._remote_key(session_id))
+        except Exception as exc:
+            logger.warning("Session cache Redis delete failed: %s", exc)
+
+    def _delete_remote_all(self):
+        if self._redis is None:
+            return
+        try:
+            for key in self._redis.scan_iter(f"{self.cache_name}:*", count=500):
+                self._redis.delete(key)
+        except Exception as exc:
+            logger.warning("Session cache Redis cleanup failed: %s", exc)
+
+    def _delete_remote_customer(self, customer_id: int):
+        if self._redis is None:
+            return
+        # Customer edits are rare; a scan keeps the Redis tier from serving
+        # stale names until the TTL runs out.
+        try:
+            for key in self._redis.scan_iter(f"{self.cache_name}:*", count=500):
+                raw = self._redis.get(key)
+                if raw and loads(raw)["session"].get("customer_id") == customer_id:
+                    self._redis.delete(key)
+        except Exception as exc:
+            logger.warning("Session cache Redis cleanup failed: %s", exc)
+
+
+session_cache = SessionCache(
+    max_bytes=settings.session_cache_max_bytes,
+    ttl=settings.session_cache_ttl,
+    tail=settings.session_cache_tail,
+    use_redis=settings.session_cache_redis,
+)
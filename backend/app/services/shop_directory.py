@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from typing import Optional, Tuple
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services.cache import invalidation_bus
+from app.services.serialization import dumps
+
+
+class ShopDirectory:
+    """Pre-serialized public shop listing with a strong ETag.
+
+    The body is rebuilt from the database after an invalidation, or once it
+    is older than ``ttl`` in case one was lost, so steady-state requests (and
+    every conditional request) skip the database.
+    """
+
+    cache_name = "shop_directory"
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._expires_at = 0.0
+        self._version = 0
+        self._lock = threading.Lock()
+        invalidation_bus.register(self.cache_name, self._on_invalidate)
+
+    def _build(self, db) -> Tuple[bytes, str]:
+        # Imported here: crud hooks into this module for invalidation.
+        from app import crud, schemas
+
+        shops = [schemas.Shop.model_validate(s).model_dump(mode="json") for s in crud.get_shops(db, limit=None)]
+        body = dumps(shops)
+        return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def refresh(self, db=None):
+        with self._lock:
+            version = self._version
+        if db is None:
+            with SessionLocal() as session:
+                body, etag = self._build(session)
+        else:
+            body, etag = self._build(db)
+        with self._lock:
+            # Drop the result if an invalidation raced with the rebuild.
+            if version == self._version:
+                self._body, self._etag = body, etag
+                self._expires_at = time.monotonic() + self.ttl
+        return body, etag
+
+    def get(self) -> Tuple[bytes, str]:
+        body, etag = self._body, self._etag
+        if body is None or time.monotonic() >= self._expires_at:
+            return self.refresh()
+        return body, etag
+
+    def invalidate(self):
+        invalidation_bus.publish(self.cache_name)
+
+    def _on_invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            self._version += 1
+            self._body = self._etag = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+shop_directory = ShopDirectory(ttl=settings.shop_directory_ttl)
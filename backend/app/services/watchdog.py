@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SiteKey = Tuple[str, int, str]
+
+
+class BlockingSite:
+    __slots__ = ("filename", "lineno", "function", "count", "total_blocked", "max_blocked", "last_seen", "stack")
+
+    def __init__(self, key: SiteKey):
+        self.filename, self.lineno, self.function = key
+        self.count = 0
+        self.total_blocked = 0.0
+        self.max_blocked = 0.0
+        self.last_seen = 0.0
+        self.stack: List[str] = []
+
+    def as_dict(self) -> dict:
+        return {
+            "filename": self.filename,
+            "lineno": self.lineno,
+            "function": self.function,
+            "count": self.count,
+            "total_blocked": round(self.total_blocked, 4),
+            "max_blocked": round(self.max_blocked, 4),
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+class LoopWatchdog:
+    """Measures event loop scheduling lag and samples the loop thread's stack
+    when it stalls.
+
+    A heartbeat coroutine ticks on the loop every ``interval`` seconds. A
+    daemon thread watches the heartbeat; once it is more than ``threshold``
+    seconds late, the loop thread is blocked in synchronous code, so its
+    current frame is captured and charged to the innermost call site inside
+    the app package.
+    """
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.1, max_sites: int = 200, stack_depth: int = 25):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_sites = max_sites
+        self.stack_depth = stack_depth
+        self.stalls = 0
+
+        self._sites: Dict[SiteKey, BlockingSite] = {}
+        self._lock = threading.Lock()
+        self._beat = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self._last_beat = time.monotonic()
+            self._beat += 1
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            metrics.event_loop_lag.set(lag)
+            metrics.event_loop_lag_histogram.observe(lag)
+
+    def _watch(self):
+        poll = max(0.005, min(self.interval, self.threshold) / 2)
+        stalled_beat = None
+        stalled_site: Optional[BlockingSite] = None
+        stalled_for = 0.0
+
+        while not self._stop.wait(poll):
+            beat = self._beat
+            late = time.monotonic() - self._last_beat - self.interval
+
+            if stalled_beat is not None and beat != stalled_beat:
+                with self._lock:
+                    stalled_site.total_blocked += stalled_for
+                stalled_beat = stalled_site = None
+
+            if late < self.threshold:
+                continue
+
+            if stalled_beat is None:
+                site = self._capture()
+                if site is None:
+                    continue
+                stalled_beat, stalled_site = beat, site
+                self.stalls += 1
+                logger.warning(
+                    "Event loop blocked >%.0fms at %s:%s (%s)",
+                    self.threshold * 1000, site.filename, site.lineno, site.function,
+                )
+            stalled_for = late
+            with self._lock:
+                stalled_site.max_blocked = max(stalled_site.max_blocked, late)
+
+    def _capture(self) -> Optional[BlockingSite]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame, limit=self.stack_depth)
+        if not stack:
+            return None
+
+        call_site = stack[-1]
+        for entry in reversed(stack):
+            if entry.filename.startswith(APP_ROOT) and entry.filename != __file__:
+                call_site = entry
+                break
+
+        key = (call_site.filename, call_site.lineno, call_site.name)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                if len(self._sites) >= self.max_sites:
+                    # Evict the least significant offender to stay bounded.
+                    weakest = min(self._sites, key=lambda k: self._sites[k].total_blocked)
+                    del self._sites[weakest]
+                site = self._sites[key] = BlockingSite(key)
+            site.count += 1
+            site.last_seen = time.time()
+            site.stack = [f"{e.filename}:{e.lineno} in {e.name}" for e in stack]
+        return site
+
+    def report(self, limit: int = 50) -> List[dict]:
+        with self._lock:
+            sites = sorted(
+                self._sites.values(), key=lambda s: (s.total_blocked, s.max_blocked), reverse=True
+            )
+            return [s.as_dict() for s in sites[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._sites.clear()
+        self.stalls = 0
+
+
+watchdog = LoopWatchdog(
+    interval=settings.event_loop_lag_interval,
+    threshold=settings.blocking_threshold,
+    max_sites=settings.blocking_max_sites,
+)
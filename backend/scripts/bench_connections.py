@@ -0,0 +1,86 @@
+"""
+Memory footprint of ConnectionManager bookkeeping per open WebSocket.
+
+Registers N simulated connections (a customer/agent mix, customers bound to a
+session) directly with a ConnectionManager and reports the bytes the manager's
+records and indexes add per connection, as measured by tracemalloc. The socket
+objects themselves are allocated before measuring starts: their cost belongs
+to the ASGI server and is reported separately for reference only.
+
+Usage (from backend/):
+    python -m scripts.bench_connections --connections 100000 --agent-ratio 0.05
+"""
+import argparse
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.chat import Connection, ConnectionManager
+
+
+class SimulatedWebSocket:
+    """Stand-in for starlette's WebSocket: the manager only touches ``state``."""
+
+    __slots__ = ("state",)
+
+    def __init__(self):
+        self.state = SimpleNamespace()
+
+
+def build(manager, sockets, agents, shops):
+    for i, ws in enumerate(sockets):
+        if i < agents:
+            manager.register(Connection(
+                i + 1, ws, "employee", i + 1, shop_id=i % shops + 1, is_admin=i % 50 == 0,
+            ))
+        else:
+            # Email strings are allocated per connection in production too, so
+            # they are counted with the manager's share.
+            conn = Connection(i + 1, ws, "customer", f"customer{i}@bench.example.com")
+            manager.register(conn)
+            manager._bind(conn, i)
+
+
+def measure(n, agent_ratio, shops):
+    logging.disable(logging.CRITICAL)  # no Redis here is expected
+    manager = ConnectionManager()
+    gc.collect()
+    tracemalloc.start()
+
+    before = tracemalloc.get_traced_memory()[0]
+    sockets = [SimulatedWebSocket() for _ in range(n)]
+    socket_bytes = tracemalloc.get_traced_memory()[0] - before
+
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    build(manager, sockets, int(n * agent_ratio), shops)
+    gc.collect()
+    manager_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    assert len(manager.connections) == n
+    return manager_bytes, socket_bytes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ConnectionManager memory benchmark")
+    parser.add_argument("--connections", type=int, default=100_000)
+    parser.add_argument("--agent-ratio", type=float, default=0.05)
+    parser.add_argument("--shops", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    manager_bytes, socket_bytes = measure(args.connections, args.agent_ratio, args.shops)
+    n = args.connections
+    print(f"Connections: {n} ({int(n * args.agent_ratio)} agents across {args.shops} shops)")
+    print(f"  manager records + indexes: {manager_bytes / n:8.1f} B/connection "
+          f"({manager_bytes / 2**20:.1f} MiB total)")
+    print(f"  simulated socket objects:  {socket_bytes / n:8.1f} B/connection (not included above)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Latency benchmark for chat transcript and customer search.
+
+Runs crud.search_chat_messages over a dataset built with scripts.seed_bulk:
+common and rare terms, a phrase, a shop-scoped query and a date-bounded query,
+each for the first page and the page after it. Then times customer
+autocomplete (target: p95 under 10 ms) and ``GET /customers/?q=`` substring
+search. Reports p50/p95 latency and rows returned per case. On PostgreSQL the
+search column and the GIN/trigram indexes are created first
+(app.services.schema) and --explain prints the chat search plans; other
+databases exercise the substring fallback, which is a full scan.
+
+Usage (from backend/):
+    python -m scripts.bench_search --runs 50 --explain
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, text
+
+from app import crud, models
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.services.schema import upgrade_schema
+
+CASES = (
+    ("common term", "order", {}),
+    ("rare term", "Kailashahar", {}),
+    ("phrase", '"refund request"', {}),
+    ("either term", "invoice or password", {}),
+    ("one shop", "delivery", {"shop": True}),
+    ("last 7 days", "refund", {"days": 7}),
+)
+CUSTOMER_CASES = (
+    ("autocomplete", "a"),
+    ("autocomplete", "pri"),
+    ("autocomplete", "bulk.customer12"),
+    ("autocomplete", "nair"),
+    ("substring", "sharma"),
+    ("substring", "@example"),
+)
+
+
+def timed(fn, runs):
+    samples, result = [], None
+    fn()  # warm caches and the plan
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], result
+
+
+def explain(db, query):
+    sql = text(
+        "EXPLAIN (ANALYZE, BUFFERS) SELECT id FROM chat_messages "
+        "WHERE search_vector @@ websearch_to_tsquery(CAST(:config AS regconfig), :q) LIMIT 21"
+    )
+    for (line,) in db.execute(sql, {"config": settings.search_text_config, "q": query}):
+        print(f"    {line}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chat and customer search latency benchmark")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--sort", choices=("relevance", "recent"), default="relevance")
+    parser.add_argument("--explain", action="store_true", help="print query plans (PostgreSQL only)")
+    args = parser.parse_args(argv)
+
+    postgres = engine.dialect.name == "postgresql"
+    upgrade_schema(engine)
+    db = SessionLocal()
+    try:
+        messages = db.query(func.count(models.ChatMessage.id)).scalar()
+        shop_id = db.query(func.min(models.Shop.id)).scalar()
+        print(f"{engine.dialect.name}: {messages} messages, limit {args.limit}, sort {args.sort}, {args.runs} runs")
+        if not postgres:
+            print("  (no full-text index on this database: substring fallback)")
+
+        print(f"  {'case':<14} {'page':>4} {'p50 ms':>9} {'p95 ms':>9} {'rows':>5}")
+        for name, query, options in CASES:
+            kwargs = {"sort": args.sort, "limit": args.limit}
+            if options.get("shop"):
+                kwargs["shop_ids"] = [shop_id]
+            if options.get("days"):
+                kwargs["date_from"] = datetime.now(timezone.utc) - timedelta(days=options["days"])
+
+            p50, p95, (results, after) = timed(lambda: crud.search_chat_messages(db, query, **kwargs), args.runs)
+            print(f"  {name:<14} {1:>4} {p50:>9.2f} {p95:>9.2f} {len(results):>5}")
+            if after:
+                p50, p95, (results, _) = timed(
+                    lambda: crud.search_chat_messages(db, query, after=after, **kwargs), args.runs
+                )
+                print(f"  {name:<14} {2:>4} {p50:>9.2f} {p95:>9.2f} {len(results):>5}")
+            if args.explain and postgres:
+                explain(db, query)
+
+        customers = db.query(func.count(models.Customer.id)).scalar()
+        print(f"{customers} customers")
+        print(f"  {'case':<14} {'query':>16} {'p50 ms':>9} {'p95 ms':>9} {'rows':>5}")
+        for name, query in CUSTOMER_CASES:
+            if name == "autocomplete":
+                search = lambda: crud.autocomplete_customers(db, query)
+            else:
+                search = lambda: crud.get_customers(db, q=query, limit=args.limit)
+            p50, p95, results = timed(search, args.runs)
+            print(f"  {name:<14} {query:>16} {p50:>9.2f} {p95:>9.2f} {len(results):>5}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Per-message CPU cost of the WebSocket/Redis serialization path.
+
+Compares the previous stdlib path (json.dumps the frame, json.dumps it again
+inside the envelope, json.loads the envelope on the receiving node) with the
+current one (fast serializer for the frame, header-only envelope, frame
+forwarded without parsing).
+
+Usage (from backend/):
+    python -m scripts.bench_serialization --iterations 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import protocol, serialization
+
+
+def sample_frame(i):
+    return {
+        "type": "message",
+        "session_id": 1000 + i % 50,
+        "message": "Hello, I was charged twice for order #48213 — could you please check? " * 2,
+        "from": "customer",
+        "customer_email": "vikram.malhotra@example.in",
+        "customer_name": "Vikram Malhotra",
+        "timestamp": "2026-01-01T10:00:00.000Z",
+        "shop_id": 7,
+    }
+
+
+def legacy_path(frame):
+    message = json.dumps(frame)
+    envelope = json.dumps(
+        {"target_type": "session", "target_id": frame["session_id"], "message": message,
+         "customer_email": frame["customer_email"]}
+    )
+    data = json.loads(envelope)
+    return data["message"]
+
+
+def current_path(frame):
+    message = serialization.dumps_str(frame)
+    envelope = serialization.pack_envelope(
+        {"target_type": "session", "target_id": frame["session_id"],
+         "customer_email": frame["customer_email"], "published_at": 0.0},
+        message,
+    )
+    _, forwarded = serialization.unpack_envelope(envelope)
+    return forwarded
+
+
+def measure(fn, frames):
+    start = time.process_time()
+    for frame in frames:
+        fn(frame)
+    return (time.process_time() - start) / len(frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serialization CPU benchmark")
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    frames = [sample_frame(i) for i in range(args.iterations)]
+    assert json.loads(legacy_path(frames[0])) == json.loads(current_path(frames[0]))
+
+    # Warm up both paths before timing.
+    measure(legacy_path, frames[:1000])
+    measure(current_path, frames[:1000])
+
+    legacy = measure(legacy_path, frames)
+    current = measure(current_path, frames)
+    print(f"Serializer backend: {serialization.BACKEND}")
+    print(f"  stdlib double-encoded envelope: {legacy * 1e6:8.2f} us/message")
+    print(f"  current envelope:               {current * 1e6:8.2f} us/message")
+    print(f"  speedup:                        {legacy / current:8.2f}x")
+
+    if protocol.PROTOCOL_MSGPACK in protocol.available_protocols():
+        frame = serialization.dumps_str(frames[0])
+        binary = protocol.encode(protocol.PROTOCOL_MSGPACK, frame)
+        encode = measure(lambda f: protocol.encode(protocol.PROTOCOL_MSGPACK, serialization.dumps_str(f)), frames)
+        print(f"Wire size: JSON {len(frame.encode('utf-8'))} B, MessagePack {len(binary)} B per frame")
+        print(f"  JSON -> MessagePack frame:      {encode * 1e6:8.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+WebSocket load generator and delivery latency benchmark.
+
+Spins up N simulated customers and M agents across K shops, drives chat and
+typing traffic over the real WebSocket endpoints and reports end-to-end
+delivery latency percentiles, throughput and error rates.
+
+Each agent subscribes to the sessions assigned to it, as the dashboard does,
+and ``--watchers`` other agents of the shop subscribe to every session too, so
+session traffic reaches the assignee plus its subscribers rather than the
+whole shop. Frames a watcher receives are reported as fan-out. Clients answer
+the server's heartbeat pings, so long runs are not reaped.
+
+Usage (from backend/, with the API running):
+    python -m scripts.bench_ws --customers 200 --agents 20 --shops 5 --duration 60
+
+Setup goes through the REST API with an admin account (created by
+scripts.seed), so it works against any deployment. For a local run without
+Redis the backend falls back to in-memory delivery, which is a fine stand-in
+for single-node numbers.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+WORDS = (
+    "order refund delivery invoice account password payment tracking warranty "
+    "store branch update cancel exchange receipt shipping address please thanks"
+).split()
+
+MESSAGE_ID = re.compile(r"^\[bench:([^\]]+)\]")
+PONG = json.dumps({"type": "pong"})
+
+
+def http_request(method, url, data=None, headers=None, form=False):
+    headers = dict(headers or {})
+    body = None
+    if data is not None:
+        if form:
+            body = urllib.parse.urlencode(data).encode("utf-8")
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        else:
+            body = json.dumps(data).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(url, data=body, headers=headers, method=method)
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.typing_sent = 0
+        self.delivered = 0
+        self.fanout_frames = 0
+        self.errors = defaultdict(int)
+        self.latencies = []
+        # message id -> (sent_at, receiver key)
+        self.pending = {}
+
+    def error(self, kind):
+        self.errors[kind] += 1
+
+    def track(self, mid, target):
+        self.pending[mid] = (time.perf_counter(), target)
+        self.sent += 1
+
+    def receive(self, text, receiver):
+        match = MESSAGE_ID.match(text or "")
+        if not match:
+            return
+        entry = self.pending.get(match.group(1))
+        if entry is None or entry[1] != receiver:
+            self.fanout_frames += 1
+            return
+        del self.pending[match.group(1)]
+        self.delivered += 1
+        self.latencies.append(time.perf_counter() - entry[0])
+
+
+def make_text(mid, rng):
+    return f"[bench:{mid}] " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+
+
+def setup(args, rng):
+    """Create shops, agents and assigned sessions through the REST API."""
+    base = args.base_url.rstrip("/")
+    run = uuid.uuid4().hex[:6]
+
+    admin = http_request(
+        "POST", f"{base}/auth/token", {"username": args.admin_user, "password": args.admin_password}, form=True
+    )
+    admin_headers = {"Authorization": f"Bearer {admin['access_token']}"}
+
+    roles = http_request("GET", f"{base}/roles/", headers=admin_headers)
+    support_role = next(r for r in roles if r["name"] == "support_agent")
+
+    shops = [
+        http_request("POST", f"{base}/shops/", {"name": f"Bench {run} #{i}", "location": "bench"}, admin_headers)
+        for i in range(args.shops)
+    ]
+
+    agents = []
+    for i in range(args.agents):
+        shop = shops[i % len(shops)]
+        username = f"bench_{run}_{i}"
+        created = http_request(
+            "POST",
+            f"{base}/employees/",
+            {
+                "username": username,
+                "email": f"{username}@bench.example.com",
+                "first_name": "Bench",
+                "last_name": f"Agent {i}",
+                "password": args.agent_password,
+                "shop_id": shop["id"],
+                "role_id": support_role["id"],
+            },
+            admin_headers,
+        )
+        token = http_request(
+            "POST", f"{base}/auth/token", {"username": username, "password": args.agent_password}, form=True
+        )["access_token"]
+        agents.append({"id": created["id"], "shop_id": shop["id"], "token": token, "sessions": [], "watching": []})
+
+    agents_by_shop = defaultdict(list)
+    for agent in agents:
+        agents_by_shop[agent["shop_id"]].append(agent)
+
+    customers = []
+    for i in range(args.customers):
+        shop = shops[i % len(shops)]
+        email = f"bench_{run}_{i}@bench.example.com"
+        session = http_request(
+            "POST",
+            f"{base}/chat/sessions/?customer_email={urllib.parse.quote(email)}&shop_id={shop['id']}",
+        )
+        agent = rng.choice(agents_by_shop[shop["id"]]) if agents_by_shop[shop["id"]] else None
+        if agent:
+            http_request(
+                "PUT",
+                f"{base}/chat/sessions/{session['id']}/assign",
+                headers={"Authorization": f"Bearer {agent['token']}"},
+            )
+            agent["sessions"].append(session["id"])
+        customers.append({"email": email, "session_id": session["id"], "agent_id": agent["id"] if agent else None})
+        others = [a for a in agents_by_shop[shop["id"]] if a is not agent]
+        for watcher in rng.sample(others, min(args.watchers, len(others))):
+            watcher["watching"].append(session["id"])
+
+    return agents, customers
+
+
+async def run_customer(args, customer, stats, stop, ready, seed):
+    import websockets
+
+    rng = random.Random(seed)
+    url = f"{args.ws_url}/chat/ws/customer/{urllib.parse.quote(customer['email'])}"
+    receiver = ("customer", customer["session_id"])
+    seq = 0
+    connected = False
+    try:
+        async with websockets.connect(url) as ws:
+            await ws.send(json.dumps({"type": "session_connect", "session_id": customer["session_id"]}))
+            connected = True
+            ready.release()
+
+            async def reader():
+                async for raw in ws:
+                    data = json.loads(raw)
+                    if data.get("type") == "message":
+                        stats.receive(data.get("message"), receiver)
+                    elif data.get("type") == "ping":
+                        await ws.send(PONG)
+                    elif data.get("type") == "error":
+                        stats.error("server_error_frame")
+
+            read_task = asyncio.create_task(reader())
+            while not stop.is_set():
+                await asyncio.sleep(rng.expovariate(args.rate))
+                if stop.is_set():
+                    break
+                sid = customer["session_id"]
+                if rng.random() < args.typing_ratio:
+                    await ws.send(json.dumps({"type": "typing", "session_id": sid}))
+                    stats.typing_sent += 1
+                seq += 1
+                mid = f"c{sid}-{seq}"
+                target = ("agent", customer["agent_id"]) if customer["agent_id"] else None
+                if target:
+                    stats.track(mid, target)
+                await ws.send(json.dumps({"type": "chat_message", "session_id": sid, "message": make_text(mid, rng)}))
+            await asyncio.sleep(args.drain)
+            read_task.cancel()
+    except Exception as exc:
+        stats.error(f"customer_{type(exc).__name__}")
+        if not connected:
+            ready.release()
+
+
+async def run_agent(args, agent, stats, stop, ready, seed):
+    import websockets
+
+    rng = random.Random(seed)
+    url = f"{args.ws_url}/chat/ws/employee/{agent['id']}"
+    receiver = ("agent", agent["id"])
+    seq = 0
+    connected = False
+    try:
+        async with websockets.connect(url) as ws:
+            # Session traffic only reaches the assignee and subscribers.
+            for sid in agent["sessions"] + agent["watching"]:
+                await ws.send(json.dumps({"type": "subscribe", "session_id": sid}))
+            connected = True
+            ready.release()
+
+            async def reader():
+                async for raw in ws:
+                    data = json.loads(raw)
+                    if data.get("type") == "message":
+                        stats.receive(data.get("message"), receiver)
+                    elif data.get("type") == "ping":
+                        await ws.send(PONG)
+                    elif data.get("type") == "error":
+                        stats.error("server_error_frame")
+
+            read_task = asyncio.create_task(reader())
+            sessions = agent["sessions"]
+            # Agents answer every session they hold at the same per-session rate.
+            rate = args.rate * max(1, len(sessions))
+            while not stop.is_set() and sessions:
+                await asyncio.sleep(rng.expovariate(rate))
+                if stop.is_set():
+                    break
+                sid = rng.choice(sessions)
+                if rng.random() < args.typing_ratio:
+                    await ws.send(json.dumps({"type": "typing", "session_id": sid}))
+                    stats.typing_sent += 1
+                seq += 1
+                mid = f"a{agent['id']}-{seq}"
+                stats.track(mid, ("customer", sid))
+                await ws.send(json.dumps({"type": "chat_message", "session_id": sid, "message": make_text(mid, rng)}))
+            if not sessions:
+                await stop.wait()
+            await asyncio.sleep(args.drain)
+            read_task.cancel()
+    except Exception as exc:
+        stats.error(f"agent_{type(exc).__name__}")
+        if not connected:
+            ready.release()
+
+
+def report(args, stats, elapsed):
+    latencies = sorted(stats.latencies)
+    result = {
+        "customers": args.customers,
+        "agents": args.agents,
+        "shops": args.shops,
+        "watchers": args.watchers,
+        "duration_s": round(elapsed, 2),
+        "messages_sent": stats.sent,
+        "messages_delivered": stats.delivered,
+        "messages_lost": len(stats.pending),
+        "typing_frames_sent": stats.typing_sent,
+        "fanout_frames": stats.fanout_frames,
+        "send_rate_per_s": round(stats.sent / elapsed, 1) if elapsed else 0,
+        "delivery_rate_per_s": round(stats.delivered / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 90, 95, 99)
+        },
+        "latency_max_ms": round(latencies[-1] * 1000, 2) if latencies else 0,
+        "errors": dict(stats.errors),
+        "error_rate": round(sum(stats.errors.values()) / max(1, stats.sent), 4),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return result
+
+    print("=" * 60)
+    print(f"Load: {args.customers} customers, {args.agents} agents, {args.shops} shops, {elapsed:.1f}s")
+    print(f"Sent:       {stats.sent} messages ({result['send_rate_per_s']}/s), {stats.typing_sent} typing frames")
+    print(f"Delivered:  {stats.delivered} ({result['delivery_rate_per_s']}/s), lost {len(stats.pending)}")
+    print(f"Fan-out:    {stats.fanout_frames} extra frames to watchers and other non-target sockets")
+    print("Latency:    " + "  ".join(f"{k}={v}ms" for k, v in result["latency_ms"].items())
+          + f"  max={result['latency_max_ms']}ms")
+    print(f"Errors:     {dict(stats.errors) or 'none'} (rate {result['error_rate']})")
+    print("=" * 60)
+    return result
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    print(f"Setting up {args.shops} shops, {args.agents} agents, {args.customers} customers...")
+    loop = asyncio.get_running_loop()
+    agents, customers = await loop.run_in_executor(None, setup, args, rng)
+
+    stats = Stats()
+    stop = asyncio.Event()
+    ready = asyncio.Semaphore(0)
+    tasks = [
+        asyncio.create_task(run_agent(args, a, stats, stop, ready, rng.random())) for a in agents
+    ] + [
+        asyncio.create_task(run_customer(args, c, stats, stop, ready, rng.random())) for c in customers
+    ]
+    for _ in tasks:
+        await ready.acquire()
+
+    print(f"All sockets connected; running for {args.duration}s...")
+    start = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return report(args, stats, elapsed)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Resolvify WebSocket load benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--ws-url", default=None, help="defaults to base-url with ws:// scheme")
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--shops", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--rate", type=float, default=0.2, help="messages per second per session participant")
+    parser.add_argument("--watchers", type=int, default=0, help="other agents subscribed to each session")
+    parser.add_argument("--typing-ratio", type=float, default=0.5, help="chance a message is preceded by typing")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for in-flight deliveries")
+    parser.add_argument("--admin-user", default="admin")
+    parser.add_argument("--admin-password", default="admin123")
+    parser.add_argument("--agent-password", default="bench-pass")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.ws_url is None:
+        args.ws_url = re.sub(r"^http", "ws", args.base_url.rstrip("/"))
+    if args.shops < 1 or args.rate <= 0 or args.watchers < 0:
+        parser.error("--shops must be >= 1, --rate must be > 0 and --watchers must be >= 0")
+    return args
+
+
+if __name__ == "__main__":
+    result = asyncio.run(run(parse_args()))
+    sys.exit(1 if result["errors"] else 0)
@@ -0,0 +1,358 @@
+"""
+High-volume synthetic data generator for query-plan, pagination and load work.
+
+Generates shops, employees, customers, chat sessions and chat messages with a
+reproducible random seed and loads them with COPY (PostgreSQL) or batched
+multi-row INSERTs on other databases. All employees share one precomputed
+password hash, so bcrypt runs once instead of once per row.
+
+Usage (from backend/):
+    python -m scripts.seed_bulk --shops 2000 --employees 20000 \\
+        --customers 50000 --sessions 500000 --messages 20000000
+
+Rows are appended after the current max id of each table, so the script can be
+run on top of scripts.seed data and repeated to grow the dataset.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app import models
+from app.database import SessionLocal, engine
+from app.services.auth import hash_password
+from app.services.permissions import create_default_permissions, create_default_roles
+
+CITIES = (
+    "Agartala", "Udaipur", "Dharmanagar", "Kailashahar", "Belonia", "Guwahati", "Shillong",
+    "Kolkata", "Siliguri", "Imphal", "Aizawl", "Kohima", "Silchar", "Tezpur", "Jorhat",
+)
+FIRST_NAMES = (
+    "Aarav", "Ananya", "Vikram", "Sneha", "Rohan", "Priya", "Arjun", "Kavya", "Ishaan", "Meera",
+    "Rahul", "Diya", "Karan", "Neha", "Aditya", "Pooja", "Siddharth", "Riya", "Manish", "Tanvi",
+)
+LAST_NAMES = (
+    "Bardhan", "Verma", "Mehta", "Patel", "Reddy", "Sharma", "Das", "Debbarma", "Roy", "Singh",
+    "Chakraborty", "Nath", "Saha", "Ghosh", "Iyer", "Nair", "Kapoor", "Malhotra", "Gupta", "Bose",
+)
+CUSTOMER_LINES = (
+    "Hi, I need help with my order", "When will my delivery arrive?", "I was charged twice",
+    "Can I exchange this item?", "The product stopped working after a week",
+    "How do I reset my account password?", "Is this available at the {city} branch?",
+    "I want to cancel my order", "Please share the invoice for order #{n}", "Thanks for the help!",
+)
+AGENT_LINES = (
+    "Happy to help! Could you share your order number?", "Let me check that for you.",
+    "I have raised a refund request, it should reflect in 5-7 days.",
+    "Yes, the {city} branch has it in stock.", "I have sent the invoice to your email.",
+    "Is there anything else I can help you with?", "Sorry for the inconvenience caused.",
+    "Your replacement has been scheduled.", "Could you try logging out and back in?",
+)
+
+CHUNK_ROWS = 50_000
+
+
+class Loader:
+    """Streams rows into a table in chunks, via COPY on PostgreSQL."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.is_postgres = conn.dialect.name == "postgresql"
+
+    def load(self, table, columns, rows):
+        total = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_ROWS:
+                self._flush(table, columns, chunk)
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            self._flush(table, columns, chunk)
+            total += len(chunk)
+        return total
+
+    def _flush(self, table, columns, chunk):
+        if self.is_postgres:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for row in chunk:
+                writer.writerow(["" if v is None else v for v in row])
+            buf.seek(0)
+            cursor = self.conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+                    buf,
+                )
+            finally:
+                cursor.close()
+        else:
+            placeholders = ", ".join(f":{c}" for c in columns)
+            self.conn.execute(
+                text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"),
+                [dict(zip(columns, row)) for row in chunk],
+            )
+
+    def next_id(self, table):
+        return (self.conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar() or 0) + 1
+
+    def reset_sequence(self, table):
+        if self.is_postgres:
+            self.conn.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+                )
+            )
+
+
+def ts(dt):
+    return dt.isoformat(sep=" ")
+
+
+def progress(label, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    print(f"  {label:<10} {count:>12,} rows in {elapsed:7.1f}s ({rate:,.0f} rows/s)")
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    start = now - timedelta(days=args.days)
+    span = int((now - start).total_seconds())
+
+    db = SessionLocal()
+    try:
+        create_default_permissions(db)
+        create_default_roles(db)
+        roles = {r.name: r.id for r in db.query(models.Role).all()}
+    finally:
+        db.close()
+
+    password_hash = hash_password(args.password)
+
+    with engine.begin() as conn:
+        loader = Loader(conn)
+        first_shop = loader.next_id("shops")
+        first_employee = loader.next_id("employees")
+        first_customer = loader.next_id("customers")
+        first_session = loader.next_id("chat_sessions")
+        first_message = loader.next_id("chat_messages")
+
+        shop_ids = list(range(first_shop, first_shop + args.shops))
+        print(f"Generating into {conn.dialect.name} (seed={args.seed})...")
+
+        started = time.perf_counter()
+        count = loader.load(
+            "shops",
+            ("id", "name", "location", "created_at"),
+            (
+                (
+                    sid,
+                    f"{rng.choice(CITIES)} Branch {sid}",
+                    f"{rng.randint(1, 400)} Market Road, {rng.choice(CITIES)}",
+                    ts(start + timedelta(seconds=rng.randrange(span))),
+                )
+                for sid in shop_ids
+            ),
+        )
+        progress("shops", count, started)
+
+        # One manager per shop, the rest are support agents spread evenly.
+        agents_by_shop = {sid: [] for sid in shop_ids}
+
+        def employee_rows():
+            for offset in range(args.employees):
+                eid = first_employee + offset
+                shop_id = shop_ids[offset % len(shop_ids)]
+                is_manager = offset < len(shop_ids)
+                if not is_manager:
+                    agents_by_shop[shop_id].append(eid)
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                yield (
+                    eid,
+                    f"bulk{eid}",
+                    f"bulk{eid}@resolvify.example.com",
+                    first,
+                    last,
+                    password_hash,
+                    True,
+                    shop_id,
+                    roles["manager"] if is_manager else roles["support_agent"],
+                    ts(start),
+                )
+
+        started = time.perf_counter()
+        count = loader.load(
+            "employees",
+            ("id", "username", "email", "first_name", "last_name", "hashed_password",
+             "is_active", "shop_id", "role_id", "created_at"),
+            employee_rows(),
+        )
+        progress("employees", count, started)
+
+        started = time.perf_counter()
+        count = loader.load(
+            "customers",
+            ("id", "name", "email", "created_at"),
+            (
+                (
+                    cid,
+                    f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    f"bulk.customer{cid}@example.com",
+                    ts(start + timedelta(seconds=rng.randrange(span))),
+                )
+                for cid in range(first_customer, first_customer + args.customers)
+            ),
+        )
+        progress("customers", count, started)
+
+        # Sessions and messages are generated together so message timestamps
+        # fall inside their session, agent messages name the assignee and the
+        # session summary columns (see models.ChatSession) match the messages.
+        pending_messages = []
+        messages_left = args.messages
+        sessions_left = args.sessions
+        message_id = first_message
+
+        def session_rows():
+            nonlocal messages_left, sessions_left, message_id
+            for offset in range(args.sessions):
+                sid = first_session + offset
+                shop_id = rng.choice(shop_ids)
+                created = start + timedelta(seconds=rng.randrange(span))
+                roll = rng.random()
+                if roll < args.waiting_ratio:
+                    status, employee_id, closed = "waiting", None, None
+                else:
+                    agents = agents_by_shop[shop_id]
+                    employee_id = rng.choice(agents) if agents else None
+                    if roll < args.waiting_ratio + args.active_ratio:
+                        status, closed = "active", None
+                    else:
+                        status, closed = "closed", created + timedelta(minutes=rng.randint(2, 90))
+                # Spread the remaining message budget over the remaining sessions.
+                avg = messages_left / sessions_left if sessions_left else 0
+                n_messages = min(messages_left, max(1, int(rng.expovariate(1 / avg)) if avg else 0))
+                messages_left -= n_messages
+                sessions_left -= 1
+
+                window = int(((closed or now) - created).total_seconds()) or 1
+                offsets = sorted(rng.randrange(window) for _ in range(n_messages))
+                first_reply = last_customer = last_agent = None
+                line = None
+                for i, moment in enumerate(created + timedelta(seconds=o) for o in offsets):
+                    from_customer = i == 0 or employee_id is None or rng.random() < 0.5
+                    line = rng.choice(CUSTOMER_LINES if from_customer else AGENT_LINES)
+                    line = line.format(city=rng.choice(CITIES), n=rng.randint(10000, 99999))
+                    if from_customer:
+                        last_customer = i
+                    else:
+                        last_agent = i
+                        first_reply = first_reply or moment
+                    pending_messages.append((
+                        message_id,
+                        sid,
+                        None if from_customer else employee_id,
+                        line,
+                        from_customer,
+                        ts(moment),
+                    ))
+                    message_id += 1
+
+                # Picked up before the first reply (or at any point if none).
+                assigned = None
+                if employee_id is not None:
+                    latest = int(((first_reply or closed or now) - created).total_seconds())
+                    assigned = created + timedelta(seconds=rng.randrange(latest) if latest > 0 else 0)
+                # Open sessions leave the other side's trailing messages unread.
+                customer_unread = agent_unread = 0
+                if status != "closed" and n_messages:
+                    customer_unread = n_messages - 1 - last_customer
+                    agent_unread = n_messages - 1 - last_agent if last_agent is not None else n_messages
+                last_message = created + timedelta(seconds=offsets[-1]) if offsets else None
+                yield (
+                    sid,
+                    first_customer + rng.randrange(args.customers),
+                    shop_id,
+                    employee_id,
+                    status,
+                    ts(created),
+                    ts(closed) if closed else None,
+                    ts(assigned) if assigned else None,
+                    ts(last_message) if last_message else None,
+                    line[:200] if line else None,
+                    n_messages,
+                    customer_unread,
+                    agent_unread,
+                    ts(first_reply) if first_reply else None,
+                )
+
+        def message_rows():
+            yield from pending_messages
+            pending_messages.clear()
+
+        session_columns = (
+            "id", "customer_id", "shop_id", "employee_id", "status", "created_at", "closed_at", "assigned_at",
+            "last_message_at", "last_message_preview", "message_count", "customer_unread", "agent_unread",
+            "first_response_at",
+        )
+        message_columns = ("id", "session_id", "employee_id", "message", "is_from_customer", "created_at")
+
+        started = time.perf_counter()
+        session_count = message_count = 0
+        # Interleave batches so the pending session list stays bounded.
+        batch = max(1, CHUNK_ROWS // 10)
+        rows = session_rows()
+        while True:
+            chunk = [row for _, row in zip(range(batch), rows)]
+            if not chunk:
+                break
+            session_count += loader.load("chat_sessions", session_columns, chunk)
+            message_count += loader.load("chat_messages", message_columns, message_rows())
+        progress("sessions", session_count, started)
+        progress("messages", message_count, started)
+
+        for table in ("shops", "employees", "customers", "chat_sessions", "chat_messages"):
+            loader.reset_sequence(table)
+
+    if args.analyze and engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE"))
+
+    print(f"Done. Bulk employees log in as bulk<id> / {args.password}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk synthetic data generator")
+    parser.add_argument("--shops", type=int, default=1000)
+    parser.add_argument("--employees", type=int, default=10000)
+    parser.add_argument("--customers", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=180, help="spread timestamps over this many days")
+    parser.add_argument("--waiting-ratio", type=float, default=0.02)
+    parser.add_argument("--active-ratio", type=float, default=0.05)
+    parser.add_argument("--password", default="bulk123", help="password shared by all generated employees")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-analyze", dest="analyze", action="store_false")
+    args = parser.parse_args(argv)
+    if min(args.shops, args.customers, args.sessions) < 1 or args.employees < args.shops:
+        parser.error("need at least one shop, customer and session, and one employee per shop")
+    return args
+
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=engine)
+    generate(parse_args())
@@ -0,0 +1,39 @@
+"""
+Apply the PostgreSQL schema additions (app.services.schema) — run once per
+release, from one place, before new app nodes start (e.g. as the platform's
+pre-deploy/release command). Adding the generated search column rewrites
+chat_messages under an exclusive lock, so this is kept out of app startup.
+
+Usage (from backend/):
+    python -m scripts.upgrade_schema
+    python -m scripts.upgrade_schema --backfill-sessions   # once, after upgrading
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import models
+from app.database import engine
+from app.services.schema import backfill_session_summaries, upgrade_schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply PostgreSQL schema additions")
+    parser.add_argument("--backfill-sessions", action="store_true",
+                        help="recompute chat session summary columns from chat_messages")
+    parser.add_argument("--batch-size", type=int, default=10000,
+                        help="sessions per committed batch when backfilling")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(name)s - %(message)s")
+    models.Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    if args.backfill_sessions:
+        backfill_session_summaries(engine, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+# Point the app at a throwaway SQLite database before anything imports it.
+_db_dir = tempfile.mkdtemp(prefix="resolvify-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_dir}/test.db")
+os.environ.setdefault("SCHEMA_AUTO_UPGRADE", "false")
+os.environ.setdefault("WATCHDOG_ENABLED", "false")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models
+from app.database import SessionLocal
+from app.main import app
+from app.services.auth import hash_password
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db(client):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_employee(client, db):
+    """Create an employee with ``role`` in a new shop; returns (employee, auth headers)."""
+    counter = iter(range(1, 1_000_000))
+
+    def _make(role: str, shop=None):
+        n = next(counter)
+        shop = shop or models.Shop(name=f"Shop {role} {n} {id(db)}")
+        if shop.id is None:
+            db.add(shop)
+            db.commit()
+        username = f"{role}{n}_{shop.id}"
+        role_id = db.query(models.Role.id).filter(models.Role.name == role).scalar()
+        employee = models.Employee(
+            username=username,
+            email=f"{username}@example.com",
+            first_name=role,
+            last_name=str(n),
+            hashed_password=hash_password("pw"),
+            role_id=role_id,
+            shop_id=shop.id,
+        )
+        db.add(employee)
+        db.commit()
+        token = client.post("/auth/token", data={"username": username, "password": "pw"}).json()["access_token"]
+        return employee, {"Authorization": f"Bearer {token}"}
+
+    return _make
@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.routers.chat import manager
+from app.services.chat import Connection
+from app.services.serialization import unpack_envelope
+from app.services.affinity import HashRing, affinity
+
+
+def test_rehome_hints_agents_but_not_admins(monkeypatch):
+    monkeypatch.setattr(affinity, "self_url", "http://node-a")
+    monkeypatch.setattr(affinity, "mode", "hint")
+    monkeypatch.setattr(affinity, "ring", HashRing(["http://node-b"], affinity.vnodes))
+    sent = []
+
+    async def fake_send(conn, content, channel, published_at=None):
+        sent.append(conn.principal)
+        return True
+
+    monkeypatch.setattr(manager, "_send", fake_send)
+    conns = [
+        Connection(-1, SimpleNamespace(state=SimpleNamespace()), "employee", 9001, shop_id=7),
+        Connection(-2, SimpleNamespace(state=SimpleNamespace()), "employee", 9002, shop_id=7, is_admin=True),
+    ]
+    for conn in conns:
+        manager.register(conn)
+    try:
+        asyncio.run(manager.rehome())
+    finally:
+        for conn in conns:
+            manager.unregister(conn)
+    assert sent == [9001]
+
+
+class RecordingBus:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, data):
+        self.published.append(unpack_envelope(data)[0])
+
+    def retain(self, channels):
+        pass
+
+    def release(self, channels):
+        pass
+
+
+def test_owned_shop_events_skip_redis(monkeypatch):
+    monkeypatch.setattr(affinity, "self_url", "http://node-a")
+    monkeypatch.setattr(affinity, "mode", "redirect")
+    monkeypatch.setattr(affinity, "ring", HashRing(["http://node-a"], affinity.vnodes))
+    bus = RecordingBus()
+    monkeypatch.setattr(manager, "bus", bus)
+    monkeypatch.setattr(manager, "use_redis", True)
+    monkeypatch.setattr(manager, "_admin_nodes", {})
+    sent = []
+
+    async def fake_send(conn, content, channel, published_at=None):
+        sent.append(conn.principal)
+        return True
+
+    monkeypatch.setattr(manager, "_send", fake_send)
+    agent = Connection(-3, SimpleNamespace(state=SimpleNamespace()), "employee", 9003, shop_id=7)
+    manager.register(agent)
+    try:
+        asyncio.run(manager.send_to_session_staff("{}", 123, employee_id=9003, shop_id=7))
+        asyncio.run(manager.broadcast_to_shop_employees("{}", 7, event_type="new_session"))
+        assert sent == [9003, 9003]
+        assert bus.published == []
+
+        # Once another node holds an admin socket, only the admin copy is published.
+        manager._on_admin_presence({"origin": "node-b", "admins": True})
+        asyncio.run(manager.broadcast_to_shop_employees("{}", 7, event_type="new_session"))
+        assert sent == [9003, 9003, 9003]
+        assert [header["admins_only"] for header in bus.published] == [True]
+    finally:
+        manager.unregister(agent)
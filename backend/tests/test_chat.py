@@ -0,0 +1,24 @@
+from app import crud, models
+
+
+def _session_in(db, shop_id, email):
+    customer = models.Customer(name="Chat customer", email=email)
+    db.add(customer)
+    db.commit()
+    return crud.create_chat_session(db, customer.id, shop_id)
+
+
+def test_agents_send_only_into_open_sessions_of_their_shop(client, db, make_employee):
+    agent, headers = make_employee("support_agent")
+    other, _ = make_employee("support_agent")
+    own = _session_in(db, agent.shop_id, f"own{agent.id}@example.com")
+    foreign = _session_in(db, other.shop_id, f"foreign{agent.id}@example.com")
+
+    def send(session_id):
+        return client.post(f"/chat/sessions/{session_id}/messages", headers=headers, json={"message": "hi"})
+
+    assert send(own.id).status_code == 201
+    assert send(foreign.id).status_code == 403
+    crud.close_chat_session(db, own.id)
+    assert send(own.id).status_code == 409
+    assert send(10**9).status_code == 404
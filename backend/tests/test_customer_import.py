@@ -0,0 +1,68 @@
+import uuid
+
+from app import models
+from app.config import settings
+
+
+def _import(client, headers, text, **params):
+    return client.post(
+        "/customers/import",
+        headers=headers,
+        params=params,
+        files={"file": ("customers.csv", text.encode("utf-8"), "text/csv")},
+    )
+
+
+def _names(db, emails):
+    db.expire_all()
+    rows = db.query(models.Customer.email, models.Customer.name).filter(models.Customer.email.in_(emails))
+    return dict(rows)
+
+
+def test_import_merges_duplicates_and_existing_rows(client, db, make_employee):
+    _, headers = make_employee("admin")
+    domain = f"{uuid.uuid4().hex[:8]}.example.com"
+    a, b, c = (f"{n}@{domain}" for n in "abc")
+    db.add_all([models.Customer(name="Old A", email=a), models.Customer(name="Same B", email=b)])
+    db.commit()
+
+    csv_text = (
+        "name,email\n"
+        f"New A,{a}\n"
+        f"Same B,{b}\n"
+        f"First C,{c}\n"
+        "No Email,\n"
+        f"Last C,{c.replace(domain, domain.upper())}\n"
+    )
+    response = _import(client, headers, csv_text)
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (1, 1, 2)
+    assert report["errors"] == [{"line": 5, "error": "email is required"}]
+    assert _names(db, [a, b, c]) == {a: "New A", b: "Same B", c: "Last C"}
+
+    response = _import(client, headers, f"name,email\nNewer A,{a}\nD,d@{domain}\n", update_existing="false")
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (1, 0, 1)
+    assert _names(db, [a])[a] == "New A"
+
+
+def test_import_duplicate_across_batches(client, db, make_employee, monkeypatch):
+    monkeypatch.setattr(settings, "import_batch_size", 2)
+    _, headers = make_employee("admin")
+    email = f"dup@{uuid.uuid4().hex[:8]}.example.com"
+    ndjson = "\n".join(f'{{"name": "Name {n}", "email": "{email}"}}' for n in range(5))
+    response = client.post(
+        "/customers/import",
+        headers=headers,
+        files={"file": ("customers.ndjson", ndjson.encode("utf-8"), "application/x-ndjson")},
+    )
+    report = response.json()
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (1, 2, 2)
+    assert _names(db, [email])[email] == "Name 4"
+
+
+def test_import_requires_update_permission(client, make_employee):
+    _, headers = make_employee("support_agent")
+    response = _import(client, headers, "name,email\nX,x@example.com\n", update_existing="false")
+    assert response.status_code == 403
@@ -0,0 +1,19 @@
+import time
+
+import pytest
+
+from app.config import settings
+from app.services import metrics
+
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("untyped_total", "A metric without render")
+
+
+def test_event_loop_lag_is_sampled_without_the_watchdog(client):
+    assert not settings.watchdog_enabled
+    before = metrics.event_loop_lag_histogram.count()
+    time.sleep(settings.event_loop_lag_interval * 3)
+    assert metrics.event_loop_lag_histogram.count() > before
+    assert "event_loop_lag_distribution_seconds_count" in client.get("/metrics").text
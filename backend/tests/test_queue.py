@@ -0,0 +1,29 @@
+from app.services.queue import WaitingQueue
+
+
+def _local_queue():
+    queue = WaitingQueue(rate_window=900, eta_min_samples=1, reconcile_interval=300)
+    queue._redis_checked = True  # no Redis: exercise the in-memory queues
+    return queue
+
+
+def test_reconcile_drops_sessions_no_longer_waiting_and_adds_missing_ones():
+    queue = _local_queue()
+    for session_id in (1, 2, 3):
+        queue.enqueue(7, session_id)
+
+    # 2 was assigned without its dequeue landing; 4 was created without its enqueue.
+    queue.reconcile(lambda: [(7, 1), (7, 3), (7, 4)])
+
+    assert [(queue.position(7, sid)["position"], queue.position(7, sid)["waiting"]) for sid in (1, 3, 4)] == [
+        (1, 3), (2, 3), (3, 3),
+    ]
+
+
+def test_dequeue_of_a_session_not_in_the_queue_is_not_served():
+    queue = _local_queue()
+    queue.enqueue(7, 1)
+    queue.dequeue(7, 2, served=True)
+    assert queue.eta_seconds(7, 1) is None
+    queue.dequeue(7, 1, served=True)
+    assert queue.eta_seconds(7, 1) == 900
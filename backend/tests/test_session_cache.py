@@ -0,0 +1,56 @@
+import itertools
+
+from app import crud, models, schemas
+from app.services.session_cache import session_cache
+
+_customers = itertools.count(1)
+
+
+def _new_session(db):
+    shop = models.Shop(name="Cache shop")
+    customer = models.Customer(name="Cache customer", email=f"cache{next(_customers)}@example.com")
+    db.add_all([shop, customer])
+    db.commit()
+    return crud.create_chat_session(db, customer.id, shop.id)
+
+
+def _send(db, session_id, text):
+    return crud.create_chat_message(
+        db, schemas.ChatMessageCreate(session_id=session_id, message=text, is_from_customer=True)
+    )
+
+
+def test_fill_older_than_an_append_is_not_stored(db):
+    session = _new_session(db)
+    _send(db, session.id, "first")
+    token = session_cache.fill_token()
+    snapshot = crud.get_session_messages(db, session.id)
+
+    # Lands between the fill's read and its store; there is no entry to patch.
+    _send(db, session.id, "second")
+    session_cache.fill(session, snapshot, token)
+    assert session_cache.get(session.id) is None
+
+    session_cache.fill(session, crud.get_session_messages(db, session.id), session_cache.fill_token())
+    assert [m["message"] for m in session_cache.get(session.id).messages] == ["first", "second"]
+
+
+def test_append_keeps_size_in_step_with_the_entry(db):
+    session = _new_session(db)
+    session_cache.fill(session, [], session_cache.fill_token())
+    for n in range(session_cache.tail + 3):
+        _send(db, session.id, f"message {n} ünïcode")
+    crud.close_chat_session(db, session.id)
+    entry = session_cache.get(session.id)
+    assert entry.session["status"] == "closed"
+    assert len(entry.messages) == session_cache.tail
+    assert entry.size == len(entry.to_json())
+
+
+def test_get_returns_a_copy_that_later_writes_leave_alone(db):
+    session = _new_session(db)
+    session_cache.fill(session, [], session_cache.fill_token())
+    entry = session_cache.get(session.id)
+    _send(db, session.id, "after")
+    assert entry.messages == [] and entry.session.get("message_count") == 0
+    assert [m["message"] for m in session_cache.get(session.id).messages] == ["after"]
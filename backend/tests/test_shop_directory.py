@@ -0,0 +1,13 @@
+from app import models
+from app.services.shop_directory import shop_directory
+
+
+def test_directory_lists_every_shop(client, db):
+    db.add_all(models.Shop(name=f"Directory shop {n}") for n in range(101))
+    db.commit()
+    shop_directory.invalidate()
+
+    response = client.get("/chat/shops/")
+    assert response.status_code == 200
+    ids = [shop["id"] for shop in response.json()]
+    assert ids == sorted(ids) and len(ids) == db.query(models.Shop).count() > 100
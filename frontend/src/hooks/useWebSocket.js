@@ -1,8 +1,21 @@
 import { useRef, useEffect, useCallback } from 'react'
 
+// Id for a chat_message frame, so the server can drop resends of it.
+export function newClientMsgId() {
+  return crypto.randomUUID?.() ?? `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+}
+
 export function useWebSocket(url, { onMessage, onOpen, onClose, enabled = true }) {
   const wsRef = useRef(null)
   const reconnectTimer = useRef(null)
+  // Node that owns this connection's shop, as announced by the server.
+  const nodeRef = useRef(null)
+  const redirectRef = useRef(false)
+  // Reconnect delay: server hint when draining, else jittered exponential backoff.
+  const retryAfterRef = useRef(null)
+  const attemptsRef = useRef(0)
+  // chat_message frames not yet acked, resent after every reconnect.
+  const pendingRef = useRef(new Map())
 
   const onMessageRef = useRef(onMessage)
   const onOpenRef = useRef(onOpen)
@@ -22,18 +35,34 @@ export function useWebSocket(url, { onMessage, onOpen, onClose, enabled = true }
       ? `${window.location.hostname}:8000`
       : window.location.host
     
-    const base = import.meta.env.VITE_WS_URL || `${protocol}//${defaultHost}`
+    const base = nodeRef.current || import.meta.env.VITE_WS_URL || `${protocol}//${defaultHost}`
     const fullUrl = `${base}${url}`
 
     const ws = new WebSocket(fullUrl)
 
     ws.onopen = () => {
+      attemptsRef.current = 0
+      for (const frame of pendingRef.current.values()) {
+        ws.send(JSON.stringify(frame))
+      }
       onOpenRef.current?.()
     }
     
     ws.onclose = () => {
       onCloseRef.current?.()
-      reconnectTimer.current = setTimeout(connect, 3000)
+      let delay
+      if (redirectRef.current) {
+        delay = 0
+      } else if (retryAfterRef.current != null) {
+        delay = retryAfterRef.current
+      } else {
+        const ceiling = Math.min(30000, 1000 * 2 ** attemptsRef.current)
+        delay = ceiling / 2 + Math.random() * (ceiling / 2)
+        attemptsRef.current += 1
+      }
+      redirectRef.current = false
+      retryAfterRef.current = null
+      reconnectTimer.current = setTimeout(connect, delay)
     }
 
     ws.onerror = (err) => {
@@ -42,11 +71,38 @@ export function useWebSocket(url, { onMessage, onOpen, onClose, enabled = true }
     }
 
     ws.onmessage = (event) => {
+      let data
       try {
-        onMessageRef.current?.(JSON.parse(event.data))
+        data = JSON.parse(event.data)
       } catch {
         onMessageRef.current?.(event.data)
+        return
+      }
+      // Server heartbeat: answer so the connection isn't reaped as idle.
+      if (data?.type === 'ping') {
+        ws.send(JSON.stringify({ type: 'pong' }))
+        return
       }
+      // Shop affinity: reconnect to the owning node now, or on the next reconnect.
+      if (data?.type === 'redirect' || data?.type === 'affinity') {
+        nodeRef.current = data.node
+        redirectRef.current = data.type === 'redirect'
+        return
+      }
+      if (data?.type === 'message_ack') {
+        pendingRef.current.delete(data.client_msg_id)
+        return
+      }
+      // Rejected sends carry their client_msg_id; retrying them cannot succeed.
+      if (data?.type === 'error' && data.client_msg_id) {
+        pendingRef.current.delete(data.client_msg_id)
+      }
+      // Node is draining for a deploy: come back after the suggested delay.
+      if (data?.type === 'reconnect') {
+        retryAfterRef.current = data.retry_after_ms
+        return
+      }
+      onMessageRef.current?.(data)
     }
 
     wsRef.current = ws
@@ -61,6 +117,9 @@ export function useWebSocket(url, { onMessage, onOpen, onClose, enabled = true }
   }, [connect])
 
   const send = useCallback((data) => {
+    if (data?.type === 'chat_message' && data.client_msg_id) {
+      pendingRef.current.set(data.client_msg_id, data)
+    }
     if (wsRef.current?.readyState === WebSocket.OPEN) {
       wsRef.current.send(typeof data === 'string' ? data : JSON.stringify(data))
     }
@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from 'react'
-import { useWebSocket } from '../hooks/useWebSocket'
+import { newClientMsgId, useWebSocket } from '../hooks/useWebSocket'
 import { useTheme } from '../hooks/useTheme'
 import api from '../api/client'
 import Input from '../components/ui/Input'
@@ -31,6 +31,7 @@ export default function CustomerChat() {
   const [messages, setMessages] = useState([])
   const [agentTyping, setAgentTyping] = useState(false)
   const [agentName, setAgentName] = useState('Support Agent')
+  const [queueInfo, setQueueInfo] = useState(null)
   
   const [loadingShops, setLoadingShops] = useState(true)
   const [connecting, setConnecting] = useState(false)
@@ -105,7 +106,7 @@ export default function CustomerChat() {
   }, [messages, agentTyping])
 
   // 3. WebSocket connection setup
-  const { send } = useWebSocket(email ? `/chat/ws/customer/${encodeURIComponent(email)}` : null, {
+  const { send } = useWebSocket(email ? `/chat/ws/customer/${encodeURIComponent(email)}?shop_id=${selectedShop}` : null, {
     enabled: !!email && !!session,
     onOpen: () => {
       setConnected(true)
@@ -124,7 +125,8 @@ export default function CustomerChat() {
             (m) =>
               m.message === data.message &&
               m.is_from_customer === (data.from === 'customer') &&
-              (m.id === data.id || Math.abs(new Date(m.created_at) - new Date(data.timestamp || new Date())) < 2000)
+              ((data.client_msg_id && m.client_msg_id === data.client_msg_id) ||
+                m.id === data.id || Math.abs(new Date(m.created_at) - new Date(data.timestamp || new Date())) < 2000)
           )
           if (isDup) return prev
 
@@ -139,7 +141,10 @@ export default function CustomerChat() {
             },
           ]
         })
+      } else if (data.type === 'queue_position') {
+        setQueueInfo(data)
       } else if (data.type === 'agent_assigned') {
+        setQueueInfo(null)
         setAgentName(data.agent_name || 'Support Agent')
         setMessages((prev) => [
           ...prev,
@@ -158,6 +163,7 @@ export default function CustomerChat() {
       } else if (data.type === 'stop_typing') {
         setAgentTyping(false)
       } else if (data.type === 'session_closed') {
+        setQueueInfo(null)
         setConnected(false)
         setSession(null)
         localStorage.removeItem(SESSION_STORAGE_KEY)
@@ -224,16 +230,19 @@ export default function CustomerChat() {
   const handleSendMessage = (text) => {
     if (!session) return
     const timestamp = new Date().toISOString()
+    const clientMsgId = newClientMsgId()
     send({
       type: 'chat_message',
       session_id: session.id,
       message: text,
       timestamp,
+      client_msg_id: clientMsgId,
     })
     setMessages((prev) => [
       ...prev,
       {
         id: Date.now(),
+        client_msg_id: clientMsgId,
         message: text,
         is_from_customer: true,
         created_at: timestamp,
@@ -379,6 +388,12 @@ export default function CustomerChat() {
                 </span>
               </div>
               <div className="flex items-center gap-3">
+                {queueInfo && (
+                  <Badge color="yellow">
+                    #{queueInfo.position} in queue
+                    {queueInfo.eta_seconds != null && ` · ~${Math.max(1, Math.round(queueInfo.eta_seconds / 60))} min`}
+                  </Badge>
+                )}
                 <span className="bg-[hsl(var(--surface))] px-2.5 py-1 rounded-md border border-[hsl(var(--border))] font-mono text-[11px]">
                   Session #{session.id}
                 </span>
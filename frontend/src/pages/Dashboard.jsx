@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from 'react'
 import { useAuth } from '../hooks/useAuth'
-import { useWebSocket } from '../hooks/useWebSocket'
+import { newClientMsgId, useWebSocket } from '../hooks/useWebSocket'
 import Navbar from '../components/Navbar'
 import SessionList from '../components/chat/SessionList'
 import ChatWindow from '../components/chat/ChatWindow'
@@ -15,6 +15,7 @@ export default function Dashboard() {
   const [currentSession, setCurrentSession] = useState(null)
   const [messages, setMessages] = useState([])
   const [customerTyping, setCustomerTyping] = useState(false)
+  const [wsGeneration, setWsGeneration] = useState(0)
   const typingTimeoutRef = useRef(null)
 
   // Fetch all sessions
@@ -60,6 +61,7 @@ export default function Dashboard() {
   // Setup WebSocket connection
   const { send } = useWebSocket(`/chat/ws/employee/${employee?.id}`, {
     enabled: !!employee?.id,
+    onOpen: () => setWsGeneration((g) => g + 1),
     onMessage: (data) => {
       if (data.type === 'new_session') {
         fetchSessions()
@@ -71,7 +73,8 @@ export default function Dashboard() {
               (m) =>
                 m.message === data.message &&
                 m.is_from_customer === (data.from === 'customer') &&
-                (m.id === data.id || Math.abs(new Date(m.created_at) - new Date(data.timestamp || new Date())) < 2000)
+                ((data.client_msg_id && m.client_msg_id === data.client_msg_id) ||
+                  m.id === data.id || Math.abs(new Date(m.created_at) - new Date(data.timestamp || new Date())) < 2000)
             )
             if (isDup) return prev
 
@@ -110,6 +113,15 @@ export default function Dashboard() {
     },
   })
 
+  // Live messages and typing for a session only reach agents subscribed to
+  // it, so (re)subscribe whenever the open session or the socket changes.
+  useEffect(() => {
+    if (!currentSession?.id || !wsGeneration) return
+    const sessionId = currentSession.id
+    send({ type: 'subscribe', session_id: sessionId })
+    return () => send({ type: 'unsubscribe', session_id: sessionId })
+  }, [currentSession?.id, wsGeneration, send])
+
   const showNotification = (text) => {
     if (Notification.permission === 'granted') {
       new Notification('Resolvify', { body: text })
@@ -131,16 +143,19 @@ export default function Dashboard() {
   const handleSendMessage = (text) => {
     if (!currentSession) return
     const timestamp = new Date().toISOString()
+    const clientMsgId = newClientMsgId()
     send({
       type: 'chat_message',
       session_id: currentSession.id,
       message: text,
       timestamp,
+      client_msg_id: clientMsgId,
     })
     setMessages((prev) => [
       ...prev,
       {
         id: Date.now(),
+        client_msg_id: clientMsgId,
         message: text,
         is_from_customer: false,
         created_at: timestamp,
@@ -171,6 +186,7 @@ export default function Dashboard() {
         session_id: sessionId,
         message: welcome,
         timestamp: new Date().toISOString(),
+        client_msg_id: newClientMsgId(),
       })
 
       setMessages((prev) => [